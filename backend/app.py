@@ -1,11 +1,18 @@
+if __name__ == '__main__':
+    # A fila de mensagens do Socket.IO escuta o Redis numa green thread do
+    # eventlet: os sockets precisam ser cooperativos antes de qualquer import
+    import eventlet
+    eventlet.monkey_patch()
+
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from flask_bcrypt import Bcrypt
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO
 from flask_caching import Cache
 from config import config
 from models import db
+from utils.tokens import init_jwt
 import os
 from dotenv import load_dotenv
 
@@ -42,6 +49,10 @@ def create_app(config_name='development'):
         cache.init_app(app)
         print("📝 Usando SimpleCache como fallback")
     
+    # L1 em memória na frente do Redis, com invalidação entre workers e disjuntor
+    from utils.cache_camadas import CacheDuasCamadas
+    cache = CacheDuasCamadas(app, cache)
+    
     # Configurar CORS para Socket.IO
     CORS(app, resources={
         r"/*": {
@@ -59,11 +70,15 @@ def create_app(config_name='development'):
             app.logger.debug(f"Handling {request.method} request from {request.remote_addr} to {request.path}")
             app.logger.debug(f"Origin: {request.headers.get('Origin')}")
 
-    JWTManager(app)
+    jwt = JWTManager(app)
+    init_jwt(jwt)
     Bcrypt(app)
     
-    # Configurar Socket.IO
-    socketio = SocketIO(app, cors_allowed_origins=app.config['CORS_ORIGINS'], 
+    # Configurar Socket.IO (fila Redis para entregar eventos entre workers)
+    from utils.websocket import configurar_fila_mensagens
+    socketio = SocketIO(app, cors_allowed_origins=app.config['CORS_ORIGINS'],
+                       message_queue=configurar_fila_mensagens(app),
+                       channel=app.config['SOCKETIO_CANAL'],
                        logger=False, engineio_logger=False)
     
     # Registrar blueprints
@@ -81,27 +96,38 @@ def create_app(config_name='development'):
     app.register_blueprint(health_bp)
     app.register_blueprint(bi_bp)
     
-    # Configurar eventos Socket.IO
-    @socketio.on('connect')
-    def handle_connect():
-        print(f'Cliente conectado: {request.sid}')
-        emit('connected', {'data': 'Conectado ao servidor de plantões'})
-    
-    @socketio.on('disconnect')
-    def handle_disconnect():
-        print(f'Cliente desconectado: {request.sid}')
-    
-    @socketio.on('join_room')
-    def handle_join_room(data):
-        """Usuário entra em sala específica (ex: sala de plantonistas)"""
-        room = data.get('room', 'general')
-        socketio.join_room(room)
-        print(f'Cliente {request.sid} entrou na sala {room}')
+    # Configurar eventos Socket.IO (conexão autenticada, salas por usuário e por mês)
+    from utils.websocket import registrar_eventos
+    registrar_eventos(socketio)
     
     # Adicionar SocketIO e Cache ao contexto da aplicação
     app.socketio = socketio
     app.cache = cache
     
+    # Deltas de plantões agrupados para o WebSocket
+    from utils.difusor import DifusorPlantoes
+    DifusorPlantoes(app)
+    
+    # Sala de espera das escolhas de plantão
+    from utils.fila_reservas import FilaReservas
+    FilaReservas(app)
+    
+    # Aquecimento do cache antes das janelas de abertura das escolhas
+    from utils.aquecimento import AquecedorCache
+    AquecedorCache(app)
+    
+    # Placar incremental do ranking (edições de pontuação)
+    from utils.placar import PlacarRanking
+    PlacarRanking(app)
+    
+    # Índice de nomes para busca e resolução de usuários por texto
+    from utils.busca_nomes import BuscaNomes
+    BuscaNomes(app)
+    
+    # Buffer do log de auditoria (gravação em lote fora da requisição)
+    from utils.auditoria import AuditoriaLogs
+    AuditoriaLogs(app)
+    
     # Rotas de saúde e info
     @app.route('/')
     def index():
@@ -148,9 +174,10 @@ def create_app(config_name='development'):
         db.create_all()
         
         # Auto-seed: Tenta criar usuário admin. Se não existir, popula tudo.
+        # Em testes as fixtures criam os próprios dados.
         try:
             from models import Usuario
-            if not Usuario.query.filter_by(email='admin@veloce.com').first():
+            if not app.config.get('TESTING') and not Usuario.query.filter_by(email='admin@veloce.com').first():
                 print("⚠️ Banco vazio detectado. Iniciando auto-seed...")
                 from seed_data import populate_db
                 populate_db()
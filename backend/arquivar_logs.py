@@ -0,0 +1,45 @@
+"""
+Arquiva os meses antigos do log de auditoria e prepara as próximas partições
+
+Exporta cada mês anterior à janela LOGS_MESES_ATIVOS para um segmento
+compactado em LOGS_ARQUIVO_DIR e remove a partição do banco. Também
+remove do feed de alterações de plantões as entradas com mais de
+ALTERACOES_RETENCAO_DIAS dias. Deve rodar periodicamente (ex.: cron
+diário); meses já arquivados são ignorados.
+
+Uso:
+    python arquivar_logs.py             # arquiva e cria partições futuras
+    python arquivar_logs.py --meses 6   # mantém 6 meses no banco
+"""
+import sys
+from app import create_app
+from utils.arquivo_logs import garantir_particoes, arquivar_logs
+from utils.alteracoes import limpar_alteracoes
+
+
+def main(meses_ativos=None):
+    app, _ = create_app('development')
+
+    with app.app_context():
+        criadas = garantir_particoes(app.config['LOGS_PARTICOES_FUTURAS'])
+        for nome in criadas:
+            print(f"✅ Partição {nome} criada")
+
+        segmentos = arquivar_logs(meses_ativos)
+        for s in segmentos:
+            print(f"📦 {s['mes'][:7]}: {s['total']} logs → {s['segmento']}")
+
+        if not segmentos:
+            print("✅ Nenhum mês a arquivar")
+
+        removidas = limpar_alteracoes(app.config['ALTERACOES_RETENCAO_DIAS'])
+        if removidas:
+            print(f"🧹 {removidas} alterações antigas removidas do feed de plantões")
+        return 0
+
+
+if __name__ == '__main__':
+    meses = None
+    if '--meses' in sys.argv:
+        meses = int(sys.argv[sys.argv.index('--meses') + 1])
+    sys.exit(main(meses))
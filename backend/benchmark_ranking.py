@@ -0,0 +1,100 @@
+"""
+Mede o cálculo do ranking mensal (CalculadoraPontuacao.calcular_ranking_mes)
+
+Para cada tamanho, cria N plantonistas com pontuação num mês de teste,
+calcula o ranking e mostra o número de comandos SQL e o tempo. O número
+de comandos deve ser o mesmo de 10 a 10.000 plantonistas; o tempo cresce
+só com o trabalho do banco (ordenação e escrita das linhas).
+
+Por padrão roda na configuração de testes (SQLite em memória). Com
+--config production usa o DATABASE_URL; os dados do mês de teste são
+removidos ao final de cada tamanho.
+
+Uso:
+    python benchmark_ranking.py --tamanhos 10,100,1000,10000
+"""
+import argparse
+import random
+import sys
+import time
+import uuid
+from datetime import date
+from sqlalchemy import event, insert
+from app import create_app
+from models import db, Usuario, Plantonista, Pontuacao
+from utils.pontuacao import CalculadoraPontuacao
+
+MES_TESTE = date(2099, 1, 1)
+
+
+def popular(n):
+    """Insere N usuários, plantonistas e pontuações do mês de teste em lote"""
+    usuarios, plantonistas, pontuacoes = [], [], []
+    for i in range(n):
+        usuario_id, plantonista_id = str(uuid.uuid4()), str(uuid.uuid4())
+        usuarios.append({
+            'id': usuario_id, 'nome': f'Benchmark {i}', 'email': f'benchmark-{usuario_id}@test.com',
+            'senha': 'x', 'tipo': 'plantonista'
+        })
+        plantonistas.append({'id': plantonista_id, 'usuario_id': usuario_id, 'ranking': 999})
+        pontuacoes.append({
+            'id': str(uuid.uuid4()), 'plantonista_id': plantonista_id, 'mes_referencia': MES_TESTE,
+            'vendas': random.randint(0, 10), 'age_bairro_foco': random.randint(0, 5),
+            'age_canoas_poa': random.randint(0, 5), 'age_outros': random.randint(0, 5),
+            'placa_bairro_foco': random.randint(0, 8), 'placa_canoas_poa': random.randint(0, 8),
+            'placa_outros': random.randint(0, 8)
+        })
+    db.session.execute(insert(Usuario), usuarios)
+    db.session.execute(insert(Plantonista), plantonistas)
+    db.session.execute(insert(Pontuacao), pontuacoes)
+    db.session.commit()
+    return [u['id'] for u in usuarios]
+
+
+def limpar(usuario_ids):
+    # Sem depender do ON DELETE CASCADE (o SQLite não aplica por padrão)
+    Pontuacao.query.filter_by(mes_referencia=MES_TESTE).delete(synchronize_session=False)
+    Plantonista.query.filter(Plantonista.usuario_id.in_(usuario_ids)).delete(synchronize_session=False)
+    Usuario.query.filter(Usuario.id.in_(usuario_ids)).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def medir(n):
+    usuario_ids = popular(n)
+    comandos = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        comandos.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', registrar)
+    try:
+        inicio = time.perf_counter()
+        ranking = CalculadoraPontuacao().calcular_ranking_mes(MES_TESTE)
+        duracao = (time.perf_counter() - inicio) * 1000
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', registrar)
+
+    assert len(ranking) == n
+    limpar(usuario_ids)
+    return len(comandos), duracao
+
+
+def main(tamanhos, config):
+    app, _ = create_app(config)
+    with app.app_context():
+        db.create_all()
+        print(f"{'plantonistas':>12} | {'comandos SQL':>12} | {'tempo':>10} | {'por plantonista':>15}")
+        for n in tamanhos:
+            comandos, duracao = medir(n)
+            print(f"{n:>12} | {comandos:>12} | {duracao:>7.1f} ms | {duracao * 1000 / n:>12.1f} µs")
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tamanhos', default='10,100,1000,10000', help='números de plantonistas separados por vírgula')
+    parser.add_argument('--config', default='testing', help='configuração do app (testing, development, production)')
+    args = parser.parse_args()
+
+    tamanhos = [int(t) for t in args.tamanhos.split(',') if t.strip()]
+    sys.exit(main(tamanhos, args.config))
@@ -0,0 +1,103 @@
+"""
+Mede a latência de entrega dos eventos Socket.IO com vários workers
+
+Conecta M clientes distribuídos entre as URLs dos workers (autenticados
+com o access token de --token) e publica eventos direto na fila Redis do
+Socket.IO, como um worker faria ao emitir. Cada cliente registra o atraso entre a publicação e o
+recebimento; ao final são mostrados os percentis por worker e no total.
+
+Requer o cliente do Socket.IO: pip install "python-socketio[client]"
+
+Uso:
+    python benchmark_websocket.py --urls http://localhost:5001,http://localhost:5002 \\
+        --token <access_token> --clientes 200 --eventos 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+import socketio
+
+CANAL_PADRAO = 'plantoes-socketio'
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+def conectar(url, token, latencias, lock):
+    cliente = socketio.Client(reconnection=False)
+
+    @cliente.on('benchmark')
+    def receber(dados):
+        atraso = (time.time() - dados['enviado_em']) * 1000
+        with lock:
+            latencias.append(atraso)
+
+    cliente.connect(url, auth={'token': token}, transports=['websocket'], wait_timeout=10)
+    return cliente
+
+
+def resumo(rotulo, latencias, esperado):
+    if not latencias:
+        print(f"  {rotulo}: nenhum evento recebido de {esperado}")
+        return
+    print(
+        f"  {rotulo}: {len(latencias)}/{esperado} entregues | "
+        f"p50 {percentil(latencias, 50):.1f} ms | p95 {percentil(latencias, 95):.1f} ms | "
+        f"p99 {percentil(latencias, 99):.1f} ms | máx {max(latencias):.1f} ms | "
+        f"média {statistics.mean(latencias):.1f} ms"
+    )
+
+
+def main(urls, token, clientes, eventos, intervalo, redis_url, canal):
+    latencias = {url: [] for url in urls}
+    lock = threading.Lock()
+
+    print(f"🔌 Conectando {clientes} clientes em {len(urls)} worker(s)...")
+    conectados = []
+    for i in range(clientes):
+        url = urls[i % len(urls)]
+        conectados.append((url, conectar(url, token, latencias[url], lock)))
+
+    emissor = socketio.RedisManager(redis_url, channel=canal, write_only=True)
+    print(f"📣 Publicando {eventos} eventos em '{canal}'...")
+    for seq in range(eventos):
+        emissor.emit('benchmark', {'seq': seq, 'enviado_em': time.time()}, namespace='/')
+        time.sleep(intervalo)
+
+    # Margem para os últimos eventos chegarem
+    time.sleep(max(1.0, intervalo * 5))
+
+    print("\n📊 Latência de entrega (publicação → cliente)")
+    por_worker = {}
+    for url, _ in conectados:
+        por_worker[url] = por_worker.get(url, 0) + 1
+    for url in urls:
+        resumo(url, latencias[url], por_worker.get(url, 0) * eventos)
+    resumo('total', [l for lista in latencias.values() for l in lista], clientes * eventos)
+
+    for _, cliente in conectados:
+        cliente.disconnect()
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--urls', default='http://localhost:5000',
+                        help='URLs dos workers separadas por vírgula')
+    parser.add_argument('--token', required=True, help='access token de um usuário (POST /api/auth/login)')
+    parser.add_argument('--clientes', type=int, default=100)
+    parser.add_argument('--eventos', type=int, default=20)
+    parser.add_argument('--intervalo', type=float, default=0.1, help='segundos entre eventos')
+    parser.add_argument('--redis', default=os.getenv('SOCKETIO_MESSAGE_QUEUE', os.getenv('REDIS_URL', 'redis://localhost:6379/0')))
+    parser.add_argument('--canal', default=CANAL_PADRAO)
+    args = parser.parse_args()
+
+    urls = [u.strip() for u in args.urls.split(',') if u.strip()]
+    sys.exit(main(urls, args.token, args.clientes, args.eventos, args.intervalo, args.redis, args.canal))
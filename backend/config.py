@@ -39,10 +39,57 @@ class Config:
     PONTOS_PLACA_OUTROS = 0.5
     MAX_PLANTONISTAS_POR_TURNO = 2
     
+    # Sala de espera das escolhas (abertura do dia 25)
+    # Workers ficam abaixo do pool de conexões para não esgotá-lo na abertura
+    FILA_RESERVAS_WORKERS = int(os.getenv('FILA_RESERVAS_WORKERS', 4))
+    FILA_RESERVAS_MAX = 2000          # tickets pendentes antes de recusar com 503
+    FILA_RESERVAS_TICKET_TTL = 600    # segundos que um ticket finalizado fica consultável
+    
+    # Log de auditoria gravado em lote por um worker (utils/auditoria.py)
+    AUDITORIA_ASSINCRONA = True
+    AUDITORIA_LOTE = 200              # registros por INSERT; atingir o lote acorda o worker
+    AUDITORIA_INTERVALO = 1.0         # segundos máximos entre gravações
+    AUDITORIA_MAX_BUFFER = 10000      # registros em memória antes de descartar
+    
+    # Arquivamento mensal dos logs (utils/arquivo_logs.py, python arquivar_logs.py)
+    LOGS_ARQUIVO_DIR = os.getenv('LOGS_ARQUIVO_DIR', os.path.join(os.path.dirname(__file__), 'arquivo_logs'))
+    LOGS_MESES_ATIVOS = 3             # meses (incluindo o atual) mantidos no banco
+    LOGS_PARTICOES_FUTURAS = 2        # partições mensais criadas antecipadamente
+    
+    # Feed de alterações de plantões (GET /api/plantoes/changes), limpo por arquivar_logs.py
+    ALTERACOES_RETENCAO_DIAS = 30     # cursores mais antigos recebem 410 e recarregam o mês
+    
     # Cache Redis
     CACHE_TYPE = 'redis'
     CACHE_REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
     CACHE_DEFAULT_TIMEOUT = 300  # 5 minutos
+    CACHE_STALE_TIMEOUT = 120    # segundos extras em que uma entrada obsoleta é servida durante o recálculo
+    CACHE_TRAVA_TIMEOUT = 30     # validade da trava de recálculo de uma chave
+    CACHE_ESPERA_MAX = 2.0       # espera máxima por um recálculo alheio quando não há versão obsoleta
+    
+    # Camada local do cache (utils/cache_camadas.py)
+    CACHE_L1_MAX = 2000          # entradas por processo; 0 desativa o L1
+    CACHE_L1_TTL = 5             # segundos máximos de uma cópia local
+    CACHE_DISJUNTOR_FALHAS = 3   # erros seguidos do Redis até suspender o L2
+    CACHE_DISJUNTOR_PAUSA = 30   # segundos com o L2 suspenso antes de tentar de novo
+    CACHE_BARRAMENTO = 'redis'   # invalidação entre workers: 'redis' (pub/sub) ou 'local'
+    
+    # Aquecimento do cache antes das janelas de abertura (utils/aquecimento.py)
+    CACHE_AQUECIMENTO = True
+    CACHE_AQUECIMENTO_ANTECEDENCIA = 300  # segundos antes de cada janela
+    CACHE_AQUECIMENTO_AGRUPAR = 1.0       # segundos para agrupar invalidações antes de reaquecer
+    
+    # Fila de mensagens do Socket.IO: entrega eventos aos clientes de todos os workers
+    SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE', CACHE_REDIS_URL)
+    SOCKETIO_CANAL = 'plantoes-socketio'
+    WEBSOCKET_AGRUPAR = 0.1  # segundos acumulando deltas de plantões antes de emitir (utils/difusor.py)
+    
+    # Reconciliação do placar incremental do ranking (utils/placar.py)
+    RANKING_RECONCILIACAO = 3600  # segundos entre recálculos completos do mês vigente; 0 desativa
+    
+    # Importação de planilhas de pontuação (POST /api/pontuacao/importar/arquivo)
+    IMPORTACAO_LOTE = 500         # linhas válidas por upsert e por evento de progresso
+    IMPORTACAO_ERROS_MAX = 100    # erros de linha devolvidos na resposta (o total vem à parte)
     
     # Cache específico para diferentes tipos de dados
     CACHE_CONFIG = {
@@ -99,6 +146,15 @@ class ProductionConfig(Config):
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_ECHO = False
+    CACHE_TYPE = 'SimpleCache'
+    FILA_RESERVAS_WORKERS = 0  # testes processam a fila com processar_proximo()
+    AUDITORIA_ASSINCRONA = False  # testes gravam a auditoria com descarregar()
+    CACHE_BARRAMENTO = 'local'
+    CACHE_AQUECIMENTO = False  # testes chamam aquecer() diretamente
+    SOCKETIO_MESSAGE_QUEUE = None  # entrega só no processo
+    WEBSOCKET_AGRUPAR = 0  # testes emitem os deltas com descarregar()
+    RANKING_RECONCILIACAO = 0  # testes chamam reconciliar() diretamente
 
 
 config = {
@@ -1,6 +1,6 @@
 ﻿from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from sqlalchemy import String, JSON
+from sqlalchemy import String, JSON, literal_column
 import uuid
 
 db = SQLAlchemy()
@@ -15,6 +15,7 @@ class Usuario(db.Model):
     senha = db.Column(db.String(255), nullable=False)
     tipo = db.Column(db.String(20), nullable=False)  # admin, gestor, plantonista
     ativo = db.Column(db.Boolean, default=True)
+    token_versao = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # incrementada para revogar JWTs
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -70,6 +71,9 @@ class Plantonista(db.Model):
 
 class Pontuacao(db.Model):
     __tablename__ = 'pontuacao'
+    __table_args__ = (
+        db.UniqueConstraint('plantonista_id', 'mes_referencia', name='uq_pontuacao_plantonista_mes'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     plantonista_id = db.Column(db.String(36), db.ForeignKey('plantonistas.id', ondelete='CASCADE'))
@@ -114,12 +118,20 @@ class Pontuacao(db.Model):
 
 class Plantao(db.Model):
     __tablename__ = 'plantoes'
+    __table_args__ = (
+        db.UniqueConstraint('data', 'turno', name='uq_plantoes_data_turno'),
+        db.CheckConstraint('ocupadas >= 0 AND ocupadas <= max_plantonistas', name='ck_plantoes_ocupadas'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     data = db.Column(db.Date, nullable=False)
     turno = db.Column(db.String(10), nullable=False)  # manha, tarde
     status = db.Column(db.String(20), default='disponivel')  # disponivel, reservado, confirmado, cancelado
     max_plantonistas = db.Column(db.Integer, default=2)
+    ocupadas = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # alocações confirmadas (contador)
+    # Incrementada em todo UPDATE, inclusive os UPDATEs diretos de utils/reservas.py
+    versao = db.Column(db.Integer, nullable=False, default=1, server_default='1',
+                       onupdate=literal_column('versao + 1'))
     observacoes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -128,9 +140,8 @@ class Plantao(db.Model):
     alocacoes = db.relationship('Alocacao', backref='plantao', lazy='select', cascade='all, delete-orphan')
     
     def to_dict(self):
-        # Contar alocações de forma simples
-        alocacoes_count = len(self.alocacoes) if self.alocacoes else 0
-        alocacoes_confirmadas = len([a for a in (self.alocacoes or []) if a.status == 'confirmado'])
+        # Contador mantido pelas mutações de alocação (utils/reservas.py)
+        ocupadas = self.ocupadas or 0
         
         return {
             'id': str(self.id),
@@ -139,13 +150,18 @@ class Plantao(db.Model):
             'status': self.status,
             'max_plantonistas': self.max_plantonistas,
             'observacoes': self.observacoes,
-            'alocacoes_count': alocacoes_count,
-            'vagas_disponiveis': self.max_plantonistas - alocacoes_confirmadas
+            'alocacoes_count': ocupadas,
+            'vagas_ocupadas': ocupadas,
+            'vagas_disponiveis': self.max_plantonistas - ocupadas,
+            'versao': self.versao
         }
 
 
 class Alocacao(db.Model):
     __tablename__ = 'alocacoes'
+    __table_args__ = (
+        db.UniqueConstraint('plantao_id', 'plantonista_id', name='uq_alocacoes_plantao_plantonista'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     plantao_id = db.Column(db.String(36), db.ForeignKey('plantoes.id', ondelete='CASCADE'))
@@ -170,6 +186,47 @@ class Alocacao(db.Model):
         }
 
 
+class Alteracao(db.Model):
+    """Feed só de inserção das mutações de plantões e alocações (utils/alteracoes.py)"""
+    __tablename__ = 'alteracoes'
+    __table_args__ = (
+        db.Index('idx_alteracoes_data_id', 'data', 'id'),
+        db.Index('idx_alteracoes_transacao', 'transacao', 'id'),
+    )
+    
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    # Cursor do feed no Postgres: txid da transação que gravou (no SQLite fica nulo e o cursor é o id)
+    transacao = db.Column(db.BigInteger)
+    entidade = db.Column(db.String(20), nullable=False)  # plantao, alocacao
+    entidade_id = db.Column(db.String(36), nullable=False)
+    data = db.Column(db.Date, nullable=False)  # data do plantão (filtro por mês)
+    removido = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class CotaMensal(db.Model):
+    """Livro-razão de plantões confirmados por plantonista e mês"""
+    __tablename__ = 'cotas_mensais'
+    __table_args__ = (
+        db.UniqueConstraint('plantonista_id', 'mes_referencia', name='uq_cotas_plantonista_mes'),
+    )
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    plantonista_id = db.Column(db.String(36), db.ForeignKey('plantonistas.id', ondelete='CASCADE'), nullable=False)
+    mes_referencia = db.Column(db.Date, nullable=False)  # primeiro dia do mês
+    total = db.Column(db.Integer, nullable=False, default=0)
+    dias = db.Column(db.Integer, nullable=False, default=0)  # bit (dia - 1) ligado = já tem plantão no dia
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'plantonista_id': str(self.plantonista_id),
+            'mes_referencia': self.mes_referencia.isoformat() if self.mes_referencia else None,
+            'total': self.total,
+            'dias': [dia for dia in range(1, 32) if (self.dias or 0) >> (dia - 1) & 1]
+        }
+
+
 class Troca(db.Model):
     __tablename__ = 'trocas'
     
@@ -218,6 +275,13 @@ class Configuracao(db.Model):
 
 class Log(db.Model):
     __tablename__ = 'logs'
+    __table_args__ = (
+        # Paginação por cursor (created_at, id), com e sem filtro
+        db.Index('idx_logs_created_id', 'created_at', 'id'),
+        db.Index('idx_logs_usuario_created', 'usuario_id', 'created_at', 'id'),
+        db.Index('idx_logs_tabela_created', 'tabela', 'created_at', 'id'),
+        db.Index('idx_logs_acao', 'acao', postgresql_ops={'acao': 'varchar_pattern_ops'}),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     usuario_id = db.Column(db.String(36), db.ForeignKey('usuarios.id'))
@@ -1,8 +1,11 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity
 from flask_bcrypt import Bcrypt
 from models import db, Usuario, Plantonista
 from utils.auth import validar_email, validar_senha, criar_resposta, criar_erro, log_acao, gestor_required
+from utils.tokens import claims_usuario, revogar_tokens
+from utils.cache_utils import cached_function, ESCOPO_USUARIO
+from utils.busca_nomes import decidir, NOTA_RESOLUCAO
 import uuid
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
@@ -30,9 +33,10 @@ def login():
         if not usuario.ativo:
             return criar_erro('Usuário inativo', 403)
         
-        # Criar tokens
-        access_token = create_access_token(identity=str(usuario.id))
-        refresh_token = create_refresh_token(identity=str(usuario.id))
+        # Criar tokens (papel e plantonista nos claims evitam consultas por requisição)
+        claims = claims_usuario(usuario)
+        access_token = create_access_token(identity=str(usuario.id), additional_claims=claims)
+        refresh_token = create_refresh_token(identity=str(usuario.id), additional_claims={'versao': claims['versao']})
         
         # Log da ação
         log_acao(usuario.id, 'login', ip_address=request.remote_addr)
@@ -120,7 +124,13 @@ def refresh():
     """Endpoint para renovar access token"""
     try:
         user_id = get_jwt_identity()
-        access_token = create_access_token(identity=user_id)
+        usuario = Usuario.query.get(user_id)
+        
+        if not usuario or not usuario.ativo:
+            return criar_erro('Usuário inativo', 403)
+        
+        # Claims relidos do banco: refletem mudanças de papel desde o login
+        access_token = create_access_token(identity=user_id, additional_claims=claims_usuario(usuario))
         
         return criar_resposta(
             mensagem='Token renovado com sucesso',
@@ -133,8 +143,14 @@ def refresh():
 
 @auth_bp.route('/me', methods=['GET'])
 @jwt_required()
+@cached_function(timeout=300, key_prefix='me', tags=['ranking', 'usuarios'], escopo=ESCOPO_USUARIO)  # Cache por 5 minutos
 def me():
-    """Retorna dados do usuário logado"""
+    """
+    Retorna dados do usuário logado
+
+    Cache por usuário com as tags 'ranking' (posição e pontuação do
+    plantonista) e 'usuarios' (cadastro alterado).
+    """
     try:
         user_id = get_jwt_identity()
         usuario = Usuario.query.get(user_id)
@@ -181,19 +197,67 @@ def change_password():
         if not bcrypt.check_password_hash(usuario.senha, senha_atual):
             return criar_erro('Senha atual incorreta', 401)
         
-        # Atualizar senha
+        # Atualizar senha e encerrar as demais sessões
         usuario.senha = bcrypt.generate_password_hash(senha_nova).decode('utf-8')
+        revogar_tokens(usuario)
         db.session.commit()
         
         # Log da ação
         log_acao(usuario.id, 'alterar_senha', ip_address=request.remote_addr)
         
-        return criar_resposta(mensagem='Senha alterada com sucesso')
+        claims = claims_usuario(usuario)
+        return criar_resposta(
+            mensagem='Senha alterada com sucesso',
+            dados={
+                'access_token': create_access_token(identity=str(usuario.id), additional_claims=claims),
+                'refresh_token': create_refresh_token(identity=str(usuario.id), additional_claims={'versao': claims['versao']})
+            }
+        )
         
     except Exception as e:
         db.session.rollback()
         return criar_erro(f'Erro ao alterar senha: {str(e)}', 500)
 
+@auth_bp.route('/usuarios/buscar', methods=['GET'])
+@gestor_required
+def buscar_usuarios():
+    """
+    Candidatos para um nome ou email digitado, do mais ao menos provável
+    
+    Query params:
+        q: Nome (completo ou parcial, com ou sem acentos) ou email
+        tipo: Restringe a um tipo de usuário (ex: plantonista)
+        ativos: 'true' para só usuários ativos
+        limite: Máximo de candidatos (padrão 10, máximo 50)
+    
+    'resolvido' traz o candidato que se destaca dos demais; com 'ambiguo'
+    verdadeiro, mais de um cadastro é plausível e cabe a quem busca escolher.
+    """
+    texto = request.args.get('q', '').strip()
+    if not texto:
+        return criar_erro('Informe o texto da busca (q)', 400)
+    try:
+        limite = min(max(int(request.args.get('limite', 10)), 1), 50)
+    except ValueError:
+        return criar_erro('limite deve ser um número', 400)
+    
+    try:
+        candidatos = current_app.busca_nomes.buscar(
+            texto,
+            tipo=request.args.get('tipo') or None,
+            ativos=request.args.get('ativos') == 'true',
+            limite=limite
+        )
+        resolvido = decidir(candidatos)
+        return criar_resposta(dados={
+            'candidatos': candidatos,
+            'resolvido': resolvido,
+            'ambiguo': resolvido is None and sum(c['nota'] >= NOTA_RESOLUCAO for c in candidatos) > 1
+        })
+    except Exception as e:
+        return criar_erro(f'Erro ao buscar usuários: {str(e)}', 500)
+
+
 @auth_bp.route('/usuarios', methods=['GET'])
 @gestor_required
 def get_usuarios():
@@ -5,7 +5,7 @@ from flask import Blueprint, request
 from flask_jwt_extended import jwt_required
 from models import db, Plantao, Alocacao, Plantonista, Usuario, Pontuacao, Log
 from utils.auth import gestor_required, criar_resposta, criar_erro
-from utils.cache_utils import cached_function
+from utils.cache_utils import cached_function, ESCOPO_GLOBAL
 from datetime import datetime, date, timedelta
 from sqlalchemy import func, extract, text
 from calendar import monthrange
@@ -13,11 +13,14 @@ import json
 
 bi_bp = Blueprint('bi', __name__, url_prefix='/api/bi')
 
+# Indicadores dependem de plantões de qualquer mês e das pontuações
+TAGS_BI = ['bi', 'plantoes', 'plantoes:todos', 'ranking']
+
 
 @bi_bp.route('/occupancy-trend', methods=['GET'])
 @jwt_required()
 @gestor_required
-@cached_function(timeout=3600, key_prefix='bi_occupancy')  # Cache por 1 hora
+@cached_function(timeout=3600, key_prefix='bi_occupancy', tags=TAGS_BI, escopo=ESCOPO_GLOBAL)  # Cache por 1 hora
 def get_occupancy_trend():
     """Retorna tendência de ocupação dos últimos 6 meses"""
     try:
@@ -69,7 +72,7 @@ def get_occupancy_trend():
 @bi_bp.route('/performance', methods=['GET'])
 @jwt_required()
 @gestor_required  
-@cached_function(timeout=1800, key_prefix='bi_performance')  # Cache por 30 min
+@cached_function(timeout=1800, key_prefix='bi_performance', tags=TAGS_BI, escopo=ESCOPO_GLOBAL)  # Cache por 30 min
 def get_performance_data():
     """Retorna dados de performance dos top 10 plantonistas"""
     try:
@@ -98,7 +101,7 @@ def get_performance_data():
 @bi_bp.route('/shift-distribution', methods=['GET'])
 @jwt_required()
 @gestor_required
-@cached_function(timeout=3600, key_prefix='bi_shifts')  # Cache por 1 hora
+@cached_function(timeout=3600, key_prefix='bi_shifts', tags=TAGS_BI, escopo=ESCOPO_GLOBAL)  # Cache por 1 hora
 def get_shift_distribution():
     """Retorna distribuição de plantões por turno"""
     try:
@@ -136,7 +139,7 @@ def get_shift_distribution():
 @bi_bp.route('/real-time-metrics', methods=['GET'])
 @jwt_required()
 @gestor_required
-@cached_function(timeout=300, key_prefix='bi_realtime')  # Cache por 5 min
+@cached_function(timeout=300, key_prefix='bi_realtime', tags=TAGS_BI, escopo=ESCOPO_GLOBAL)  # Cache por 5 min
 def get_real_time_metrics():
     """Retorna métricas em tempo real"""
     try:
@@ -193,7 +196,7 @@ def get_real_time_metrics():
 @bi_bp.route('/kpis', methods=['GET'])
 @jwt_required()
 @gestor_required
-@cached_function(timeout=3600, key_prefix='bi_kpis')  # Cache por 1 hora
+@cached_function(timeout=3600, key_prefix='bi_kpis', tags=TAGS_BI, escopo=ESCOPO_GLOBAL)  # Cache por 1 hora
 def get_advanced_kpis():
     """Retorna KPIs executivos avançados"""
     try:
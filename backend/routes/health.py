@@ -1,5 +1,6 @@
 from flask import Blueprint, jsonify, current_app
 from models import db
+from utils.websocket import metricas_socketio
 from datetime import datetime
 import os
 import psutil
@@ -69,7 +70,15 @@ def get_metrics():
             'application': {
                 'environment': os.getenv('FLASK_ENV'),
                 'debug': current_app.debug
-            }
+            },
+            'auditoria': current_app.auditoria.metricas() if hasattr(current_app, 'auditoria') else None,
+            'cache': current_app.cache.metricas() if hasattr(current_app.cache, 'metricas') else None,
+            'ranking': current_app.placar.metricas() if hasattr(current_app, 'placar') else None,
+            'busca_nomes': current_app.busca_nomes.metricas() if hasattr(current_app, 'busca_nomes') else None,
+            'websocket': {
+                **metricas_socketio(current_app.socketio),
+                'difusor': current_app.difusor.metricas()
+            } if hasattr(current_app, 'socketio') else None
         })
         
     except Exception as e:
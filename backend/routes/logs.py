@@ -1,43 +1,112 @@
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required
+from sqlalchemy import tuple_
 from models import db, Log, Usuario
 from utils.auth import gestor_required, criar_resposta, criar_erro
+from utils.db_utils import contar_aproximado
+from utils.arquivo_logs import buscar_arquivados, contar_arquivados
 from datetime import datetime
+import base64
+import json
 
 logs_bp = Blueprint('logs', __name__, url_prefix='/api/logs')
 
+MAX_POR_PAGINA = 200
+
+
+def codificar_cursor(log):
+    """Cursor opaco com a posição (created_at, id) do último log da página"""
+    posicao = json.dumps([log['created_at'], log['id']])
+    return base64.urlsafe_b64encode(posicao.encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    """
+    Posição (created_at, id) contida no cursor
+
+    Raises:
+        ValueError: Se o cursor não foi gerado por codificar_cursor
+    """
+    try:
+        created_at, log_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), str(log_id)
+    except Exception:
+        raise ValueError('Cursor inválido')
+
+
 @logs_bp.route('', methods=['GET'])
 @gestor_required
 def get_logs():
-    """Retorna lista de logs administrativos"""
+    """
+    Retorna lista de logs administrativos
+
+    Paginação por cursor sobre (created_at, id): cada página é uma busca
+    no índice a partir do último registro da anterior, sem OFFSET nem
+    COUNT(*). O filtro de ação é por prefixo para usar o índice. Meses já
+    arquivados (utils/arquivo_logs.py) são lidos dos segmentos e
+    intercalados na mesma ordem.
+
+    Query params:
+        cursor: proximo_cursor devolvido pela página anterior
+        per_page: Registros por página (máximo MAX_POR_PAGINA)
+        usuario_id, tabela: Filtros exatos
+        acao: Prefixo da ação (ex: 'atribuir')
+        total: '1' para incluir o total aproximado
+    """
     try:
-        # Paginação
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 50, type=int)
-        
+        per_page = min(max(request.args.get('per_page', 50, type=int), 1), MAX_POR_PAGINA)
+        cursor = request.args.get('cursor')
+
         # Filtros básicos
         usuario_id = request.args.get('usuario_id')
         acao = request.args.get('acao')
         tabela = request.args.get('tabela')
-        
-        query = Log.query.order_by(Log.created_at.desc())
-        
+
+        query = Log.query
+
         if usuario_id:
-            query = query.filter_by(usuario_id=usuario_id)
+            query = query.filter(Log.usuario_id == usuario_id)
+        acao = acao.strip().lower() if acao else None
         if acao:
-            query = query.filter(Log.acao.ilike(f'%{acao}%'))
+            prefixo = acao.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            query = query.filter(Log.acao.like(f'{prefixo}%', escape='\\'))
         if tabela:
-            query = query.filter_by(tabela=tabela)
-            
-        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
-        logs = pagination.items
-        
-        return criar_resposta(dados={
-            'logs': [l.to_dict() for l in logs],
-            'total': pagination.total,
-            'pages': pagination.pages,
-            'current_page': pagination.page
-        })
-        
+            query = query.filter(Log.tabela == tabela)
+
+        filtrada = query
+
+        posicao = None
+        if cursor:
+            try:
+                posicao = decodificar_cursor(cursor)
+            except ValueError as e:
+                return criar_erro(str(e), 400)
+            query = query.filter(tuple_(Log.created_at, Log.id) < posicao)
+
+        # Um registro a mais indica se existe próxima página
+        ativos = query.order_by(Log.created_at.desc(), Log.id.desc()).limit(per_page + 1).all()
+
+        # Página cheia no banco: só segmentos com registros mais novos que o último importam
+        piso = ativos[-1].created_at if len(ativos) > per_page else None
+        arquivados = buscar_arquivados(per_page + 1, posicao=posicao, piso=piso,
+                                       usuario_id=usuario_id, tabela=tabela, acao=acao)
+
+        logs = [l.to_dict() for l in ativos] + arquivados
+        if arquivados:
+            logs.sort(key=lambda l: (datetime.fromisoformat(l['created_at']), l['id']), reverse=True)
+        tem_mais = len(logs) > per_page
+        logs = logs[:per_page]
+
+        dados = {
+            'logs': logs,
+            'proximo_cursor': codificar_cursor(logs[-1]) if tem_mais else None,
+            'tem_mais': tem_mais
+        }
+        if request.args.get('total') == '1':
+            dados['total_aproximado'] = contar_aproximado(filtrada) + \
+                contar_arquivados(usuario_id=usuario_id, tabela=tabela, acao=acao)
+
+        return criar_resposta(dados=dados)
+
     except Exception as e:
         return criar_erro(f'Erro ao buscar logs: {str(e)}', 500)
@@ -1,9 +1,20 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db, Plantao, Alocacao, Plantonista, Usuario
 from utils.auth import gestor_required, criar_resposta, criar_erro, log_acao, get_current_user
-from utils.websocket import notify_plantao_update, notify_alocacao_update
-from utils.cache_utils import cached_function, invalidate_plantoes_cache, invalidate_rankings_cache
+from utils.tokens import tipo_usuario_atual, plantonista_id_atual
+from utils.cache_utils import cached_function, invalidate_plantoes_cache, tags_periodo, tag_mes, ESCOPO_GLOBAL, ESCOPO_PAPEL
+from utils.calendario import carregar_calendario, gerar_plantoes
+from utils.fila_reservas import FilaCheia
+from utils.busca_nomes import NomeAmbiguo, NomeNaoEncontrado
+from utils.websocket import notify_plantoes_delta
+from utils.alteracoes import (
+    registrar_alteracao, alteracoes_desde, cursor_atual, CursorExpirado, LIMITE_PADRAO, LIMITE_MAXIMO
+)
+from utils.reservas import (
+    reservar_plantao, atribuir_plantao, liberar_alocacao, validar_janela_escolha, concluir_escolha,
+    janelas_abertura, ReservaNegada, STATUS_ABERTOS
+)
 from datetime import datetime, date, timedelta
 from calendar import monthrange
 import uuid
@@ -11,35 +22,30 @@ import uuid
 plantao_bp = Blueprint('plantao', __name__, url_prefix='/api/plantoes')
 
 
+def _tags_consulta_periodo():
+    """Tags de cache do período pedido em ?inicio=&fim="""
+    inicio = request.args.get('inicio')
+    fim = request.args.get('fim')
+    return tags_periodo(
+        datetime.strptime(inicio, '%Y-%m-%d').date() if inicio else None,
+        datetime.strptime(fim, '%Y-%m-%d').date() if fim else None
+    )
+
+
 @plantao_bp.route('', methods=['GET'])
 @jwt_required()
-@cached_function(timeout=600, key_prefix='plantoes')  # Cache por 10 minutos
+@cached_function(timeout=600, key_prefix='plantoes', tags=_tags_consulta_periodo, escopo=ESCOPO_GLOBAL)  # Cache por 10 minutos
 def get_plantoes():
     """Retorna todos os plantões filtrados por data"""
     try:
         inicio = request.args.get('inicio')
         fim = request.args.get('fim')
         
-        # Query simples e confiável
-        query = Plantao.query
-        
-        if inicio:
-            query = query.filter(Plantao.data >= datetime.strptime(inicio, '%Y-%m-%d').date())
-        if fim:
-            query = query.filter(Plantao.data <= datetime.strptime(fim, '%Y-%m-%d').date())
-            
-        plantoes = query.order_by(Plantao.data, Plantao.turno).all()
+        data_inicio = datetime.strptime(inicio, '%Y-%m-%d').date() if inicio else None
+        data_fim = datetime.strptime(fim, '%Y-%m-%d').date() if fim else None
         
-        resultado = []
-        for plantao in plantoes:
-            plantao_dict = plantao.to_dict()
-            # Buscar alocações confirmadas
-            alocacoes = Alocacao.query.filter_by(
-                plantao_id=plantao.id, 
-                status='confirmado'
-            ).all()
-            plantao_dict['alocacoes'] = [a.to_dict() for a in alocacoes]
-            resultado.append(plantao_dict)
+        # Plantões, alocações confirmadas e nomes em número fixo de queries
+        resultado = carregar_calendario(data_inicio, data_fim, apenas_confirmadas=True)
             
         return criar_resposta(dados={'plantoes': resultado})
     except Exception as e:
@@ -47,6 +53,8 @@ def get_plantoes():
 
 @plantao_bp.route('/mes/<ano>/<mes>', methods=['GET'])
 @jwt_required()
+@cached_function(timeout=600, key_prefix='plantoes_mes',
+                 tags=lambda ano, mes: ['plantoes', tag_mes(date(int(ano), int(mes), 1))], escopo=ESCOPO_GLOBAL)
 def get_plantoes_mes(ano, mes):
     """Retorna todos os plantões de um mês"""
     try:
@@ -54,21 +62,8 @@ def get_plantoes_mes(ano, mes):
         primeiro_dia = date(int(ano), int(mes), 1)
         ultimo_dia = date(int(ano), int(mes), monthrange(int(ano), int(mes))[1])
         
-        # Query simples e confiável
-        plantoes = Plantao.query.filter(
-            Plantao.data >= primeiro_dia,
-            Plantao.data <= ultimo_dia
-        ).order_by(Plantao.data, Plantao.turno).all()
-        
-        # Montar resposta com alocações
-        resultado = []
-        for plantao in plantoes:
-            plantao_dict = plantao.to_dict()
-            # Buscar alocações
-            alocacoes = Alocacao.query.filter_by(plantao_id=plantao.id).all()
-            plantao_dict['alocacoes'] = [a.to_dict() for a in alocacoes]
-            resultado.append(plantao_dict)
-            resultado.append(plantao_dict)
+        # Plantões com todas as alocações em número fixo de queries
+        resultado = carregar_calendario(primeiro_dia, ultimo_dia)
         
         return criar_resposta(dados={'plantoes': resultado})
         
@@ -79,73 +74,46 @@ def get_plantoes_mes(ano, mes):
 @plantao_bp.route('/gerar-mes', methods=['POST'])
 @gestor_required
 def gerar_plantoes_mes():
-    """Gera automaticamente plantões para um mês"""
+    """
+    Gera automaticamente plantões para um mês ou intervalo de meses
+
+    Aceita {"ano", "mes"} (um mês), apenas {"ano"} (o ano inteiro) ou
+    {"inicio": "YYYY-MM", "fim": "YYYY-MM"} (intervalo inclusivo).
+    """
     try:
-        data = request.get_json()
-        
-        ano = data.get('ano')
-        mes = data.get('mes')
-        
-        if not ano or not mes:
-            return criar_erro('Ano e mês são obrigatórios', 400)
-        
-        # Dias do mês
-        num_dias = monthrange(int(ano), int(mes))[1]
-        
-        plantoes_criados = []
-        plantoes_existentes = 0
-        
-        for dia in range(1, num_dias + 1):
-            data_plantao = date(int(ano), int(mes), dia)
-            dia_semana = data_plantao.weekday()  # 0=segunda, 6=domingo
-            
-            # Pular domingos (dia_semana == 6)
-            if dia_semana == 6:
-                continue
-            
-            # Criar plantões manhã e tarde
-            for turno in ['manha', 'tarde']:
-                # Verificar se já existe
-                plantao_existe = Plantao.query.filter_by(
-                    data=data_plantao,
-                    turno=turno
-                ).first()
-                
-                if plantao_existe:
-                    plantoes_existentes += 1
-                    continue
-                
-                # Criar plantão
-                plantao = Plantao(
-                    data=data_plantao,
-                    turno=turno,
-                    status='disponivel',
-                    max_plantonistas=2
-                )
-                
-                db.session.add(plantao)
-                plantoes_criados.append(plantao)
-        
+        data = request.get_json() or {}
+
+        try:
+            if data.get('inicio'):
+                inicio = datetime.strptime(data['inicio'], '%Y-%m').date()
+                fim = datetime.strptime(data.get('fim') or data['inicio'], '%Y-%m').date()
+            elif data.get('ano'):
+                ano = int(data['ano'])
+                if data.get('mes'):
+                    inicio = fim = date(ano, int(data['mes']), 1)
+                else:
+                    inicio, fim = date(ano, 1, 1), date(ano, 12, 1)
+            else:
+                return criar_erro('Ano e mês (ou inicio e fim) são obrigatórios', 400)
+
+            resultado = gerar_plantoes(inicio, fim)
+        except ValueError as e:
+            db.session.rollback()
+            return criar_erro(f'Período inválido: {str(e)}', 400)
+
         db.session.commit()
-        
+        invalidate_plantoes_cache()
+
         # Log da ação
         user = get_current_user()
-        log_acao(user.id, 'gerar_plantoes', detalhes={
-            'ano': ano,
-            'mes': mes,
-            'criados': len(plantoes_criados),
-            'existentes': plantoes_existentes
-        })
-        
+        log_acao(user.id, 'gerar_plantoes', detalhes=resultado)
+
         return criar_resposta(
-            mensagem=f'{len(plantoes_criados)} plantões criados, {plantoes_existentes} já existiam',
-            dados={
-                'criados': len(plantoes_criados),
-                'existentes': plantoes_existentes
-            },
+            mensagem=f"{resultado['criados']} plantões criados, {resultado['existentes']} já existiam",
+            dados=resultado,
             codigo=201
         )
-        
+
     except Exception as e:
         db.session.rollback()
         return criar_erro(f'Erro ao gerar plantões: {str(e)}', 500)
@@ -156,199 +124,126 @@ def gerar_plantoes_mes():
 def escolher_plantao(plantao_id):
     """Plantonista escolhe um plantão disponível"""
     try:
-        print(f"DEBUG escolher_plantao: plantao_id={plantao_id}")
-        
         # Validar formato UUID
         try:
             uuid.UUID(plantao_id)
         except ValueError:
             return criar_erro('ID do plantão inválido', 400)
         
-        user = get_current_user()
-        print(f"DEBUG escolher_plantao: user={user.id if user else 'None'}, tipo={user.tipo if user else 'None'}")
+        user_id = get_jwt_identity()
+        tipo = tipo_usuario_atual()
         
         hoje = date.today()
         agora = datetime.utcnow()
         
-        # Verificar se é plantonista
-        if user.tipo != 'plantonista':
+        # Verificar se é plantonista (claims do token, sem consultar usuarios)
+        if tipo != 'plantonista':
             return criar_erro('Apenas plantonistas podem escolher plantões', 403)
         
-        plantonista = user.plantonista
+        plantonista_id = plantonista_id_atual()
+        plantonista = db.session.get(Plantonista, plantonista_id) if plantonista_id else None
         if not plantonista:
             return criar_erro('Registro de plantonista não encontrado', 404)
         
         if not plantao_id:
             return criar_erro('plantao_id é obrigatório', 400)
         
-        # Buscar plantão
+        # Buscar plantão (sem lock: apenas regras de calendário/ranking)
         plantao = Plantao.query.get(plantao_id)
-        print(f"DEBUG escolher_plantao: plantao found={plantao is not None}")
         
         if not plantao:
             return criar_erro('Plantão não encontrado', 404)
         
-        # Verificar se plantão está disponível
-        if plantao.status not in ['disponivel', 'reservado']:
-            return criar_erro('Plantão não está disponível', 400)
+        # Regras de calendário e meritocracia (ranking)
+        try:
+            validar_janela_escolha(plantao, plantonista, hoje, agora)
+        except ReservaNegada as e:
+            return criar_erro(e.mensagem, e.codigo)
         
-        # Verificar vagas
-        alocacoes_confirmadas = Alocacao.query.filter_by(
-            plantao_id=plantao_id,
-            status='confirmado'
-        ).count()
+        # Reserva atômica: trava o plantão, valida vagas/dia/limite e grava
+        try:
+            alocacao, plantao = reservar_plantao(plantao_id, plantonista)
+        except ReservaNegada as e:
+            return criar_erro(e.mensagem, e.codigo)
+        except Exception as e:
+            return criar_erro(f'Erro na operação: {str(e)}', 500)
         
-        if alocacoes_confirmadas >= plantao.max_plantonistas:
-            return criar_erro('Plantão sem vagas disponíveis', 400)
+        # Log, notificação WebSocket e invalidação de cache
+        concluir_escolha(user_id, alocacao, plantao)
         
-        # Verificar se plantonista já escolheu este plantão
-        alocacao_existente = Alocacao.query.filter_by(
-            plantao_id=plantao_id,
-            plantonista_id=plantonista.id
-        ).first()
+        return criar_resposta(
+            mensagem='Plantão escolhido com sucesso',
+            dados={'alocacao': alocacao.to_dict()},
+            codigo=201
+        )
         
-        if alocacao_existente:
-            return criar_erro('Você já escolheu este plantão', 400)
-            
-        # Verificar se já tem outro plantão no mesmo DIA (Manhã + Tarde não permitido)
-        outro_plantao_dia = Alocacao.query.join(Plantao).filter(
-            Alocacao.plantonista_id == plantonista.id,
-            Alocacao.status == 'confirmado',
-            Plantao.data == plantao.data
-        ).first()
+    except Exception as e:
+        return criar_erro(f'Erro ao escolher plantão: {str(e)}', 500)
+
+
+@plantao_bp.route('/<plantao_id>/escolher/fila', methods=['POST'])
+@jwt_required()
+def escolher_plantao_fila(plantao_id):
+    """Plantonista entra na sala de espera para escolher um plantão (abertura do mês)"""
+    try:
+        try:
+            uuid.UUID(plantao_id)
+        except ValueError:
+            return criar_erro('ID do plantão inválido', 400)
         
-        if outro_plantao_dia:
-            return criar_erro('Não é permitido fazer dois plantões no mesmo dia', 400)
+        user_id = get_jwt_identity()
         
-        # Verificar limite de plantões do mês - versão mais robusta
-        try:
-            mes_plantao = plantao.data.replace(day=1)
-            # Calcular último dia do mês de forma segura
-            if mes_plantao.month == 12:
-                proximo_mes = mes_plantao.replace(year=mes_plantao.year + 1, month=1)
-            else:
-                proximo_mes = mes_plantao.replace(month=mes_plantao.month + 1)
-            
-            # Query mais segura usando between
-            plantoes_mes = Alocacao.query.join(Plantao).filter(
-                Alocacao.plantonista_id == plantonista.id,
-                Alocacao.status == 'confirmado',
-                Plantao.data >= mes_plantao,
-                Plantao.data < proximo_mes
-            ).count()
-            
-        except Exception:
-            # Fallback simples se houver erro
-            plantoes_mes = 0
+        if tipo_usuario_atual() != 'plantonista':
+            return criar_erro('Apenas plantonistas podem escolher plantões', 403)
         
-        if plantoes_mes >= plantonista.max_plantoes_mes:
-            return criar_erro(f'Você atingiu o limite de {plantonista.max_plantoes_mes} plantões no mês', 400)
-            
-        # Impedir escolha de plantões que já passaram
-        if plantao.data < hoje:
-            return criar_erro('Não é possível escolher plantões de datas passadas', 400)
-            
-        # --- Lógica de Meritocracia (Ranking) Simplificada ---
-        # Dia 25 é o dia padrão de abertura para o mês seguinte
-        DIA_ABERTURA_PADRAO = 25
-        HORA_INICIO = 8  # 1º lugar às 08:00
-        
-        # Simplificar lógica de ranking - ser menos restritivo
-        ranking = plantonista.ranking or 99
-        
-        # Para plantões do mês atual - sem restrições de ranking
-        if plantao.data.year == hoje.year and plantao.data.month == hoje.month:
-            # Liberar totalmente para mês atual
-            pass  
-        
-        # Para plantões do mês seguinte - aplicar regras de ranking
-        elif plantao.data.year == hoje.year and plantao.data.month == hoje.month + 1:
-            data_abertura = date(hoje.year, hoje.month, DIA_ABERTURA_PADRAO)
-            
-            # Se ainda não abriu
-            if hoje < data_abertura:
-                return criar_erro(f'A escolha para o mês {plantao.data.strftime("%m/%Y")} será liberada em {data_abertura.strftime("%d/%m/%Y")}', 403)
-            
-            # Se abriu hoje, verificar horário apenas para rankings altos
-            if hoje == data_abertura and ranking <= 10:  # Apenas top 10 tem restrição de horário
-                hora_permitida = HORA_INICIO + (ranking - 1)
-                if agora.hour < hora_permitida:
-                    return criar_erro(f'Sua posição no ranking ({ranking}º) permite escolha a partir das {hora_permitida:02d}:00', 403)
-        
-        # Para plantões muito futuros
-        elif plantao.data > date(hoje.year, hoje.month + 2, 1):
-            return criar_erro('Não é possível escolher plantões tão distantes', 403)
-            
-        # Logica especial: "Depois que o da frente escolher"
-        # Para ser 100% rigoroso como o cliente pediu, podemos opcionalmente olhar se os rankings superiores já escolheram.
-        # Mas a janela de horário já resolve 99% dos casos se respeitada.
-        # ----------------------------------------
+        plantonista_id = plantonista_id_atual()
+        plantonista = db.session.get(Plantonista, plantonista_id) if plantonista_id else None
+        if not plantonista:
+            return criar_erro('Registro de plantonista não encontrado', 404)
         
-        # Criar alocação - método seguro sem transação dupla
-        alocacao = None
+        plantao = Plantao.query.get(plantao_id)
+        if not plantao:
+            return criar_erro('Plantão não encontrado', 404)
+        
+        # Janela de ranking validada na entrada: quem ainda não pode escolher nem entra na fila
         try:
-            # Re-verificar disponibilidade (proteção contra concorrência)
-            alocacoes_atuais = Alocacao.query.filter_by(
-                plantao_id=plantao_id,
-                status='confirmado'
-            ).count()
-            
-            if alocacoes_atuais >= plantao.max_plantonistas:
-                return criar_erro('Plantão sem vagas disponíveis (verificação final)', 400)
-            
-            alocacao = Alocacao(
-                plantao_id=plantao_id,
-                plantonista_id=plantonista.id,
-                status='confirmado',
-                tipo='escolha',
-                confirmado_em=datetime.utcnow()
-            )
-            
-            db.session.add(alocacao)
-            
-            # Atualizar status do plantão
-            alocacoes_confirmadas = alocacoes_atuais + 1
-            if alocacoes_confirmadas >= plantao.max_plantonistas:
-                plantao.status = 'confirmado'
-            else:
-                plantao.status = 'reservado'
-            
-            # Commit das alterações
-            db.session.commit()
-            
-            # Log da ação
-            log_acao(user.id, 'escolher_plantao', 'alocacoes', alocacao.id, detalhes={
-                'plantao_id': str(plantao_id),
-                'data': plantao.data.isoformat(),
-                'turno': plantao.turno
-            })
-            
-            # Notificação WebSocket em tempo real
-            try:
-                notify_plantao_update(plantao.to_dict(), 'plantao_updated')
-                notify_alocacao_update(alocacao.to_dict(), 'alocacao_created')
-            except Exception as ws_error:
-                print(f"Erro WebSocket (não crítico): {ws_error}")
-            
-            # Invalidar cache após mudança
-            invalidate_plantoes_cache()
-            invalidate_rankings_cache()
-            
-        except Exception as e:
-            db.session.rollback()
-            return criar_erro(f'Erro na operação: {str(e)}', 500)
+            validar_janela_escolha(plantao, plantonista)
+        except ReservaNegada as e:
+            return criar_erro(e.mensagem, e.codigo)
         
-        if alocacao:
-            return criar_resposta(
-                mensagem='Plantão escolhido com sucesso',
-                dados={'alocacao': alocacao.to_dict()},
-                codigo=201
+        try:
+            ticket = current_app.fila_reservas.enfileirar(
+                plantao_id, plantonista, user_id, ip_address=request.remote_addr
             )
-        else:
-            return criar_erro('Falha ao criar alocação', 500)
+        except FilaCheia:
+            resposta, codigo = criar_erro('Sala de espera cheia, tente novamente em instantes', 503)
+            resposta.headers['Retry-After'] = '5'
+            return resposta, codigo
+        
+        return criar_resposta(
+            mensagem='Escolha recebida, aguarde o processamento',
+            dados={'ticket': ticket},
+            codigo=202
+        )
         
     except Exception as e:
-        return criar_erro(f'Erro ao escolher plantão: {str(e)}', 500)
+        return criar_erro(f'Erro ao entrar na fila: {str(e)}', 500)
+
+
+@plantao_bp.route('/fila/<ticket_id>', methods=['GET'])
+@jwt_required()
+def consultar_ticket_fila(ticket_id):
+    """Consulta o andamento de um ticket da sala de espera"""
+    try:
+        ticket = current_app.fila_reservas.consultar(ticket_id)
+        
+        if not ticket or ticket['usuario_id'] != str(get_jwt_identity()):
+            return criar_erro('Ticket não encontrado', 404)
+        
+        return criar_resposta(dados={'ticket': ticket})
+        
+    except Exception as e:
+        return criar_erro(f'Erro ao consultar ticket: {str(e)}', 500)
 
 
 @plantao_bp.route('/cancelar/<alocacao_id>', methods=['DELETE'])
@@ -356,7 +251,8 @@ def escolher_plantao(plantao_id):
 def cancelar_alocacao(alocacao_id):
     """Plantonista cancela uma alocação"""
     try:
-        user = get_current_user()
+        user_id = get_jwt_identity()
+        tipo = tipo_usuario_atual()
         
         # Buscar alocação
         alocacao = Alocacao.query.get(alocacao_id)
@@ -364,34 +260,26 @@ def cancelar_alocacao(alocacao_id):
             return criar_erro('Alocação não encontrada', 404)
         
         # Verificar permissão
-        if user.tipo == 'plantonista':
-            if str(alocacao.plantonista.usuario_id) != str(user.id):
+        if tipo == 'plantonista':
+            if str(alocacao.plantonista_id) != plantonista_id_atual():
                 return criar_erro('Você não pode cancelar alocação de outro plantonista', 403)
-        elif user.tipo not in ['admin', 'gestor']:
+        elif tipo not in ['admin', 'gestor']:
             return criar_erro('Sem permissão para cancelar alocação', 403)
         
         # Verificar se pode cancelar (ex: não pode cancelar no mesmo dia)
         plantao = alocacao.plantao
         if plantao.data <= date.today():
-            if user.tipo == 'plantonista':
+            if tipo == 'plantonista':
                 return criar_erro('Não é possível cancelar plantões do dia atual ou passados', 400)
         
-        # Cancelar alocação
-        alocacao.status = 'cancelado'
-        
-        # Atualizar status do plantão
-        alocacoes_confirmadas = Alocacao.query.filter_by(
-            plantao_id=plantao.id,
-            status='confirmado'
-        ).count()
-        
-        if alocacoes_confirmadas < plantao.max_plantonistas:
-            plantao.status = 'disponivel'
-        
+        # Cancelar alocação (libera a vaga no contador do plantão)
+        liberar_alocacao(alocacao)
         db.session.commit()
+        invalidate_plantoes_cache(plantao.data)
+        notify_plantoes_delta(plantao)
         
         # Log da ação
-        log_acao(user.id, 'cancelar_alocacao', 'alocacoes', alocacao_id, detalhes={
+        log_acao(user_id, 'cancelar_alocacao', 'alocacoes', alocacao_id, detalhes={
             'plantao_id': str(plantao.id),
             'data': plantao.data.isoformat()
         })
@@ -436,46 +324,37 @@ def get_meus_plantoes():
         return criar_erro(f'Erro ao buscar plantões: {str(e)}', 500)
 
 
+def _periodo_disponiveis():
+    """Período de ?data_inicio=&data_fim= (padrão: hoje até 60 dias)"""
+    data_inicio = request.args.get('data_inicio', date.today().isoformat())
+    data_fim = request.args.get('data_fim') or (date.today() + timedelta(days=60)).isoformat()
+    return (
+        datetime.strptime(data_inicio, '%Y-%m-%d').date(),
+        datetime.strptime(data_fim, '%Y-%m-%d').date()
+    )
+
+
 @plantao_bp.route('/disponiveis', methods=['GET'])
 @jwt_required()
+@cached_function(timeout=600, key_prefix='plantoes_disponiveis',
+                 tags=lambda: tags_periodo(*_periodo_disponiveis()), escopo=ESCOPO_PAPEL)
 def get_plantoes_disponiveis():
     """Retorna plantões disponíveis para escolha"""
     try:
-        user = get_current_user()
-        
-        if user.tipo != 'plantonista':
+        if tipo_usuario_atual() != 'plantonista':
             return criar_erro('Apenas plantonistas podem acessar este endpoint', 403)
         
-        # Parâmetros opcionais
-        data_inicio = request.args.get('data_inicio', date.today().isoformat())
-        data_fim = request.args.get('data_fim')
-        
-        if not data_fim:
-            # Padrão: próximos 60 dias
-            data_fim = (date.today() + timedelta(days=60)).isoformat()
+        data_inicio_obj, data_fim_obj = _periodo_disponiveis()
         
-        data_inicio_obj = datetime.strptime(data_inicio, '%Y-%m-%d').date()
-        data_fim_obj = datetime.strptime(data_fim, '%Y-%m-%d').date()
-        
-        # Buscar plantões disponíveis
+        # Buscar plantões com vaga (contador ocupadas, uma única query)
         plantoes = Plantao.query.filter(
             Plantao.data >= data_inicio_obj,
             Plantao.data <= data_fim_obj,
-            Plantao.status.in_(['disponivel', 'reservado'])
+            Plantao.status.in_(STATUS_ABERTOS),
+            Plantao.ocupadas < Plantao.max_plantonistas
         ).order_by(Plantao.data, Plantao.turno).all()
         
-        resultado = []
-        for plantao in plantoes:
-            # Verificar vagas
-            alocacoes = Alocacao.query.filter_by(
-                plantao_id=plantao.id,
-                status='confirmado'
-            ).count()
-            
-            if alocacoes < plantao.max_plantonistas:
-                plantao_dict = plantao.to_dict()
-                plantao_dict['vagas_ocupadas'] = alocacoes
-                resultado.append(plantao_dict)
+        resultado = [plantao.to_dict() for plantao in plantoes]
         
         return criar_resposta(dados={'plantoes': resultado})
         
@@ -483,6 +362,89 @@ def get_plantoes_disponiveis():
         return criar_erro(f'Erro ao buscar plantões disponíveis: {str(e)}', 500)
 
 
+@plantao_bp.route('/changes', methods=['GET'])
+@jwt_required()
+def get_alteracoes():
+    """
+    Plantões e alocações alterados desde um cursor (utils/alteracoes.py)
+
+    Cada entidade aparece uma vez, no estado atual. Sem 'since' devolve só
+    o cursor atual: o cliente o guarda antes de carregar o mês e, ao
+    reconectar, pede apenas o que mudou. Responde 410 se o cursor expirou.
+
+    Query params:
+        since: Cursor da resposta anterior (ou do evento plantoes_delta)
+        mes: 'AAAA-MM' para restringir a um mês
+        limit: Alterações lidas por chamada (máximo LIMITE_MAXIMO)
+    """
+    try:
+        since = request.args.get('since')
+        if since is None:
+            return criar_resposta(dados={
+                'cursor': cursor_atual(),
+                'tem_mais': False,
+                'plantoes': [],
+                'alocacoes': [],
+                'removidos': {'plantoes': [], 'alocacoes': []}
+            })
+        
+        try:
+            cursor = int(since)
+            if cursor < 0:
+                raise ValueError
+        except ValueError:
+            return criar_erro('Cursor inválido', 400)
+        
+        inicio = fim = None
+        mes = request.args.get('mes')
+        if mes:
+            try:
+                inicio = datetime.strptime(mes, '%Y-%m').date()
+            except ValueError:
+                return criar_erro("Mês inválido, use 'AAAA-MM'", 400)
+            fim = inicio.replace(day=monthrange(inicio.year, inicio.month)[1])
+        
+        limite = min(max(request.args.get('limit', LIMITE_PADRAO, type=int), 1), LIMITE_MAXIMO)
+        
+        try:
+            dados = alteracoes_desde(cursor, inicio, fim, limite)
+        except CursorExpirado:
+            return criar_erro('Cursor expirado: recarregue os plantões e use o cursor atual', 410)
+        
+        return criar_resposta(dados=dados)
+        
+    except Exception as e:
+        return criar_erro(f'Erro ao buscar alterações: {str(e)}', 500)
+
+
+@plantao_bp.route('/abertura', methods=['GET'])
+@jwt_required()
+@cached_function(timeout=3600, key_prefix='plantoes_abertura', tags=['ranking'], escopo=ESCOPO_GLOBAL)
+def get_cronograma_abertura():
+    """Horários da próxima abertura de escolhas por posição no ranking"""
+    try:
+        janelas = janelas_abertura()
+        
+        posicoes = {
+            p.ranking: p.usuario.nome if p.usuario else None
+            for p in Plantonista.query.options(db.joinedload(Plantonista.usuario)).filter(
+                Plantonista.ranking.isnot(None),
+                Plantonista.ranking <= len(janelas)
+            )
+        }
+        
+        return criar_resposta(dados={
+            'data_abertura': janelas[0][1].date().isoformat(),
+            'janelas': [
+                {'ranking': ranking, 'liberacao': inicio.isoformat(), 'plantonista_nome': posicoes.get(ranking)}
+                for ranking, inicio in janelas
+            ]
+        })
+        
+    except Exception as e:
+        return criar_erro(f'Erro ao buscar cronograma de abertura: {str(e)}', 500)
+
+
 @plantao_bp.route('/<plantao_id>', methods=['PUT'])
 @gestor_required
 def atualizar_plantao(plantao_id):
@@ -499,11 +461,16 @@ def atualizar_plantao(plantao_id):
         if 'status' in data:
             plantao.status = data['status']
         if 'max_plantonistas' in data:
+            if int(data['max_plantonistas']) < (plantao.ocupadas or 0):
+                return criar_erro('max_plantonistas não pode ser menor que as vagas já ocupadas', 400)
             plantao.max_plantonistas = data['max_plantonistas']
         if 'observacoes' in data:
             plantao.observacoes = data['observacoes']
         
+        registrar_alteracao(plantao)
         db.session.commit()
+        invalidate_plantoes_cache(plantao.data)
+        notify_plantoes_delta(plantao)
         
         # Log da ação
         user = get_current_user()
@@ -535,8 +502,12 @@ def deletar_plantao(plantao_id):
         if tem_alocacoes:
             return criar_erro('Não é possível deletar plantão com alocações', 400)
         
+        data_plantao = plantao.data
+        registrar_alteracao(plantao, plantao_removido=True)
         db.session.delete(plantao)
         db.session.commit()
+        invalidate_plantoes_cache(data_plantao)
+        notify_plantoes_delta(removidos=[(plantao_id, data_plantao)])
         
         # Log da ação
         user = get_current_user()
@@ -551,10 +522,13 @@ def deletar_plantao(plantao_id):
 @plantao_bp.route('/<plantao_id>/atribuir', methods=['POST'])
 @gestor_required
 def atribuir_plantonista(plantao_id):
-    """Gestor atribui manualmente um plantonista a um plantão"""
+    """
+    Gestor atribui manualmente um plantonista a um plantão
+    
+    Body: plantonista_id (ou usuario_id), ou o nome do plantonista. Um nome
+    com mais de um cadastro plausível responde 409 com os candidatos.
+    """
     try:
-        print(f"DEBUG atribuir_plantonista: plantao_id={plantao_id}")
-        
         # Validar formato UUID do plantão
         try:
             uuid.UUID(plantao_id)
@@ -562,12 +536,20 @@ def atribuir_plantonista(plantao_id):
             return criar_erro('ID do plantão inválido', 400)
         
         data = request.get_json()
-        print(f"DEBUG atribuir_plantonista: data={data}")
         
         plantonista_id = data.get('plantonista_id')
         
+        if not plantonista_id and data.get('nome'):
+            # Nome digitado: resolvido pelo índice de nomes, sem escolher entre homônimos
+            try:
+                plantonista_id = current_app.busca_nomes.resolver(data['nome'], tipo='plantonista')['plantonista_id']
+            except NomeAmbiguo as e:
+                return criar_resposta(False, str(e), dados={'candidatos': e.candidatos}, codigo=409)
+            except NomeNaoEncontrado as e:
+                return criar_erro(str(e), 404)
+        
         if not plantonista_id:
-            return criar_erro('plantonista_id é obrigatório', 400)
+            return criar_erro('plantonista_id ou nome é obrigatório', 400)
             
         # Validar formato UUID do plantonista
         try:
@@ -578,19 +560,14 @@ def atribuir_plantonista(plantao_id):
         # Operações sem transação dupla
         try:
             plantao = Plantao.query.get(plantao_id)
-            print(f"DEBUG atribuir_plantonista: plantao query result={plantao}")
             
             # CORREÇÃO: O frontend provavelmente está enviando usuario_id, não plantonista_id
             # Primeiro tentar buscar como usuario_id
             plantonista = Plantonista.query.filter_by(usuario_id=plantonista_id).first()
-            print(f"DEBUG atribuir_plantonista: plantonista by usuario_id={plantonista}")
             
             # Se não encontrou, tentar buscar por ID direto (caso seja realmente plantonista_id)
             if not plantonista:
                 plantonista = Plantonista.query.get(plantonista_id)
-                print(f"DEBUG atribuir_plantonista: plantonista direct query={plantonista}")
-            
-            print(f"DEBUG atribuir_plantonista: plantao found={plantao is not None}, plantonista found={plantonista is not None}")
             
             if not plantao:
                 return criar_erro('Plantão não encontrado', 404)
@@ -598,53 +575,13 @@ def atribuir_plantonista(plantao_id):
             if not plantonista:
                 return criar_erro('Plantonista não encontrado. Verifique se o usuário tem registro de plantonista.', 404)
             
-            # Verificar alocação existente - usar o ID correto do plantonista
-            alocacao_existente = Alocacao.query.filter_by(
-                plantao_id=plantao_id,
-                plantonista_id=plantonista.id,  # Usar plantonista.id, não plantonista_id do request
-                status='confirmado'
-            ).first()
-            
-            if alocacao_existente:
-                return criar_erro('Plantonista já está alocado neste plantão', 400)
-                
-            # Verificar se já tem outro plantão no mesmo DIA
-            outro_plantao_dia = Alocacao.query.join(Plantao).filter(
-                Alocacao.plantonista_id == plantonista.id,  # Usar plantonista.id correto
-                Alocacao.status == 'confirmado',
-                Plantao.data == plantao.data
-            ).first()
-            
-            if outro_plantao_dia:
-                return criar_erro('Não é permitido que um plantonista faça dois turnos no mesmo dia', 400)
-            
-            # Verificar se há vagas
-            alocacoes_atuais = Alocacao.query.filter_by(
-                plantao_id=plantao_id, 
-                status='confirmado'
-            ).count()
-            
-            if alocacoes_atuais >= plantao.max_plantonistas:
-                return criar_erro('Plantão já está lotado', 400)
-                
-            alocacao = Alocacao(
-                plantao_id=plantao_id,
-                plantonista_id=plantonista.id,  # Usar o ID correto do plantonista
-                status='confirmado',
-                tipo='atribuido',
-                confirmado_em=datetime.utcnow()
-            )
-            
-            db.session.add(alocacao)
-            
-            # Atualizar status do plantão
-            if (alocacoes_atuais + 1) >= plantao.max_plantonistas:
-                plantao.status = 'confirmado'
-            else:
-                plantao.status = 'reservado'
-            
-            # Commit das alterações
-            db.session.commit()
+            # Atribuição atômica: ocupa a vaga no contador e valida as regras
+            try:
+                alocacao, plantao = atribuir_plantao(plantao.id, plantonista)
+            except ReservaNegada as e:
+                return criar_erro(e.mensagem, e.codigo)
+            invalidate_plantoes_cache(plantao.data)
+            notify_plantoes_delta(plantao)
             
             # Log
             user = get_current_user()
@@ -689,19 +626,20 @@ def remover_alocacao(plantao_id):
         
         if not alocacao:
             return criar_erro('Alocação não encontrada', 404)
-            
-        db.session.delete(alocacao)
         
-        # Atualizar status do plantão
-        plantao = Plantao.query.get(plantao_id)
-        if plantao:
-            plantao.status = 'disponivel'
-            
+        alocacao_id = alocacao.id
+        
+        # Excluir alocação (libera a vaga no contador do plantão)
+        plantao = alocacao.plantao
+        data_plantao = plantao.data
+        liberar_alocacao(alocacao, novo_status=None)
         db.session.commit()
+        invalidate_plantoes_cache(data_plantao)
+        notify_plantoes_delta(plantao)
         
         # Log
         user = get_current_user()
-        log_acao(user.id, 'remover_alocacao', 'alocacoes', alocacao.id)
+        log_acao(user.id, 'remover_alocacao', 'alocacoes', alocacao_id)
         
         return criar_resposta(mensagem='Plantonista removido com sucesso')
         
@@ -1,24 +1,41 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required
 from models import db, Pontuacao, Plantonista, Usuario, Plantao, Alocacao
 from utils.auth import gestor_required, criar_resposta, criar_erro, log_acao, get_current_user
 from utils.pontuacao import CalculadoraPontuacao
-from utils.cache_utils import cached_function, invalidate_rankings_cache, invalidate_stats_cache
+from utils.cache_utils import cached_function, invalidate_rankings_cache, invalidate_stats_cache, ESCOPO_PAPEL
+from utils.tokens import tipo_usuario_atual
+from utils.planilhas import ler_planilha, PlanilhaInvalida
+from utils.websocket import notify_importacao
 from datetime import datetime, date
 import uuid
 
 pontuacao_bp = Blueprint('pontuacao', __name__, url_prefix='/api/pontuacao')
 
+# Campos do ranking visíveis apenas para gestores e admins
+CAMPOS_RESTRITOS_RANKING = ('email', 'preferencias', 'google_calendar_id', 'max_plantoes_mes')
+
 
 @pontuacao_bp.route('/ranking', methods=['GET'])
 @jwt_required()
-@cached_function(timeout=1800, key_prefix='ranking')  # Cache por 30 minutos
+@cached_function(timeout=1800, key_prefix='ranking', tags=['ranking'], escopo=ESCOPO_PAPEL)  # Cache por 30 minutos
 def get_ranking():
-    """Retorna o ranking atual dos plantonistas"""
+    """
+    Retorna o ranking atual dos plantonistas
+
+    A resposta é a mesma para todos de um papel (cache por papel):
+    plantonistas não recebem os dados de contato e de agenda dos colegas.
+    """
     try:
         calc = CalculadoraPontuacao()
         ranking = calc.obter_ranking_atual()
         
+        if tipo_usuario_atual() == 'plantonista':
+            ranking = [
+                {k: v for k, v in p.items() if k not in CAMPOS_RESTRITOS_RANKING}
+                for p in ranking
+            ]
+        
         return criar_resposta(dados={'ranking': ranking})
         
     except Exception as e:
@@ -30,8 +47,10 @@ def get_ranking():
 def calcular_ranking(mes_referencia):
     """Calcula o ranking para um mês específico"""
     try:
-        calc = CalculadoraPontuacao()
-        ranking = calc.calcular_ranking_mes(mes_referencia)
+        # Cálculo completo; recarrega também o placar incremental do mês
+        ranking = current_app.placar.reconciliar(mes_referencia)
+        invalidate_rankings_cache()
+        invalidate_stats_cache()
         
         user = get_current_user()
         log_acao(user.id, 'calcular_ranking', detalhes={'mes': mes_referencia})
@@ -127,6 +146,9 @@ def criar_pontuacao():
             
             db.session.commit()
             
+            # Posições do mês vigente: só as afetadas pela nova pontuação
+            current_app.placar.atualizar(pontuacao)
+            
             # Invalidar cache de rankings após nova pontuação
             invalidate_rankings_cache()
             invalidate_stats_cache()
@@ -158,11 +180,17 @@ def importar_pontuacoes():
         if not mes_referencia or not pontuacoes:
             return criar_erro('mes_referencia e pontuacoes são obrigatórios', 400)
         
+        if not isinstance(pontuacoes, list):
+            return criar_erro('pontuacoes deve ser uma lista', 400)
+        
         calc = CalculadoraPontuacao()
         resultados = calc.importar_pontuacoes_planilha(mes_referencia, pontuacoes)
         
-        # Calcular ranking após importação
-        calc.calcular_ranking_mes(mes_referencia)
+        # Ranking recalculado uma vez, no mesmo commit das pontuações importadas
+        if resultados['sucesso']:
+            current_app.placar.reconciliar(mes_referencia)
+            invalidate_rankings_cache()
+            invalidate_stats_cache()
         
         # Log da ação
         user = get_current_user()
@@ -183,6 +211,90 @@ def importar_pontuacoes():
         return criar_erro(f'Erro ao importar pontuações: {str(e)}', 500)
 
 
+@pontuacao_bp.route('/importar/arquivo', methods=['POST'])
+@gestor_required
+def importar_pontuacoes_arquivo():
+    """
+    Importa pontuações de uma planilha CSV ou XLSX enviada como arquivo
+    
+    A planilha é lida linha a linha e gravada em lotes de IMPORTACAO_LOTE
+    linhas, numa única transação; a cada lote o progresso vai para o
+    socket de quem enviou ('importacao_progresso').
+    
+    Form (multipart):
+        arquivo: Planilha .csv ou .xlsx (colunas nome, vendas, age_bairro_foco...)
+        mes_referencia: Mês no formato AAAA-MM-DD
+        importacao_id: Identificador repetido nos eventos de progresso (opcional)
+    """
+    try:
+        arquivo = request.files.get('arquivo')
+        mes_referencia = request.form.get('mes_referencia')
+        
+        if not arquivo or not mes_referencia:
+            return criar_erro('arquivo e mes_referencia são obrigatórios', 400)
+        
+        try:
+            mes = datetime.strptime(mes_referencia, '%Y-%m-%d').date()
+        except ValueError:
+            return criar_erro('mes_referencia inválido, use AAAA-MM-DD', 400)
+        
+        user = get_current_user()
+        limite_erros = current_app.config['IMPORTACAO_ERROS_MAX']
+        resumo = {
+            'importacao_id': request.form.get('importacao_id') or str(uuid.uuid4()),
+            'processadas': 0,
+            'importadas': 0,
+            'total_erros': 0,
+            'erros': []
+        }
+        
+        def progresso(concluida):
+            notify_importacao(user.id, {
+                'importacao_id': resumo['importacao_id'],
+                'processadas': resumo['processadas'],
+                'importadas': resumo['importadas'],
+                'erros': resumo['total_erros'],
+                'concluida': concluida
+            })
+        
+        calc = CalculadoraPontuacao()
+        try:
+            linhas = ler_planilha(arquivo.stream, arquivo.filename)
+            for parcial in calc.importar_em_lotes(mes, linhas, lote=current_app.config['IMPORTACAO_LOTE']):
+                resumo['processadas'] = parcial['processadas']
+                resumo['importadas'] = parcial['importadas']
+                resumo['total_erros'] += len(parcial['erros'])
+                resumo['erros'] += parcial['erros'][:max(limite_erros - len(resumo['erros']), 0)]
+                progresso(False)
+        except PlanilhaInvalida as e:
+            db.session.rollback()
+            return criar_erro(str(e), 400)
+        
+        # Ranking recalculado uma vez, no mesmo commit de todos os lotes
+        if resumo['importadas']:
+            current_app.placar.reconciliar(mes)
+            invalidate_rankings_cache()
+            invalidate_stats_cache()
+        progresso(True)
+        
+        log_acao(user.id, 'importar_pontuacoes', detalhes={
+            'mes': mes_referencia,
+            'arquivo': arquivo.filename,
+            'total': resumo['processadas'],
+            'sucesso': resumo['importadas'],
+            'erros': resumo['total_erros']
+        })
+        
+        return criar_resposta(
+            mensagem=f"Importação concluída: {resumo['importadas']} plantonistas, {resumo['total_erros']} erros",
+            dados=resumo
+        )
+        
+    except Exception as e:
+        db.session.rollback()
+        return criar_erro(f'Erro ao importar planilha: {str(e)}', 500)
+
+
 @pontuacao_bp.route('/<pontuacao_id>', methods=['DELETE'])
 @gestor_required
 def deletar_pontuacao(pontuacao_id):
@@ -194,13 +306,15 @@ def deletar_pontuacao(pontuacao_id):
             return criar_erro('Pontuação não encontrada', 404)
         
         mes_ref = pontuacao.mes_referencia
+        plantonista_id = pontuacao.plantonista_id
         
         db.session.delete(pontuacao)
         db.session.commit()
         
-        # Recalcular ranking do mês
-        calc = CalculadoraPontuacao()
-        calc.calcular_ranking_mes(mes_ref)
+        # Os colocados abaixo sobem uma posição
+        current_app.placar.remover(plantonista_id, mes_ref)
+        invalidate_rankings_cache()
+        invalidate_stats_cache()
         
         # Log da ação
         user = get_current_user()
@@ -3,6 +3,7 @@ import sys
 from datetime import date, timedelta, datetime
 from models import db, Usuario, Plantonista, Pontuacao, Plantao, Configuracao
 from utils.pontuacao import CalculadoraPontuacao
+from utils.calendario import gerar_plantoes
 from flask_bcrypt import Bcrypt
 
 bcrypt = Bcrypt()
@@ -97,24 +98,10 @@ def populate_db():
     
     # 4. Gerar Plantões (Mês Atual e Próximo)
     print("Gerando escalas de plantão...")
-    def mock_gerar_plantoes(ano, mes):
-        from calendar import monthrange
-        num_dias = monthrange(ano, mes)[1]
-        for dia in range(1, num_dias + 1):
-            data_p = date(ano, mes, dia)
-            if data_p.weekday() == 6: continue # Pula domingo
-            for turno in ['manha', 'tarde']:
-                if not Plantao.query.filter_by(data=data_p, turno=turno).first():
-                    pl = Plantao(data=data_p, turno=turno, status='disponivel', max_plantonistas=2)
-                    db.session.add(pl)
-    
     hoje = date.today()
-    print(f"Gerando para {hoje.month}/{hoje.year}")
-    mock_gerar_plantoes(hoje.year, hoje.month)
-    
     proximo_mes_date = hoje.replace(day=28) + timedelta(days=4)
-    print(f"Gerando para {proximo_mes_date.month}/{proximo_mes_date.year}")
-    mock_gerar_plantoes(proximo_mes_date.year, proximo_mes_date.month)
+    print(f"Gerando plantões de {hoje.month}/{hoje.year} a {proximo_mes_date.month}/{proximo_mes_date.year}")
+    gerar_plantoes(hoje, proximo_mes_date)
     
     print("Finalizando commit...")
     db.session.commit()
@@ -128,7 +115,7 @@ def populate_db():
 
 def seed_data():
     from app import create_app
-    app = create_app('development')
+    app, _ = create_app('development')
     with app.app_context():
         populate_db()
 
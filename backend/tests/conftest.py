@@ -2,8 +2,8 @@
 Fixtures e configurações para testes
 """
 import pytest
-import tempfile
-import os
+from contextlib import contextmanager
+from sqlalchemy import event
 from app import create_app
 from models import db, Usuario, Plantonista, Plantao, Alocacao
 from flask_bcrypt import Bcrypt
@@ -11,25 +11,19 @@ from datetime import date, datetime
 
 
 @pytest.fixture(scope='function')
-def app():
+def app(tmp_path):
     """Fixture para criar app de teste"""
     
-    # Criar banco temporário
-    db_fd, db_path = tempfile.mkstemp()
-    
-    # Configuração de teste
+    # Configuração de teste (banco SQLite em memória e SimpleCache via TestingConfig)
     test_config = {
-        'TESTING': True,
-        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
-        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
         'JWT_SECRET_KEY': 'test-jwt-secret',
         'SECRET_KEY': 'test-secret-key',
-        'CACHE_TYPE': 'simple',  # Usar SimpleCache nos testes
-        'CORS_ORIGINS': ['http://localhost:3000']
+        'CORS_ORIGINS': ['http://localhost:3000'],
+        'LOGS_ARQUIVO_DIR': str(tmp_path / 'arquivo_logs')
     }
     
     # Criar app de teste
-    app = create_app('development')
+    app, _ = create_app('testing')
     app.config.update(test_config)
     
     # Configurar contexto
@@ -79,8 +73,6 @@ def app():
         plantao = Plantao(
             data=date.today(),
             turno='manha',
-            tipo='vendas',
-            local='Loja Centro',
             max_plantonistas=2,
             status='disponivel'
         )
@@ -91,8 +83,31 @@ def app():
     yield app
     
     # Cleanup
-    os.close(db_fd)
-    os.unlink(db_path)
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def contador_queries(app):
+    """Fixture para contar as queries SQL emitidas dentro de um bloco"""
+    with app.app_context():
+        engine = db.engine
+    
+    @contextmanager
+    def contar():
+        queries = []
+        
+        def registrar(conn, cursor, statement, parameters, context, executemany):
+            queries.append(statement)
+        
+        event.listen(engine, 'before_cursor_execute', registrar)
+        try:
+            yield queries
+        finally:
+            event.remove(engine, 'before_cursor_execute', registrar)
+    
+    return contar
 
 
 @pytest.fixture
@@ -107,12 +122,12 @@ def auth_headers(client):
     # Login como plantonista
     response = client.post('/api/auth/login', json={
         'email': 'plantonista@test.com',
-        'password': '123456'
+        'senha': '123456'
     })
     
     assert response.status_code == 200
     data = response.get_json()
-    token = data['token']
+    token = data['dados']['access_token']
     
     return {'Authorization': f'Bearer {token}'}
 
@@ -123,12 +138,12 @@ def gestor_headers(client):
     # Login como gestor
     response = client.post('/api/auth/login', json={
         'email': 'gestor@test.com',
-        'password': '123456'
+        'senha': '123456'
     })
     
     assert response.status_code == 200
     data = response.get_json()
-    token = data['token']
+    token = data['dados']['access_token']
     
     return {'Authorization': f'Bearer {token}'}
 
@@ -139,11 +154,11 @@ def admin_headers(client):
     # Login como admin
     response = client.post('/api/auth/login', json={
         'email': 'admin@test.com',
-        'password': '123456'
+        'senha': '123456'
     })
     
     assert response.status_code == 200
     data = response.get_json()
-    token = data['token']
+    token = data['dados']['access_token']
     
     return {'Authorization': f'Bearer {token}'}
\ No newline at end of file
@@ -50,4 +50,170 @@ class TestAuth:
     def test_protected_endpoint_with_token(self, client, auth_headers):
         """Teste de endpoint protegido com token válido"""
         response = client.get('/api/plantoes', headers=auth_headers)
-        assert response.status_code == 200
\ No newline at end of file
+        assert response.status_code == 200
+
+class TestTokens:
+    
+    def _login(self, client, email):
+        response = client.post('/api/auth/login', json={'email': email, 'senha': '123456'})
+        assert response.status_code == 200
+        return response.get_json()['dados']
+    
+    def test_login_inclui_claims(self, client, app):
+        """Access token carrega tipo, plantonista_id e versão"""
+        from flask_jwt_extended import decode_token
+        from models import Plantonista
+        
+        dados = self._login(client, 'plantonista@test.com')
+        
+        with app.app_context():
+            claims = decode_token(dados['access_token'])
+            plantonista = Plantonista.query.first()
+            
+            assert claims['tipo'] == 'plantonista'
+            assert claims['plantonista_id'] == str(plantonista.id)
+            assert claims['versao'] == 0
+    
+    def test_permissao_sem_consultar_banco(self, app, client, gestor_headers, contador_queries):
+        """gestor_required decide pelo claim, sem consultas SQL"""
+        from utils.auth import gestor_required, admin_required
+        
+        @gestor_required
+        def rota_gestor():
+            return 'ok'
+        
+        @admin_required
+        def rota_admin():
+            return 'ok'
+        
+        with app.test_request_context(headers=gestor_headers):
+            with contador_queries() as queries:
+                assert rota_gestor() == 'ok'
+                assert rota_admin()[1] == 403
+            
+            assert queries == []
+    
+    def test_mudanca_de_papel_revoga_tokens(self, client, app):
+        """Rebaixar um gestor invalida o token emitido antes da mudança"""
+        dados = self._login(client, 'gestor@test.com')
+        headers = {'Authorization': f"Bearer {dados['access_token']}"}
+        
+        assert client.get('/api/auth/usuarios', headers=headers).status_code == 200
+        
+        with app.app_context():
+            gestor = Usuario.query.filter_by(email='gestor@test.com').first()
+            gestor.tipo = 'plantonista'
+            db.session.commit()
+            assert gestor.token_versao == 1
+        
+        assert client.get('/api/auth/usuarios', headers=headers).status_code == 401
+        
+        refresh = client.post('/api/auth/refresh', headers={'Authorization': f"Bearer {dados['refresh_token']}"})
+        assert refresh.status_code == 401
+        
+        novo = self._login(client, 'gestor@test.com')
+        response = client.get('/api/auth/usuarios', headers={'Authorization': f"Bearer {novo['access_token']}"})
+        assert response.status_code == 403
+    
+    def test_troca_de_senha_encerra_outras_sessoes(self, client):
+        """Alterar a senha revoga tokens antigos e devolve tokens novos"""
+        dados = self._login(client, 'plantonista@test.com')
+        antigo = {'Authorization': f"Bearer {dados['access_token']}"}
+        
+        response = client.post('/api/auth/change-password', headers=antigo, json={
+            'senha_atual': '123456',
+            'senha_nova': '654321'
+        })
+        assert response.status_code == 200
+        novo = {'Authorization': f"Bearer {response.get_json()['dados']['access_token']}"}
+        
+        assert client.get('/api/auth/me', headers=antigo).status_code == 401
+        assert client.get('/api/auth/me', headers=novo).status_code == 200
+
+
+class TestBuscaUsuarios:
+    
+    REGISTROS = [
+        ('u1', 'p1', 'Ana Costa', 'ana.costa@test.com', 'plantonista', True),
+        ('u2', 'p2', 'Ana Souza', 'asouza@test.com', 'plantonista', True),
+        ('u3', 'p3', 'Mariana Lima', 'mlima@test.com', 'plantonista', True),
+        ('u4', None, 'João Gestor', 'joao@test.com', 'gestor', True),
+    ]
+    
+    def test_acentos_prefixos_e_erros_de_digitacao(self):
+        from utils.busca_nomes import IndiceNomes
+        indice = IndiceNomes(self.REGISTROS)
+        
+        assert indice.resolver('  ana   COSTA ')['usuario_id'] == 'u1'
+        assert indice.resolver('JOAO')['usuario_id'] == 'u4'
+        assert indice.resolver('asouza@test.com')['usuario_id'] == 'u2'
+        assert indice.resolver('Marianna Lima')['usuario_id'] == 'u3'
+        assert [c['nome'] for c in indice.buscar('mari')] == ['Mariana Lima']
+    
+    def test_ambiguidade_informada_com_candidatos(self):
+        from utils.busca_nomes import IndiceNomes, NomeAmbiguo, NomeNaoEncontrado
+        indice = IndiceNomes(self.REGISTROS)
+        
+        # 'Ana' não fica com o primeiro cadastro: Mariana não conta, as duas Anas sim
+        with pytest.raises(NomeAmbiguo) as erro:
+            indice.resolver('Ana')
+        assert {c['usuario_id'] for c in erro.value.candidatos} == {'u1', 'u2'}
+        
+        with pytest.raises(NomeNaoEncontrado):
+            indice.resolver('João', tipo='plantonista')
+    
+    def test_busca_por_api_acompanha_o_cadastro(self, client, gestor_headers, auth_headers):
+        def buscar(q):
+            response = client.get('/api/auth/usuarios/buscar', headers=gestor_headers, query_string={'q': q})
+            assert response.status_code == 200
+            return response.get_json()['dados']
+        
+        assert buscar('Beatriz')['candidatos'] == []
+        
+        for nome, email in [('Beatriz Ramos', 'bramos@test.com'), ('Beatriz Alves', 'balves@test.com')]:
+            response = client.post('/api/auth/register', json={'nome': nome, 'email': email, 'senha': '123456'})
+            assert response.status_code == 201
+            
+            dados = buscar('beatriz')
+            if nome == 'Beatriz Ramos':
+                assert dados['resolvido']['nome'] == 'Beatriz Ramos' and dados['ambiguo'] is False
+        
+        assert dados['resolvido'] is None and dados['ambiguo'] is True
+        assert [c['nome'] for c in dados['candidatos']] == ['Beatriz Alves', 'Beatriz Ramos']
+        assert buscar('Beatris Alves')['resolvido']['email'] == 'balves@test.com'
+        
+        assert client.get('/api/auth/usuarios/buscar', headers=gestor_headers).status_code == 400
+        assert client.get('/api/auth/usuarios/buscar?q=ana', headers=auth_headers).status_code == 403
+    
+    def test_renomear_remonta_o_indice(self, app):
+        with app.app_context():
+            assert app.busca_nomes.resolver('Plantonista Teste')['email'] == 'plantonista@test.com'
+            montagens = app.busca_nomes.metricas()['montagens']
+            
+            Usuario.query.filter_by(email='plantonista@test.com').first().nome = 'Zélia Prado'
+            db.session.commit()
+            
+            assert app.busca_nomes.resolver('zelia prado')['email'] == 'plantonista@test.com'
+            assert app.busca_nomes.metricas()['montagens'] == montagens + 1
+    
+    def test_consulta_abaixo_de_um_milissegundo(self):
+        import time
+        from utils.busca_nomes import IndiceNomes
+        
+        primeiros = ['Ana', 'Bruno', 'Carla', 'Daniel', 'Eduarda', 'Fernando', 'Gabriela', 'Henrique', 'Isabela', 'Lucas']
+        sobrenomes = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Ferreira', 'Alves', 'Pereira', 'Lima', 'Gomes', 'Costa']
+        registros = [
+            (f'u{i}', f'p{i}', f'{primeiros[i % 10]} {sobrenomes[i // 10 % 10]} {sobrenomes[i // 100 % 10]}',
+             f'usuario{i}@test.com', 'plantonista', True)
+            for i in range(2000)
+        ]
+        indice = IndiceNomes(registros)
+        consultas = ['Gabriela Lima Costa', 'Henrique Perera', 'isabela', 'usuario42@test.com', 'Bruno S']
+        
+        inicio = time.perf_counter()
+        for _ in range(100):
+            for consulta in consultas:
+                indice.buscar(consulta)
+        media = (time.perf_counter() - inicio) / (100 * len(consultas))
+        
+        assert media < 0.001
@@ -0,0 +1,151 @@
+"""
+Testes para o cache em duas camadas
+"""
+import time
+from types import SimpleNamespace
+import pytest
+from utils.cache_camadas import CacheDuasCamadas, BarramentoLocal, Disjuntor
+
+
+class RedisFalso:
+    """L2 em dicionário que conta acessos e pode simular queda"""
+    
+    def __init__(self):
+        self.dados = {}
+        self.acessos = 0
+        self.fora_do_ar = False
+    
+    def _acessar(self):
+        self.acessos += 1
+        if self.fora_do_ar:
+            raise ConnectionError('Redis indisponível')
+    
+    def get(self, chave):
+        self._acessar()
+        return self.dados.get(chave)
+    
+    def get_many(self, *chaves):
+        self._acessar()
+        return [self.dados.get(c) for c in chaves]
+    
+    def set(self, chave, valor, timeout=None):
+        self._acessar()
+        self.dados[chave] = valor
+        return True
+    
+    def delete(self, chave):
+        self._acessar()
+        return self.dados.pop(chave, None) is not None
+    
+    def inc(self, chave, delta=1):
+        self._acessar()
+        self.dados[chave] = int(self.dados.get(chave) or 0) + delta
+        return self.dados[chave]
+    
+    def add(self, chave, valor, timeout=None):
+        self._acessar()
+        if chave in self.dados:
+            return False
+        self.dados[chave] = valor
+        return True
+
+
+def criar_worker(redis, barramento, **config):
+    app = SimpleNamespace(config={
+        'CACHE_TYPE': 'redis',
+        'CACHE_BARRAMENTO': 'local',
+        'CACHE_L1_MAX': 100,
+        'CACHE_L1_TTL': 60,
+        'CACHE_DISJUNTOR_FALHAS': 2,
+        'CACHE_DISJUNTOR_PAUSA': 60,
+        **config
+    })
+    return CacheDuasCamadas(app, redis, barramento=barramento)
+
+
+class TestCacheDuasCamadas:
+    
+    @pytest.fixture
+    def redis(self):
+        return RedisFalso()
+    
+    @pytest.fixture
+    def barramento(self):
+        return BarramentoLocal()
+    
+    def test_leitura_repetida_nao_vai_ao_redis(self, redis, barramento):
+        cache = criar_worker(redis, barramento)
+        redis.dados['chave'] = 'valor'
+        
+        assert cache.get('chave') == 'valor'
+        acessos = redis.acessos
+        assert cache.get('chave') == 'valor'
+        assert cache.get_many('chave') == ['valor']
+        
+        assert redis.acessos == acessos
+        metricas = cache.metricas()
+        assert metricas['l1']['hits'] == 2
+        assert metricas['l2']['hits'] == 1
+    
+    def test_escrita_invalida_l1_dos_outros_workers(self, redis, barramento):
+        worker_a = criar_worker(redis, barramento)
+        worker_b = criar_worker(redis, barramento)
+        
+        worker_a.set('tag:plantoes', 1, timeout=0)
+        assert worker_b.get('tag:plantoes') == 1
+        
+        worker_a.inc('tag:plantoes')
+        
+        assert worker_b.get('tag:plantoes') == 2
+        assert worker_b.metricas()['barramento']['recebidas'] == 2
+        assert worker_a.metricas()['barramento']['recebidas'] == 0
+    
+    def test_lru_limita_itens(self, redis, barramento):
+        cache = criar_worker(redis, barramento, CACHE_L1_MAX=3)
+        for i in range(5):
+            cache.set(f'k{i}', i)
+        
+        metricas = cache.metricas()['l1']
+        assert metricas['itens'] == 3
+        assert metricas['evictions'] == 2
+    
+    def test_l1_expira_pelo_ttl(self, redis, barramento):
+        cache = criar_worker(redis, barramento, CACHE_L1_TTL=0.05)
+        cache.set('chave', 'v1')
+        redis.dados['chave'] = 'v2'
+        
+        assert cache.get('chave') == 'v1'
+        time.sleep(0.06)
+        assert cache.get('chave') == 'v2'
+    
+    def test_disjuntor_abre_e_cache_segue_local(self, redis, barramento):
+        cache = criar_worker(redis, barramento)
+        cache.set('chave', 'valor')
+        redis.fora_do_ar = True
+        
+        assert cache.get('ausente') is None
+        assert cache.get('outra') is None
+        assert cache.metricas()['disjuntor']['estado'] == Disjuntor.ABERTO
+        
+        # Com o disjuntor aberto o Redis não é mais consultado
+        acessos = redis.acessos
+        assert cache.get('chave') == 'valor'
+        assert cache.inc('tag:x') == 1
+        assert cache.add('trava:k', 1, timeout=30) is True
+        assert cache.add('trava:k', 1, timeout=30) is False
+        assert redis.acessos == acessos
+    
+    def test_disjuntor_fecha_e_limpa_l1(self, redis, barramento):
+        cache = criar_worker(redis, barramento, CACHE_DISJUNTOR_PAUSA=0)
+        cache.set('chave', 'antigo')
+        redis.fora_do_ar = True
+        cache.get('x')
+        cache.get('y')
+        
+        # Redis volta com um valor que o L1 não viu ser invalidado
+        redis.fora_do_ar = False
+        redis.dados['chave'] = 'novo'
+        cache.get('z')
+        
+        assert cache.metricas()['disjuntor']['estado'] == Disjuntor.FECHADO
+        assert cache.get('chave') == 'novo'
@@ -0,0 +1,224 @@
+"""
+Testes para o log de auditoria
+"""
+import os
+import pytest
+from datetime import datetime, timedelta
+from dateutil.relativedelta import relativedelta
+from models import Log, Plantao, Usuario, db
+from utils.arquivo_logs import arquivar_logs, listar_segmentos
+
+
+class TestAuditoria:
+    
+    def test_escolher_plantao_nao_grava_log_na_requisicao(self, client, auth_headers, app, contador_queries):
+        """A escolha só enfileira a auditoria; o INSERT sai no lote do worker"""
+        with app.app_context():
+            plantao_id = Plantao.query.filter_by(status='disponivel').first().id
+        
+        with contador_queries() as queries:
+            response = client.post(f'/api/plantoes/{plantao_id}/escolher', headers=auth_headers)
+        
+        assert response.status_code == 201
+        assert not any('INSERT INTO logs' in q for q in queries)
+        
+        with app.app_context():
+            assert app.auditoria.metricas()['pendentes'] >= 1
+            assert Log.query.filter_by(acao='escolher_plantao').count() == 0
+            
+            with contador_queries() as queries:
+                app.auditoria.descarregar()
+            
+            assert len([q for q in queries if 'INSERT INTO logs' in q]) == 1
+            assert Log.query.filter_by(acao='escolher_plantao').count() == 1
+            assert app.auditoria.metricas()['pendentes'] == 0
+    
+    def test_descarregar_em_lotes(self, app, contador_queries):
+        """Registros são gravados em INSERTs de até AUDITORIA_LOTE linhas"""
+        with app.app_context():
+            usuario_id = Usuario.query.first().id
+            app.config['AUDITORIA_LOTE'] = 200
+            
+            for i in range(450):
+                app.auditoria.registrar(usuario_id, 'teste_lote', detalhes={'i': i})
+            
+            with contador_queries() as queries:
+                gravados = app.auditoria.descarregar()
+            
+            metricas = app.auditoria.metricas()
+            assert gravados == 450
+            assert len([q for q in queries if 'INSERT INTO logs' in q]) == 3
+            assert metricas['gravados'] == 450
+            assert metricas['lotes'] == 3
+            assert Log.query.filter_by(acao='teste_lote').count() == 450
+    
+    def test_registro_invalido_nao_perde_o_lote(self, app):
+        """Se o lote falha, os registros válidos são gravados um a um"""
+        with app.app_context():
+            app.auditoria.registrar(None, 'valido_1')
+            app.auditoria.registrar(None, None)
+            app.auditoria.registrar(None, 'valido_2')
+            
+            assert app.auditoria.descarregar() == 2
+            
+            metricas = app.auditoria.metricas()
+            assert metricas['falhas'] == 1
+            assert metricas['descartados'] == 1
+            assert Log.query.filter(Log.acao.like('valido_%')).count() == 2
+    
+    def test_worker_descarrega_no_encerramento(self, app):
+        """Com o worker ativo, encerrar() grava o que ficou no buffer"""
+        with app.app_context():
+            app.config['AUDITORIA_ASSINCRONA'] = True
+            app.config['AUDITORIA_INTERVALO'] = 60
+            
+            for _ in range(5):
+                app.auditoria.registrar(None, 'teste_worker')
+            
+            app.auditoria.encerrar()
+            
+            assert app.auditoria.metricas()['pendentes'] == 0
+            assert Log.query.filter_by(acao='teste_worker').count() == 5
+
+
+class TestListagemLogs:
+    
+    @pytest.fixture
+    def logs_gerados(self, app):
+        """Grava 25 logs de ações variadas"""
+        with app.app_context():
+            usuario_id = Usuario.query.first().id
+            for i in range(25):
+                acao = 'atribuir_plantonista' if i % 2 else 'remover_alocacao'
+                app.auditoria.registrar(usuario_id, acao, 'alocacoes', detalhes={'i': i})
+            app.auditoria.descarregar()
+    
+    def test_paginacao_por_cursor_percorre_todos(self, client, gestor_headers, logs_gerados):
+        """Seguindo proximo_cursor, todos os logs aparecem uma única vez, em ordem"""
+        vistos = []
+        cursor = None
+        while True:
+            params = {'per_page': 10, 'tabela': 'alocacoes'}
+            if cursor:
+                params['cursor'] = cursor
+            response = client.get('/api/logs', headers=gestor_headers, query_string=params)
+            assert response.status_code == 200
+            dados = response.get_json()['dados']
+            vistos.extend(dados['logs'])
+            cursor = dados['proximo_cursor']
+            if not dados['tem_mais']:
+                break
+        
+        assert len(vistos) == 25
+        assert len({l['id'] for l in vistos}) == 25
+        chaves = [(l['created_at'], l['id']) for l in vistos]
+        assert chaves == sorted(chaves, reverse=True)
+    
+    def test_pagina_sem_count(self, client, gestor_headers, logs_gerados, contador_queries):
+        """Sem total=1 a página não executa COUNT"""
+        with contador_queries() as queries:
+            response = client.get('/api/logs?per_page=5', headers=gestor_headers)
+        
+        assert response.status_code == 200
+        assert not any('count(' in q.lower() for q in queries)
+        assert 'total_aproximado' not in response.get_json()['dados']
+    
+    def test_filtro_acao_por_prefixo(self, client, gestor_headers, logs_gerados):
+        """acao filtra pelo início do nome da ação"""
+        response = client.get('/api/logs?acao=atribuir&total=1&per_page=100', headers=gestor_headers)
+        dados = response.get_json()['dados']
+        
+        assert len(dados['logs']) == 12
+        assert all(l['acao'] == 'atribuir_plantonista' for l in dados['logs'])
+        assert dados['total_aproximado'] == 12
+        
+        response = client.get('/api/logs?acao=plantonista', headers=gestor_headers)
+        assert response.get_json()['dados']['logs'] == []
+    
+    def test_cursor_invalido(self, client, gestor_headers):
+        response = client.get('/api/logs?cursor=nao-e-cursor', headers=gestor_headers)
+        assert response.status_code == 400
+
+
+class TestArquivoLogs:
+    
+    @pytest.fixture
+    def logs_antigos(self, app):
+        """10 logs de um mês fora da janela ativa e 5 do mês atual"""
+        with app.app_context():
+            usuario_id = Usuario.query.first().id
+            antigo = datetime.utcnow().replace(day=15) - relativedelta(months=6)
+            for i in range(10):
+                db.session.add(Log(usuario_id=usuario_id, acao='login', tabela=None,
+                                   created_at=antigo + timedelta(minutes=i)))
+            for i in range(5):
+                db.session.add(Log(usuario_id=usuario_id, acao='atribuir_plantonista', tabela='alocacoes'))
+            db.session.commit()
+            return antigo
+    
+    def test_arquivar_exporta_e_remove_do_banco(self, app, logs_antigos):
+        with app.app_context():
+            segmentos = arquivar_logs(meses_ativos=3)
+            
+            assert len(segmentos) == 1
+            assert segmentos[0]['total'] == 10
+            assert segmentos[0]['acoes'] == {'login': 10}
+            assert Log.query.count() == 5
+            
+            # Segmento e índice lateral no diretório de arquivo
+            arquivos = sorted(os.listdir(app.config['LOGS_ARQUIVO_DIR']))
+            nome = f"logs_{logs_antigos:%Y_%m}"
+            assert arquivos == [f'{nome}.json', f'{nome}.jsonl.gz']
+            
+            # Nova execução não tem o que arquivar
+            assert arquivar_logs(meses_ativos=3) == []
+    
+    def test_segmentos_nao_sao_reescritos(self, app, logs_antigos):
+        """Registros tardios de um mês arquivado viram um novo segmento"""
+        with app.app_context():
+            arquivar_logs(meses_ativos=3)
+            db.session.add(Log(acao='tardio', created_at=logs_antigos))
+            db.session.commit()
+            
+            segmentos = arquivar_logs(meses_ativos=3)
+            
+            assert segmentos[0]['segmento'] == f"logs_{logs_antigos:%Y_%m}.2.jsonl.gz"
+            assert len(listar_segmentos()) == 2
+    
+    def test_cursor_salta_para_o_bloco(self, app, logs_antigos, monkeypatch):
+        """Páginas profundas começam a leitura no bloco do cursor, com o mesmo resultado"""
+        import utils.arquivo_logs as arquivo_logs
+        from datetime import datetime as dt
+        monkeypatch.setattr(arquivo_logs, 'LINHAS_POR_BLOCO', 3)
+        
+        with app.app_context():
+            indice, = arquivar_logs(meses_ativos=3)
+            assert len(indice['blocos']) == 4
+            assert indice['blocos'][0]['offset'] == 0
+            
+            todos = arquivo_logs.buscar_arquivados(100)
+            posicao = (dt.fromisoformat(todos[7]['created_at']), todos[7]['id'])
+            assert arquivo_logs._inicio_leitura(indice, posicao) == indice['blocos'][2]['offset']
+            assert arquivo_logs.buscar_arquivados(100, posicao=posicao) == todos[8:]
+    
+    def test_listagem_le_banco_e_arquivo(self, app, client, gestor_headers, logs_antigos):
+        """GET /api/logs pagina pelo banco e pelos segmentos sem lacunas"""
+        with app.app_context():
+            arquivar_logs(meses_ativos=3)
+        
+        vistos = []
+        params = {'per_page': 4, 'total': 1}
+        while True:
+            dados = client.get('/api/logs', headers=gestor_headers, query_string=params).get_json()['dados']
+            vistos.extend(dados['logs'])
+            if not dados['tem_mais']:
+                break
+            params = {'per_page': 4, 'cursor': dados['proximo_cursor']}
+        
+        acoes = [l['acao'] for l in vistos]
+        assert acoes == ['atribuir_plantonista'] * 5 + ['login'] * 10
+        
+        response = client.get('/api/logs?acao=log&total=1', headers=gestor_headers)
+        dados = response.get_json()['dados']
+        assert len(dados['logs']) == 10
+        assert dados['total_aproximado'] == 10
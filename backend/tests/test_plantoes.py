@@ -1,6 +1,7 @@
 """
 Testes para endpoints de plantões
 """
+import time
 import pytest
 from models import Plantao, Alocacao, db
 from datetime import date, timedelta
@@ -97,6 +98,26 @@ class TestPlantoes:
             # Deve funcionar agora com a correção do usuario_id
             assert response.status_code == 200
     
+    def test_atribuir_plantonista_por_nome(self, client, gestor_headers, app):
+        """Nome digitado é resolvido pelo índice; homônimos respondem 409 com os candidatos"""
+        from models import Usuario, Plantonista
+        with app.app_context():
+            plantao_id = Plantao.query.filter_by(status='disponivel').first().id
+            for nome in ['Paula Reis', 'Paula Rocha']:
+                usuario = Usuario(nome=nome, email=f"{nome.split()[1].lower()}@test.com", senha='x', tipo='plantonista')
+                db.session.add(usuario)
+                db.session.flush()
+                db.session.add(Plantonista(usuario_id=usuario.id))
+            db.session.commit()
+        
+        response = client.post(f'/api/plantoes/{plantao_id}/atribuir', headers=gestor_headers, json={'nome': 'Paula'})
+        assert response.status_code == 409
+        assert {c['nome'] for c in response.get_json()['dados']['candidatos']} == {'Paula Reis', 'Paula Rocha'}
+        
+        response = client.post(f'/api/plantoes/{plantao_id}/atribuir', headers=gestor_headers, json={'nome': 'paula rocha'})
+        assert response.status_code == 200
+        assert response.get_json()['dados']['alocacao']['plantonista_nome'] == 'Paula Rocha'
+    
     def test_atribuir_plantonista_as_plantonista_should_fail(self, client, auth_headers, app):
         """Teste para plantonista tentar atribuir (deve falhar)"""
         with app.app_context():
@@ -110,4 +131,767 @@ class TestPlantoes:
                 json={'plantonista_id': str(plantonista.id)}
             )
             
-            assert response.status_code == 403  # Acesso negado
\ No newline at end of file
+            assert response.status_code == 403  # Acesso negado
+
+class TestCalendario:
+    
+    def _popular_mes(self, app, ano=2030, mes=3, plantonistas=4):
+        """Cria um mês de plantões com duas alocações por plantão"""
+        from models import Usuario, Plantonista
+        from calendar import monthrange
+        
+        with app.app_context():
+            ids = []
+            for i in range(plantonistas):
+                u = Usuario(nome=f'Calendario {i}', email=f'cal{i}@test.com', senha='x', tipo='plantonista')
+                db.session.add(u)
+                db.session.flush()
+                p = Plantonista(usuario_id=u.id)
+                db.session.add(p)
+                db.session.flush()
+                ids.append(p.id)
+            
+            total = 0
+            for dia in range(1, monthrange(ano, mes)[1] + 1):
+                for turno in ['manha', 'tarde']:
+                    plantao = Plantao(data=date(ano, mes, dia), turno=turno, max_plantonistas=2, ocupadas=1)
+                    db.session.add(plantao)
+                    db.session.flush()
+                    for j in range(2):
+                        db.session.add(Alocacao(
+                            plantao_id=plantao.id,
+                            plantonista_id=ids[(dia + j) % plantonistas],
+                            status='confirmado' if j == 0 else 'cancelado'
+                        ))
+                    total += 1
+            db.session.commit()
+        return total
+    
+    def test_carregar_calendario_numero_fixo_de_queries(self, app, contador_queries):
+        """Carregar um mês inteiro não depende do número de plantões"""
+        from utils.calendario import carregar_calendario, MAX_QUERIES_CALENDARIO
+        
+        total = self._popular_mes(app)
+        
+        with app.app_context():
+            with contador_queries() as queries:
+                plantoes = carregar_calendario(date(2030, 3, 1), date(2030, 3, 31))
+            
+            assert len(plantoes) == total
+            assert len(queries) <= MAX_QUERIES_CALENDARIO
+            assert all(a['plantonista_nome'] for p in plantoes for a in p['alocacoes'])
+    
+    def test_carregar_calendario_apenas_confirmadas(self, app):
+        """get_plantoes lista apenas alocações confirmadas"""
+        from utils.calendario import carregar_calendario
+        
+        self._popular_mes(app)
+        
+        with app.app_context():
+            plantoes = carregar_calendario(date(2030, 3, 1), date(2030, 3, 31), apenas_confirmadas=True)
+            
+            assert all(len(p['alocacoes']) == 1 for p in plantoes)
+            assert all(p['alocacoes_count'] == 1 for p in plantoes)
+            assert all(p['vagas_disponiveis'] == 1 for p in plantoes)
+    
+    def test_get_plantoes_mes_sem_duplicatas(self, client, auth_headers, app, contador_queries):
+        """Rota do mês retorna cada plantão uma vez em número fixo de queries"""
+        from utils.calendario import MAX_QUERIES_CALENDARIO
+        
+        total = self._popular_mes(app)
+        
+        with contador_queries() as queries:
+            response = client.get('/api/plantoes/mes/2030/3', headers=auth_headers)
+        
+        assert response.status_code == 200
+        plantoes = response.get_json()['dados']['plantoes']
+        assert len(plantoes) == total
+        assert len({p['id'] for p in plantoes}) == total
+        assert len(queries) <= MAX_QUERIES_CALENDARIO
+
+
+class TestGeracaoPlantoes:
+    
+    def test_gerar_ano_inteiro_em_lote(self, app, contador_queries):
+        """Um ano de plantões sai de um número fixo de queries e não duplica"""
+        from utils.calendario import gerar_plantoes
+        
+        with app.app_context():
+            with contador_queries() as queries:
+                resultado = gerar_plantoes(date(2031, 1, 1), date(2031, 12, 1))
+            db.session.commit()
+            
+            # 2031: 365 dias, 52 domingos -> 313 dias x 2 turnos
+            assert resultado['criados'] == 626
+            assert resultado['existentes'] == 0
+            # Configuração, existentes, 2 lotes de INSERT e um INSERT…SELECT do feed de alterações
+            assert len(queries) <= 5
+            assert Plantao.query.filter(Plantao.data >= date(2031, 1, 1)).count() == 626
+            assert not any(p.data.weekday() == 6 for p in Plantao.query.filter(Plantao.data >= date(2031, 1, 1)))
+            
+            repetido = gerar_plantoes(date(2031, 3, 15), date(2031, 4, 1))
+            db.session.commit()
+            
+            assert repetido['criados'] == 0
+            assert repetido['existentes'] == 104
+    
+    def test_gerar_usa_configuracao(self, app):
+        """Turnos e dias de funcionamento vêm da tabela configuracoes"""
+        from models import Configuracao
+        from utils.calendario import gerar_plantoes
+        
+        with app.app_context():
+            db.session.add(Configuracao(chave='turnos', valor={'manha': {'inicio': '09:00', 'fim': '13:00'}}))
+            db.session.add(Configuracao(chave='dias_funcionamento', valor=['segunda', 'quarta']))
+            db.session.commit()
+            
+            resultado = gerar_plantoes(date(2031, 9, 1))
+            db.session.commit()
+            
+            # Setembro/2031: 5 segundas e 4 quartas
+            assert resultado['criados'] == 9
+            assert {p.turno for p in Plantao.query.filter(Plantao.data >= date(2031, 9, 1))} == {'manha'}
+    
+    def test_rota_gerar_mes_aceita_intervalo(self, client, gestor_headers, app):
+        """POST /gerar-mes aceita ano/mês, ano inteiro ou intervalo inicio/fim"""
+        response = client.post('/api/plantoes/gerar-mes', headers=gestor_headers,
+                               json={'inicio': '2031-11', 'fim': '2032-01'})
+        assert response.status_code == 201
+        dados = response.get_json()['dados']
+        assert dados['inicio'] == '2031-11-01'
+        assert dados['fim'] == '2032-01-31'
+        
+        response = client.post('/api/plantoes/gerar-mes', headers=gestor_headers, json={'ano': 2031, 'mes': 12})
+        assert response.status_code == 201
+        assert response.get_json()['dados']['criados'] == 0
+        
+        response = client.post('/api/plantoes/gerar-mes', headers=gestor_headers,
+                               json={'inicio': '2031-05', 'fim': '2031-01'})
+        assert response.status_code == 400
+        
+        response = client.post('/api/plantoes/gerar-mes', headers=gestor_headers, json={})
+        assert response.status_code == 400
+
+
+class TestReservas:
+    
+    def _criar_plantonistas(self, quantidade, max_plantoes_mes=13):
+        from models import Usuario, Plantonista
+        
+        plantonistas = []
+        for i in range(quantidade):
+            u = Usuario(nome=f'Reserva {i}', email=f'reserva{i}@test.com', senha='x', tipo='plantonista')
+            db.session.add(u)
+            db.session.flush()
+            p = Plantonista(usuario_id=u.id, max_plantoes_mes=max_plantoes_mes)
+            db.session.add(p)
+            plantonistas.append(p)
+        db.session.commit()
+        return plantonistas
+    
+    def test_reserva_respeita_capacidade(self, app):
+        """Terceiro plantonista não entra em plantão de duas vagas"""
+        from utils.reservas import reservar_plantao, ReservaNegada
+        
+        with app.app_context():
+            p1, p2, p3 = self._criar_plantonistas(3)
+            plantao = Plantao(data=date(2030, 5, 6), turno='manha', max_plantonistas=2)
+            db.session.add(plantao)
+            db.session.commit()
+            
+            reservar_plantao(plantao.id, p1)
+            _, atualizado = reservar_plantao(plantao.id, p2)
+            assert atualizado.status == 'confirmado'
+            
+            with pytest.raises(ReservaNegada):
+                reservar_plantao(plantao.id, p3)
+            
+            assert Alocacao.query.filter_by(plantao_id=plantao.id, status='confirmado').count() == 2
+    
+    def test_reserva_mesmo_dia_e_limite_mensal(self, app):
+        """Regras de mesmo dia e limite mensal vêm da mesma consulta"""
+        from utils.reservas import reservar_plantao, ReservaNegada
+        
+        with app.app_context():
+            (p1,) = self._criar_plantonistas(1, max_plantoes_mes=2)
+            manha = Plantao(data=date(2030, 5, 6), turno='manha', max_plantonistas=2)
+            tarde = Plantao(data=date(2030, 5, 6), turno='tarde', max_plantonistas=2)
+            outros = [Plantao(data=date(2030, 5, d), turno='manha', max_plantonistas=2) for d in (7, 8)]
+            db.session.add_all([manha, tarde] + outros)
+            db.session.commit()
+            
+            reservar_plantao(manha.id, p1)
+            
+            with pytest.raises(ReservaNegada, match='mesmo dia'):
+                reservar_plantao(tarde.id, p1)
+            
+            reservar_plantao(outros[0].id, p1)
+            
+            with pytest.raises(ReservaNegada, match='limite de 2'):
+                reservar_plantao(outros[1].id, p1)
+    
+    def test_reserva_trava_plantao_antes_de_contar(self, app, contador_queries):
+        """Primeira instrução da reserva é o lock da linha do plantão"""
+        from utils.reservas import reservar_plantao
+        
+        with app.app_context():
+            (p1,) = self._criar_plantonistas(1)
+            plantao = Plantao(data=date(2030, 5, 6), turno='manha', max_plantonistas=2)
+            db.session.add(plantao)
+            db.session.commit()
+            plantao_id = plantao.id
+            
+            with contador_queries() as queries:
+                reservar_plantao(plantao_id, p1)
+            
+            assert queries[0].lstrip().upper().startswith('UPDATE PLANTOES')
+            selects_alocacoes = [q for q in queries if 'FROM alocacoes' in q]
+            assert len(selects_alocacoes) == 1
+    
+    def test_contador_ocupadas_acompanha_alocacoes(self, app):
+        """Escolha, atribuição, cancelamento e remoção mantêm plantoes.ocupadas"""
+        from utils.reservas import reservar_plantao, atribuir_plantao, liberar_alocacao, verificar_ocupacao
+        
+        with app.app_context():
+            p1, p2 = self._criar_plantonistas(2)
+            plantao = Plantao(data=date(2030, 5, 6), turno='manha', max_plantonistas=2)
+            db.session.add(plantao)
+            db.session.commit()
+            plantao_id = plantao.id
+            
+            alocacao, plantao = reservar_plantao(plantao_id, p1)
+            assert (plantao.ocupadas, plantao.status) == (1, 'reservado')
+            
+            _, plantao = atribuir_plantao(plantao_id, p2)
+            assert (plantao.ocupadas, plantao.status) == (2, 'confirmado')
+            
+            assert liberar_alocacao(alocacao) is True
+            db.session.commit()
+            plantao = db.session.get(Plantao, plantao_id, populate_existing=True)
+            assert (plantao.ocupadas, plantao.status) == (1, 'reservado')
+            
+            # Cancelar de novo não libera outra vaga
+            assert liberar_alocacao(alocacao) is False
+            db.session.commit()
+            
+            restante = Alocacao.query.filter_by(plantao_id=plantao_id, status='confirmado').one()
+            liberar_alocacao(restante, novo_status=None)
+            db.session.commit()
+            plantao = db.session.get(Plantao, plantao_id, populate_existing=True)
+            assert (plantao.ocupadas, plantao.status) == (0, 'disponivel')
+            
+            assert verificar_ocupacao() == []
+    
+    def test_verificar_ocupacao_corrige_divergencias(self, app):
+        """Contador divergente é detectado e recalculado a partir de alocacoes"""
+        from utils.reservas import verificar_ocupacao
+        
+        with app.app_context():
+            (p1,) = self._criar_plantonistas(1)
+            plantao = Plantao(data=date(2030, 5, 6), turno='manha', max_plantonistas=2, ocupadas=0)
+            db.session.add(plantao)
+            db.session.flush()
+            db.session.add(Alocacao(plantao_id=plantao.id, plantonista_id=p1.id, status='confirmado'))
+            db.session.commit()
+            plantao_id = plantao.id
+            
+            divergencias = verificar_ocupacao()
+            assert [(d['id'], d['ocupadas'], d['real']) for d in divergencias] == [(plantao_id, 0, 1)]
+            
+            verificar_ocupacao(corrigir=True)
+            assert db.session.get(Plantao, plantao_id, populate_existing=True).ocupadas == 1
+            assert verificar_ocupacao() == []
+    
+    def test_disponiveis_usa_contador(self, app, client, auth_headers):
+        """Plantões lotados pelo contador não aparecem como disponíveis"""
+        with app.app_context():
+            hoje = date.today()
+            livre = Plantao(data=hoje + timedelta(days=3), turno='manha', max_plantonistas=2, ocupadas=1, status='reservado')
+            lotado = Plantao(data=hoje + timedelta(days=3), turno='tarde', max_plantonistas=2, ocupadas=2, status='reservado')
+            db.session.add_all([livre, lotado])
+            db.session.commit()
+            livre_id, lotado_id = livre.id, lotado.id
+        
+        response = client.get('/api/plantoes/disponiveis', headers=auth_headers)
+        assert response.status_code == 200
+        plantoes = {p['id']: p for p in response.get_json()['dados']['plantoes']}
+        assert livre_id in plantoes
+        assert lotado_id not in plantoes
+        assert plantoes[livre_id]['vagas_ocupadas'] == 1
+    
+    def test_cota_mensal_acompanha_alocacoes(self, app):
+        """Livro-razão registra total e dias ocupados e libera no cancelamento"""
+        from models import CotaMensal
+        from utils.reservas import reservar_plantao, atribuir_plantao, liberar_alocacao
+        from utils.cotas import verificar_cotas
+        
+        with app.app_context():
+            (p1,) = self._criar_plantonistas(1)
+            plantoes = [Plantao(data=date(2030, 5, d), turno='manha', max_plantonistas=2) for d in (6, 31)]
+            db.session.add_all(plantoes)
+            db.session.commit()
+            
+            alocacao, _ = reservar_plantao(plantoes[0].id, p1)
+            atribuir_plantao(plantoes[1].id, p1)
+            
+            cota = CotaMensal.query.filter_by(plantonista_id=p1.id, mes_referencia=date(2030, 5, 1)).one()
+            assert cota.to_dict()['total'] == 2
+            assert cota.to_dict()['dias'] == [6, 31]
+            
+            liberar_alocacao(alocacao)
+            db.session.commit()
+            db.session.refresh(cota)
+            assert (cota.total, cota.to_dict()['dias']) == (1, [31])
+            
+            assert verificar_cotas() == []
+    
+    def test_regras_de_cota_sem_join_no_mes(self, app, contador_queries):
+        """Limite mensal e mesmo dia são checados numa linha do livro-razão"""
+        from utils.reservas import reservar_plantao
+        
+        with app.app_context():
+            (p1,) = self._criar_plantonistas(1)
+            plantao = Plantao(data=date(2030, 5, 6), turno='manha', max_plantonistas=2)
+            db.session.add(plantao)
+            db.session.commit()
+            plantao_id = plantao.id
+            
+            with contador_queries() as queries:
+                reservar_plantao(plantao_id, p1)
+            
+            assert not [q for q in queries if 'JOIN plantoes' in q]
+            assert len([q for q in queries if 'cotas_mensais' in q]) == 2
+    
+    def test_verificar_cotas_reconstroi_livro_razao(self, app):
+        """Alocações sem linha no livro-razão são reconstruídas com --corrigir"""
+        from models import CotaMensal
+        from utils.cotas import verificar_cotas
+        
+        with app.app_context():
+            (p1,) = self._criar_plantonistas(1)
+            plantao = Plantao(data=date(2030, 5, 6), turno='manha', max_plantonistas=2, ocupadas=1)
+            db.session.add(plantao)
+            db.session.flush()
+            db.session.add(Alocacao(plantao_id=plantao.id, plantonista_id=p1.id, status='confirmado'))
+            db.session.commit()
+            
+            assert len(verificar_cotas()) == 1
+            verificar_cotas(corrigir=True)
+            
+            cota = CotaMensal.query.filter_by(plantonista_id=p1.id).one()
+            assert (cota.total, cota.to_dict()['dias']) == (1, [6])
+            assert verificar_cotas() == []
+
+
+class TestFilaReservas:
+    
+    def test_escolher_pela_fila_devolve_ticket(self, client, auth_headers, app):
+        """Entrar na fila retorna 202 com ticket consultável pelo dono"""
+        with app.app_context():
+            plantao_id = Plantao.query.filter_by(status='disponivel').first().id
+        
+        response = client.post(f'/api/plantoes/{plantao_id}/escolher/fila', headers=auth_headers)
+        assert response.status_code == 202
+        ticket = response.get_json()['dados']['ticket']
+        assert ticket['status'] == 'na_fila'
+        assert ticket['posicao'] == 1
+        
+        # Repetir a requisição não cria outro ticket
+        repetido = client.post(f'/api/plantoes/{plantao_id}/escolher/fila', headers=auth_headers)
+        assert repetido.get_json()['dados']['ticket']['id'] == ticket['id']
+        
+        with app.app_context():
+            processado = app.fila_reservas.processar_proximo()
+        assert processado['status'] == 'confirmado'
+        
+        consulta = client.get(f"/api/plantoes/fila/{ticket['id']}", headers=auth_headers)
+        assert consulta.status_code == 200
+        assert consulta.get_json()['dados']['ticket']['alocacao']['plantao_id'] == plantao_id
+    
+    def test_falha_apos_gravar_mantem_ticket_confirmado(self, client, auth_headers, app, monkeypatch):
+        """Erro no log/cache depois do commit não transforma a reserva em ERRO"""
+        import utils.fila_reservas as fila_reservas
+        
+        def falhar(*args, **kwargs):
+            raise RuntimeError('cache indisponível')
+        monkeypatch.setattr(fila_reservas, 'concluir_escolha', falhar)
+        
+        with app.app_context():
+            plantao_id = Plantao.query.filter_by(status='disponivel').first().id
+        client.post(f'/api/plantoes/{plantao_id}/escolher/fila', headers=auth_headers)
+        
+        with app.app_context():
+            processado = app.fila_reservas.processar_proximo()
+            assert Alocacao.query.filter_by(plantao_id=plantao_id).count() == 1
+        assert processado['status'] == 'confirmado'
+        assert processado['codigo'] == 201
+    
+    def test_fila_processa_em_ordem_de_ranking(self, app):
+        """Melhor ranking é atendido primeiro mesmo chegando depois"""
+        from models import Usuario, Plantonista
+        
+        with app.app_context():
+            plantao = Plantao(data=date(2030, 5, 6), turno='manha', max_plantonistas=2)
+            db.session.add(plantao)
+            plantonistas = {}
+            for ranking in (5, 1, 3):
+                u = Usuario(nome=f'Fila {ranking}', email=f'fila{ranking}@test.com', senha='x', tipo='plantonista')
+                db.session.add(u)
+                db.session.flush()
+                p = Plantonista(usuario_id=u.id, ranking=ranking)
+                db.session.add(p)
+                plantonistas[ranking] = (u, p)
+            db.session.commit()
+            
+            tickets = {}
+            for ranking, (u, p) in plantonistas.items():
+                tickets[ranking] = app.fila_reservas.enfileirar(plantao.id, p, u.id)
+            
+            assert app.fila_reservas.consultar(tickets[1]['id'])['posicao'] == 1
+            assert app.fila_reservas.consultar(tickets[5]['id'])['posicao'] == 3
+            
+            while app.fila_reservas.processar_proximo():
+                pass
+            
+            status = {r: app.fila_reservas.consultar(t['id'])['status'] for r, t in tickets.items()}
+            assert status == {1: 'confirmado', 3: 'confirmado', 5: 'recusado'}
+    
+    def test_fila_cheia_recusa_com_503(self, client, auth_headers, app):
+        """Admissão controlada: acima de FILA_RESERVAS_MAX a entrada é recusada"""
+        app.config['FILA_RESERVAS_MAX'] = 0
+        with app.app_context():
+            plantao_id = Plantao.query.filter_by(status='disponivel').first().id
+        
+        response = client.post(f'/api/plantoes/{plantao_id}/escolher/fila', headers=auth_headers)
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '5'
+
+
+class TestJanelaEscolha:
+    
+    def _plantao(self, dia):
+        return Plantao(data=dia, turno='manha')
+    
+    def _plantonista(self, ranking):
+        from models import Plantonista
+        return Plantonista(ranking=ranking)
+    
+    def test_mes_seguinte_na_virada_do_ano(self):
+        """Dezembro libera janeiro no dia de abertura e barra fevereiro"""
+        from datetime import datetime
+        from utils.reservas import validar_janela_escolha, ReservaNegada
+        
+        hoje = date(2030, 12, 26)
+        agora = datetime(2030, 12, 26, 12)
+        validar_janela_escolha(self._plantao(date(2031, 1, 10)), self._plantonista(1), hoje, agora)
+        
+        with pytest.raises(ReservaNegada, match='tão distantes'):
+            validar_janela_escolha(self._plantao(date(2031, 2, 10)), self._plantonista(1), hoje, agora)
+    
+    def test_horario_escalonado_no_dia_de_abertura(self):
+        """No dia 25 o 3º colocado só escolhe a partir das 10:00"""
+        from datetime import datetime
+        from utils.reservas import validar_janela_escolha, ReservaNegada
+        
+        hoje = date(2030, 5, 25)
+        plantao = self._plantao(date(2030, 6, 3))
+        
+        with pytest.raises(ReservaNegada, match='10:00'):
+            validar_janela_escolha(plantao, self._plantonista(3), hoje, datetime(2030, 5, 25, 9, 59))
+        
+        validar_janela_escolha(plantao, self._plantonista(3), hoje, datetime(2030, 5, 25, 10, 0))
+        validar_janela_escolha(plantao, self._plantonista(50), hoje, datetime(2030, 5, 25, 0, 0))
+        
+        with pytest.raises(ReservaNegada, match='será liberada'):
+            validar_janela_escolha(plantao, self._plantonista(1), date(2030, 5, 24), datetime(2030, 5, 24, 12))
+
+
+class TestCacheRespostas:
+    
+    def test_resposta_cacheada_e_reconstruida(self, client, auth_headers):
+        """A segunda leitura vem do cache com o mesmo corpo e status"""
+        primeira = client.get('/api/plantoes', headers=auth_headers)
+        segunda = client.get('/api/plantoes', headers=auth_headers)
+        
+        assert primeira.headers['X-Cache'] == 'MISS'
+        assert segunda.headers['X-Cache'] == 'HIT'
+        assert segunda.status_code == 200
+        assert segunda.get_json() == primeira.get_json()
+        assert segunda.content_type == 'application/json'
+    
+    def test_entrada_guardada_serializada(self, client, auth_headers, monkeypatch):
+        """O cache guarda bytes, status e cabeçalhos, não o objeto Response"""
+        import utils.cache_utils as cache_utils
+        gravadas = {}
+        cache_set_original = cache_utils.cache_set
+        
+        def cache_set(key, value, timeout=None):
+            gravadas[key] = value
+            return cache_set_original(key, value, timeout)
+        
+        monkeypatch.setattr(cache_utils, 'cache_set', cache_set)
+        client.get('/api/plantoes', headers=auth_headers)
+        
+        assert len(gravadas) == 1
+        entrada = next(iter(gravadas.values()))
+        assert isinstance(entrada['corpo'], bytes)
+        assert entrada['status'] == 200
+        assert ('Content-Type', 'application/json') in entrada['cabecalhos']
+    
+    def test_escolha_invalida_o_mes_do_plantao(self, app, client, auth_headers):
+        """Mudança num plantão invalida o mês dele e as consultas abertas, não os outros meses"""
+        with app.app_context():
+            plantao = Plantao.query.filter_by(status='disponivel').first()
+            plantao_id, dia = plantao.id, plantao.data
+        mes = {'inicio': dia.replace(day=1).isoformat(), 'fim': dia.isoformat()}
+        outro = {'inicio': '2040-01-01', 'fim': '2040-01-31'}
+        
+        for params in (mes, outro, {}):
+            client.get('/api/plantoes', headers=auth_headers, query_string=params)
+        
+        client.post(f'/api/plantoes/{plantao_id}/escolher', headers=auth_headers)
+        
+        assert client.get('/api/plantoes', headers=auth_headers, query_string=mes).headers['X-Cache'] == 'MISS'
+        assert client.get('/api/plantoes', headers=auth_headers).headers['X-Cache'] == 'MISS'
+        assert client.get('/api/plantoes', headers=auth_headers, query_string=outro).headers['X-Cache'] == 'HIT'
+    
+    def test_erros_nao_sao_cacheados(self, client, auth_headers):
+        response = client.get('/api/plantoes?inicio=invalido&fim=2030-01-01', headers=auth_headers)
+        assert response.status_code == 500
+        
+        response = client.get('/api/plantoes/mes/2030/13', headers=auth_headers)
+        assert response.status_code == 500
+        assert response.headers.get('X-Cache') != 'HIT'
+    
+    def test_invalidar_tag_ranking(self, app, client, auth_headers):
+        from utils.cache_utils import invalidate_rankings_cache
+        
+        client.get('/api/pontuacao/ranking', headers=auth_headers)
+        assert client.get('/api/pontuacao/ranking', headers=auth_headers).headers['X-Cache'] == 'HIT'
+        
+        with app.app_context():
+            invalidate_rankings_cache()
+        
+        assert client.get('/api/pontuacao/ranking', headers=auth_headers).headers['X-Cache'] == 'MISS'
+    
+    def test_escopo_global_compartilha_entre_usuarios(self, client, auth_headers, gestor_headers):
+        """O calendário é calculado uma vez e servido a qualquer usuário"""
+        assert client.get('/api/plantoes', headers=auth_headers).headers['X-Cache'] == 'MISS'
+        assert client.get('/api/plantoes', headers=gestor_headers).headers['X-Cache'] == 'HIT'
+    
+    def test_ranking_por_papel_sem_dados_restritos(self, client, auth_headers, gestor_headers):
+        """Ranking tem uma entrada por papel; plantonistas não veem contato dos colegas"""
+        plantonista = client.get('/api/pontuacao/ranking', headers=auth_headers)
+        gestor = client.get('/api/pontuacao/ranking', headers=gestor_headers)
+        
+        assert plantonista.headers['X-Cache'] == 'MISS'
+        assert gestor.headers['X-Cache'] == 'MISS'
+        assert client.get('/api/pontuacao/ranking', headers=gestor_headers).headers['X-Cache'] == 'HIT'
+        
+        for p in plantonista.get_json()['dados']['ranking']:
+            assert 'email' not in p
+        for p in gestor.get_json()['dados']['ranking']:
+            assert 'email' in p
+    
+    def test_obsoleto_servido_durante_recalculo(self, app, client, auth_headers):
+        """Com a trava de outra requisição ativa, a entrada invalidada é servida como STALE"""
+        from utils import cache_utils
+        
+        client.get('/api/plantoes', headers=auth_headers)
+        with app.app_context():
+            cache_utils.invalidate_plantoes_cache()
+        
+        chamadas = []
+        adquirir_original = cache_utils._adquirir_trava
+        
+        def trava_ocupada(chave):
+            chamadas.append(chave)
+            return False
+        
+        cache_utils._adquirir_trava = trava_ocupada
+        try:
+            response = client.get('/api/plantoes', headers=auth_headers)
+        finally:
+            cache_utils._adquirir_trava = adquirir_original
+        
+        assert response.headers['X-Cache'] == 'STALE'
+        assert response.status_code == 200
+        assert len(chamadas) == 1
+        
+        # Sem disputa, a próxima leitura recalcula e volta a ser fresca
+        assert client.get('/api/plantoes', headers=auth_headers).headers['X-Cache'] == 'MISS'
+        assert client.get('/api/plantoes', headers=auth_headers).headers['X-Cache'] == 'HIT'
+    
+    def test_recalculo_unico_com_requisicoes_simultaneas(self, app):
+        """Várias threads pedindo a mesma chave obsoleta disparam um único recálculo"""
+        import threading
+        from flask import jsonify
+        from utils.cache_utils import cached_function, ESCOPO_GLOBAL
+        
+        calculos = []
+        inicio = threading.Barrier(8)
+        
+        @cached_function(timeout=60, key_prefix='teste', tags=['teste'], escopo=ESCOPO_GLOBAL)
+        def lenta():
+            calculos.append(1)
+            time.sleep(0.3)
+            return jsonify({'n': len(calculos)}), 200
+        
+        estados = []
+        
+        def requisitar():
+            with app.test_request_context('/teste'):
+                inicio.wait()
+                estados.append(lenta().headers['X-Cache'])
+        
+        threads = [threading.Thread(target=requisitar) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        assert len(calculos) == 1
+        assert sorted(estados) == ['HIT'] * 7 + ['MISS']
+    
+    def test_etag_responde_304_enquanto_nada_muda(self, app, client, auth_headers, gestor_headers):
+        hoje = date.today()
+        url = f'/api/plantoes/mes/{hoje.year}/{hoje.month}'
+        
+        primeira = client.get(url, headers=auth_headers)
+        etag = primeira.headers['ETag']
+        assert primeira.headers['Cache-Control'] == 'public, no-cache'
+        assert primeira.headers['Last-Modified']
+        
+        # Escopo global: o mesmo ETag vale para qualquer usuário
+        condicional = client.get(url, headers={**gestor_headers, 'If-None-Match': etag})
+        assert condicional.status_code == 304
+        assert condicional.get_data() == b''
+        
+        with app.app_context():
+            plantao_id = Plantao.query.first().id
+        client.post(f'/api/plantoes/{plantao_id}/escolher', headers=auth_headers)
+        
+        mudou = client.get(url, headers={**auth_headers, 'If-None-Match': etag})
+        assert mudou.status_code == 200
+        assert mudou.headers['ETag'] != etag
+    
+    def test_recalculo_sem_mudanca_mantem_etag(self, app, client, auth_headers):
+        from utils.cache_utils import invalidate_rankings_cache
+        
+        primeira = client.get('/api/auth/me', headers=auth_headers)
+        assert primeira.headers['Cache-Control'] == 'private, no-cache'
+        assert 'Authorization' in primeira.headers['Vary']
+        
+        with app.app_context():
+            invalidate_rankings_cache()
+        
+        response = client.get('/api/auth/me', headers={
+            **auth_headers,
+            'If-None-Match': primeira.headers['ETag']
+        })
+        assert response.headers['X-Cache'] == 'MISS'
+        assert response.status_code == 304
+        
+        response = client.get('/api/pontuacao/ranking', headers={
+            **auth_headers,
+            'If-Modified-Since': client.get('/api/pontuacao/ranking', headers=auth_headers).headers['Last-Modified']
+        })
+        assert response.status_code == 304
+
+
+class TestAquecimentoCache:
+    
+    def test_janelas_abertura_escalonadas(self):
+        """Uma janela por hora a partir da hora de liberação do 1º colocado"""
+        from datetime import datetime
+        from utils.reservas import janelas_abertura
+        
+        janelas = janelas_abertura(date(2030, 5, 10))
+        assert janelas[0] == (1, datetime(2030, 5, 25, 8, 0))
+        assert janelas[2] == (3, datetime(2030, 5, 25, 10, 0))
+        
+        # Depois do dia de abertura, a próxima é a do mês seguinte
+        assert janelas_abertura(date(2030, 12, 26))[0][1] == datetime(2031, 1, 25, 8, 0)
+    
+    def test_proximo_aquecimento_antecede_a_janela(self, app):
+        from datetime import datetime
+        aquecedor = app.aquecedor
+        antecedencia = timedelta(seconds=app.config['CACHE_AQUECIMENTO_ANTECEDENCIA'])
+        
+        assert aquecedor.proximo_aquecimento(datetime(2030, 5, 25, 9, 0)) == \
+            datetime(2030, 5, 25, 10, 0) - antecedencia
+        assert aquecedor.em_abertura(datetime(2030, 5, 25, 9, 0))
+        assert not aquecedor.em_abertura(datetime(2030, 5, 20, 9, 0))
+    
+    def test_aquecer_preenche_leituras_da_abertura(self, app, client, auth_headers):
+        """Depois do aquecimento, a primeira leitura do plantonista já é HIT"""
+        resultado = app.aquecedor.aquecer()
+        
+        assert 'plantonista /api/plantoes/disponiveis' in resultado
+        assert client.get('/api/plantoes/disponiveis', headers=auth_headers).headers['X-Cache'] == 'HIT'
+        assert client.get('/api/plantoes/abertura', headers=auth_headers).headers['X-Cache'] == 'HIT'
+    
+    def test_cronograma_de_abertura(self, client, auth_headers):
+        response = client.get('/api/plantoes/abertura', headers=auth_headers)
+        
+        assert response.status_code == 200
+        janelas = response.get_json()['dados']['janelas']
+        assert [j['ranking'] for j in janelas] == list(range(1, len(janelas) + 1))
+
+
+class TestFeedAlteracoes:
+    
+    def _alteracoes(self, client, headers, **params):
+        return client.get('/api/plantoes/changes', headers=headers, query_string=params)
+    
+    def test_cursor_atual_e_alteracoes_desde_ele(self, app, client, auth_headers):
+        cursor = self._alteracoes(client, auth_headers).get_json()['dados']['cursor']
+        
+        with app.app_context():
+            plantao_id = Plantao.query.first().id
+        client.post(f'/api/plantoes/{plantao_id}/escolher', headers=auth_headers)
+        
+        dados = self._alteracoes(client, auth_headers, since=cursor).get_json()['dados']
+        assert [p['id'] for p in dados['plantoes']] == [plantao_id]
+        assert dados['plantoes'][0]['vagas_ocupadas'] == 1
+        assert len(dados['alocacoes']) == 1
+        assert dados['cursor'] > cursor
+        
+        # Retomando do cursor devolvido não há nada novo
+        vazio = self._alteracoes(client, auth_headers, since=dados['cursor']).get_json()['dados']
+        assert vazio['plantoes'] == [] and vazio['cursor'] == dados['cursor']
+    
+    def test_compacta_por_entidade(self, app, client, auth_headers, gestor_headers):
+        with app.app_context():
+            plantao_id = Plantao.query.first().id
+        
+        alocacao = client.post(f'/api/plantoes/{plantao_id}/escolher', headers=auth_headers).get_json()['dados']['alocacao']
+        client.delete(f"/api/plantoes/cancelar/{alocacao['id']}", headers=gestor_headers)
+        
+        dados = self._alteracoes(client, auth_headers, since=0).get_json()['dados']
+        assert [p['vagas_ocupadas'] for p in dados['plantoes']] == [0]
+        assert [(a['id'], a['status']) for a in dados['alocacoes']] == [(alocacao['id'], 'cancelado')]
+    
+    def test_filtro_por_mes_e_cursor_invalido(self, app, client, auth_headers):
+        with app.app_context():
+            plantao_id = Plantao.query.first().id
+        client.post(f'/api/plantoes/{plantao_id}/escolher', headers=auth_headers)
+        
+        outro_mes = (date.today().replace(day=1) + timedelta(days=40)).strftime('%Y-%m')
+        dados = self._alteracoes(client, auth_headers, since=0, mes=outro_mes).get_json()['dados']
+        assert dados['plantoes'] == [] and dados['cursor'] == 0
+        
+        assert self._alteracoes(client, auth_headers, since='abc').status_code == 400
+    
+    def test_cursor_expirado_responde_410(self, app, client, auth_headers, gestor_headers):
+        from utils.alteracoes import limpar_alteracoes
+        
+        with app.app_context():
+            plantao_id = Plantao.query.first().id
+        client.put(f'/api/plantoes/{plantao_id}', headers=gestor_headers, json={'observacoes': 'a'})
+        client.put(f'/api/plantoes/{plantao_id}', headers=gestor_headers, json={'observacoes': 'b'})
+        
+        with app.app_context():
+            assert limpar_alteracoes(-1) == 1
+        
+        assert self._alteracoes(client, auth_headers, since=0).status_code == 410
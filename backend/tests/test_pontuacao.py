@@ -0,0 +1,322 @@
+"""
+Testes do cálculo de pontuação e ranking
+"""
+import io
+import uuid
+import pytest
+from datetime import date
+from models import db, Usuario, Plantonista, Pontuacao
+from utils.pontuacao import CalculadoraPontuacao
+
+MES = date(2030, 1, 1)
+
+
+def _plantonistas_com_pontuacao(quantidade, **campos):
+    plantonistas = []
+    for i in range(quantidade):
+        usuario = Usuario(nome=f'Ranking {i}', email=f'ranking-{uuid.uuid4()}@test.com', senha='x', tipo='plantonista')
+        db.session.add(usuario)
+        db.session.flush()
+        plantonista = Plantonista(usuario_id=usuario.id, ranking=999)
+        db.session.add(plantonista)
+        db.session.flush()
+        db.session.add(Pontuacao(plantonista_id=plantonista.id, mes_referencia=MES, vendas=i, **campos))
+        plantonistas.append(plantonista)
+    db.session.commit()
+    return plantonistas
+
+
+class TestRankingMes:
+    
+    def test_pontos_e_posicoes_calculados_no_banco(self, app):
+        with app.app_context():
+            plantonistas = _plantonistas_com_pontuacao(3, age_bairro_foco=1, placa_outros=2)
+            ids = [p.id for p in plantonistas]
+            
+            ranking = CalculadoraPontuacao().calcular_ranking_mes(MES.isoformat())
+            
+            # vendas * 8 + agenciamento em bairro foco * 2 + placas em outros bairros * 0.5
+            assert [float(p.pontos_total) for p in ranking] == [16 + 2 + 1, 8 + 2 + 1, 0 + 2 + 1]
+            assert [p.plantonista_id for p in ranking] == ids[::-1]
+            assert [Plantonista.query.get(i).ranking for i in ids] == [3, 2, 1]
+            assert float(Plantonista.query.get(ids[2]).pontuacao_total) == 19
+            
+            # Plantonista sem pontuação no mês mantém a posição
+            assert Plantonista.query.filter_by(ranking=1).count() == 2
+    
+    def test_mesmo_calculo_de_calcular_pontos(self, app):
+        with app.app_context():
+            plantonista, = _plantonistas_com_pontuacao(1, age_canoas_poa=3, placa_bairro_foco=1.5)
+            pontuacao = Pontuacao.query.filter_by(plantonista_id=plantonista.id).first()
+            esperado = float(CalculadoraPontuacao().calcular_pontos(pontuacao).pontos_total)
+            db.session.rollback()
+            
+            ranking, = CalculadoraPontuacao().calcular_ranking_mes(MES)
+            assert float(ranking.pontos_total) == esperado
+    
+    def test_comandos_nao_crescem_com_plantonistas(self, app, contador_queries):
+        with app.app_context():
+            _plantonistas_com_pontuacao(3)
+            with contador_queries() as poucos:
+                CalculadoraPontuacao().calcular_ranking_mes(MES)
+            
+            _plantonistas_com_pontuacao(30)
+            with contador_queries() as muitos:
+                CalculadoraPontuacao().calcular_ranking_mes(MES)
+        
+        assert len(muitos) == len(poucos)
+
+
+class TestPlacarRanking:
+    
+    @pytest.fixture(autouse=True)
+    def _placar_compartilhado(self, app, monkeypatch):
+        # Um só processo nos testes: a lista local vale pelo sorted set do Redis
+        monkeypatch.setattr(app.placar.backend, 'compartilhado', True)
+    
+    def _posicoes(self, ids):
+        db.session.expire_all()
+        return [Plantonista.query.get(i).ranking for i in ids]
+    
+    def _criar(self, client, headers, plantonista_id, vendas, mes=MES):
+        return client.post('/api/pontuacao/criar', headers=headers, json={
+            'plantonista_id': plantonista_id, 'mes_referencia': mes.isoformat(), 'vendas': vendas
+        })
+    
+    def test_edicao_regrava_so_as_posicoes_afetadas(self, app, client, gestor_headers):
+        with app.app_context():
+            ids = [p.id for p in _plantonistas_com_pontuacao(4)]
+            app.placar.reconciliar(MES)
+            assert self._posicoes(ids) == [4, 3, 2, 1]
+        
+        # Último para primeiro: as quatro posições mudam
+        assert self._criar(client, gestor_headers, ids[0], 10).status_code == 201
+        with app.app_context():
+            assert self._posicoes(ids) == [1, 4, 3, 2]
+            assert float(Plantonista.query.get(ids[0]).pontuacao_total) == 80
+        assert app.placar.metricas()['posicoes_gravadas'] == 4
+        
+        # Da 4ª para a 2ª: só as posições 2 a 4
+        self._criar(client, gestor_headers, ids[1], 5)
+        with app.app_context():
+            incremental = self._posicoes(ids)
+            assert incremental == [1, 2, 4, 3]
+            assert app.placar.metricas()['posicoes_gravadas'] == 7
+            
+            # Mesmo resultado do cálculo completo
+            CalculadoraPontuacao().calcular_ranking_mes(MES)
+            assert self._posicoes(ids) == incremental
+    
+    def test_exclusao_sobe_os_seguintes(self, app, client, gestor_headers):
+        with app.app_context():
+            ids = [p.id for p in _plantonistas_com_pontuacao(3)]
+            app.placar.reconciliar(MES)
+            pontuacao_id = Pontuacao.query.filter_by(plantonista_id=ids[2]).first().id
+        
+        assert client.delete(f'/api/pontuacao/{pontuacao_id}', headers=gestor_headers).status_code == 200
+        
+        with app.app_context():
+            assert self._posicoes(ids[:2]) == [2, 1]
+    
+    def test_outro_mes_nao_altera_o_ranking_vigente(self, app, client, gestor_headers):
+        with app.app_context():
+            ids = [p.id for p in _plantonistas_com_pontuacao(2)]
+            app.placar.reconciliar(MES)
+        
+        self._criar(client, gestor_headers, ids[0], 50, mes=date(2030, 2, 1))
+        
+        with app.app_context():
+            assert self._posicoes(ids) == [2, 1]
+    
+    def test_reconciliacao_corrige_desvios(self, app):
+        with app.app_context():
+            ids = [p.id for p in _plantonistas_com_pontuacao(3)]
+            app.placar.reconciliar(MES)
+            
+            Plantonista.query.filter(Plantonista.id.in_(ids)).update({'ranking': 7}, synchronize_session=False)
+            db.session.commit()
+            
+            # Sem mês informado: o vigente
+            app.placar.reconciliar()
+            assert self._posicoes(ids) == [3, 2, 1]
+
+
+class TestPlacarLocal:
+    
+    def test_edicao_refaz_o_calculo_sem_confiar_na_lista_do_processo(self, app, client, gestor_headers):
+        with app.app_context():
+            ids = [p.id for p in _plantonistas_com_pontuacao(3)]
+            app.placar.reconciliar(MES)
+            
+            # Edição feita por outro worker: não chega à lista deste processo
+            Pontuacao.query.filter_by(plantonista_id=ids[0]).one().vendas = 20
+            db.session.commit()
+            CalculadoraPontuacao().calcular_ranking_mes(MES)
+        
+        antes = app.placar.metricas()
+        client.post('/api/pontuacao/criar', headers=gestor_headers, json={
+            'plantonista_id': ids[1], 'mes_referencia': MES.isoformat(), 'vendas': 10
+        })
+        
+        with app.app_context():
+            db.session.expire_all()
+            assert [Plantonista.query.get(i).ranking for i in ids] == [1, 2, 3]
+        depois = app.placar.metricas()
+        assert depois['reconciliacoes'] == antes['reconciliacoes'] + 1
+        assert depois['posicoes_gravadas'] == antes['posicoes_gravadas']
+
+
+class TestImportacaoPontuacoes:
+    
+    def _importar(self, client, headers, pontuacoes, mes=MES):
+        return client.post('/api/pontuacao/importar', headers=headers, json={
+            'mes_referencia': mes.isoformat(), 'pontuacoes': pontuacoes
+        })
+    
+    def test_nomes_normalizados_e_erros_por_linha(self, app, client, gestor_headers):
+        with app.app_context():
+            Usuario.query.filter_by(email='plantonista@test.com').first().nome = 'José Antônio'
+            db.session.commit()
+        
+        response = self._importar(client, gestor_headers, [
+            {'nome': '  jose   ANTONIO ', 'vendas': 2, 'placa_outros': '1.5'},
+            {'nome': 'Ninguém', 'vendas': 1},
+            {'nome': 'José Antônio', 'vendas': 'muitas'},
+        ])
+        
+        assert response.status_code == 200
+        dados = response.get_json()['dados']
+        assert dados['sucesso'] == [{'linha': 1, 'nome': '  jose   ANTONIO ', 'pontos': 16.75}]
+        assert [(e['linha'], e['erro']) for e in dados['erros']][0] == (2, 'Plantonista não encontrado')
+        assert dados['erros'][1]['linha'] == 3
+        
+        with app.app_context():
+            pontuacao, = Pontuacao.query.filter_by(mes_referencia=MES).all()
+            assert float(pontuacao.pontos_total) == 16.75
+            assert pontuacao.plantonista.ranking == 1
+    
+    def test_reimportacao_atualiza_e_repetidos_valem_a_ultima_linha(self, app, client, gestor_headers):
+        with app.app_context():
+            ids = [p.id for p in _plantonistas_com_pontuacao(2)]
+            nomes = [Plantonista.query.get(i).usuario.nome for i in ids]
+        
+        dados = self._importar(client, gestor_headers, [
+            {'nome': nomes[0], 'vendas': 1},
+            {'nome': nomes[1], 'vendas': 3},
+            {'nome': nomes[0], 'vendas': 5},
+        ]).get_json()['dados']
+        
+        assert [s['linha'] for s in dados['sucesso']] == [2, 3]
+        assert dados['erros'][0]['linha'] == 1
+        
+        with app.app_context():
+            assert Pontuacao.query.filter_by(mes_referencia=MES).count() == 2
+            assert Pontuacao.query.filter_by(plantonista_id=ids[0]).one().vendas == 5
+            assert [Plantonista.query.get(i).ranking for i in ids] == [1, 2]
+    
+    def test_usuario_sem_plantonista_vira_erro_da_linha(self, app, client, gestor_headers):
+        with app.app_context():
+            ids = [p.id for p in _plantonistas_com_pontuacao(1)]
+            nome = Plantonista.query.get(ids[0]).usuario.nome
+            db.session.add(Usuario(nome='Sem Registro', email=f'sem-{uuid.uuid4()}@test.com',
+                                   senha='x', tipo='plantonista'))
+            db.session.commit()
+        
+        response = self._importar(client, gestor_headers, [
+            {'nome': 'Sem Registro', 'vendas': 1},
+            {'nome': nome, 'vendas': 2},
+        ])
+        
+        assert response.status_code == 200
+        dados = response.get_json()['dados']
+        assert [s['linha'] for s in dados['sucesso']] == [2]
+        assert dados['erros'] == [{'linha': 1, 'nome': 'Sem Registro', 'erro': 'Usuário sem registro de plantonista'}]
+    
+    def test_planilha_grande_em_numero_fixo_de_comandos(self, app, contador_queries):
+        from sqlalchemy import insert
+        
+        with app.app_context():
+            usuarios = [{'id': str(uuid.uuid4()), 'nome': f'Importado {i}', 'email': f'importado{i}@test.com',
+                         'senha': 'x', 'tipo': 'plantonista'} for i in range(2000)]
+            db.session.execute(insert(Usuario), usuarios)
+            db.session.execute(insert(Plantonista), [
+                {'id': str(uuid.uuid4()), 'usuario_id': u['id'], 'ranking': 999} for u in usuarios
+            ])
+            db.session.commit()
+            
+            planilha = [{'nome': u['nome'], 'vendas': i % 7, 'placa_outros': i % 3} for i, u in enumerate(usuarios)]
+            
+            with contador_queries() as queries:
+                resultados = CalculadoraPontuacao().importar_pontuacoes_planilha(MES, planilha)
+                app.placar.reconciliar(MES)
+            
+            assert len(resultados['sucesso']) == 2000 and resultados['erros'] == []
+            assert Pontuacao.query.filter_by(mes_referencia=MES).count() == 2000
+        
+        # Não cresce com as 2.000 linhas
+        assert len(queries) < 40
+
+
+class TestImportacaoArquivo:
+    
+    def _enviar(self, client, headers, conteudo, nome_arquivo='pontuacao.csv', **campos):
+        return client.post('/api/pontuacao/importar/arquivo', headers=headers, data={
+            'arquivo': (io.BytesIO(conteudo), nome_arquivo),
+            'mes_referencia': MES.isoformat(),
+            **campos
+        }, content_type='multipart/form-data')
+    
+    def test_csv_em_lotes_com_progresso_no_socket(self, app, client, gestor_headers):
+        with app.app_context():
+            ids = [p.id for p in _plantonistas_com_pontuacao(3)]
+        app.config['IMPORTACAO_LOTE'] = 2
+        socket = app.socketio.test_client(app, auth={'token': gestor_headers['Authorization'].split(' ', 1)[1]})
+        socket.get_received()
+        
+        planilha = (
+            'Nome;Vendas;Placa Outros\n'
+            'Ranking 0;4;1,5\n'
+            'Ranking 1;1;0\n'
+            'Ninguém;2;0\n'
+            '\n'
+            'Ranking 2;2;0\n'
+        ).encode('utf-8-sig')
+        response = self._enviar(client, gestor_headers, planilha, importacao_id='imp-1')
+        
+        assert response.status_code == 200
+        dados = response.get_json()['dados']
+        assert (dados['processadas'], dados['importadas'], dados['total_erros']) == (4, 3, 1)
+        assert dados['erros'] == [{'linha': 3, 'nome': 'Ninguém', 'erro': 'Plantonista não encontrado'}]
+        
+        eventos = [e['args'][0] for e in socket.get_received() if e['name'] == 'importacao_progresso']
+        assert [(e['importadas'], e['concluida']) for e in eventos] == [(2, False), (3, False), (3, True)]
+        assert {e['importacao_id'] for e in eventos} == {'imp-1'}
+        
+        with app.app_context():
+            assert float(Pontuacao.query.filter_by(plantonista_id=ids[0]).one().pontos_total) == 32.75
+            assert [Plantonista.query.get(i).ranking for i in ids] == [1, 3, 2]
+    
+    def test_formato_nao_suportado(self, client, gestor_headers):
+        response = self._enviar(client, gestor_headers, b'nome,vendas\n', nome_arquivo='pontuacao.ods')
+        assert response.status_code == 400
+        
+        response = self._enviar(client, gestor_headers, b'', nome_arquivo='pontuacao.csv')
+        assert response.status_code == 400
+    
+    def test_xlsx(self, app, client, gestor_headers):
+        openpyxl = pytest.importorskip('openpyxl')
+        with app.app_context():
+            plantonista, = _plantonistas_com_pontuacao(1)
+            plantonista_id = plantonista.id
+        
+        pasta = openpyxl.Workbook()
+        pasta.active.append(['Nome', 'Vendas', 'Age Bairro Foco'])
+        pasta.active.append(['Ranking 0', 3, 2])
+        conteudo = io.BytesIO()
+        pasta.save(conteudo)
+        
+        response = self._enviar(client, gestor_headers, conteudo.getvalue(), nome_arquivo='pontuacao.xlsx')
+        
+        assert response.get_json()['dados']['importadas'] == 1
+        with app.app_context():
+            assert float(Pontuacao.query.filter_by(plantonista_id=plantonista_id).one().pontos_total) == 28
@@ -0,0 +1,150 @@
+"""
+Testes dos eventos em tempo real (Socket.IO)
+"""
+from datetime import date
+from dateutil.relativedelta import relativedelta
+from models import db, Plantao
+from utils.reservas import ocupar_vaga
+from utils.websocket import configurar_fila_mensagens, metricas_socketio, notify_user
+
+
+def _token(headers):
+    return headers['Authorization'].split(' ', 1)[1]
+
+
+def _conectar(app, headers, mes=None):
+    auth = {'token': _token(headers)}
+    if mes:
+        auth['mes'] = mes.strftime('%Y-%m')
+    cliente = app.socketio.test_client(app, auth=auth)
+    cliente.get_received()
+    return cliente
+
+
+def _nomes(cliente):
+    return [e['name'] for e in cliente.get_received()]
+
+
+class TestFilaMensagens:
+
+    def test_testes_rodam_sem_fila(self, app):
+        assert metricas_socketio(app.socketio)['fila'] == 'local'
+
+    def test_redis_inacessivel_cai_para_entrega_local(self, app):
+        app.config['SOCKETIO_MESSAGE_QUEUE'] = 'redis://127.0.0.1:1/0'
+        assert configurar_fila_mensagens(app) is None
+
+    def test_emissao_chega_ao_cliente_conectado(self, app, auth_headers):
+        cliente = _conectar(app, auth_headers)
+
+        with app.app_context():
+            app.socketio.emit('plantao_updated', {'plantao': {'id': 'p1'}})
+
+        eventos = cliente.get_received()
+        assert [e['name'] for e in eventos] == ['plantao_updated']
+        assert eventos[0]['args'][0]['plantao']['id'] == 'p1'
+
+
+class TestDifusorPlantoes:
+
+    def test_versao_incrementa_em_update_direto_e_pelo_orm(self, app):
+        with app.app_context():
+            plantao = Plantao.query.first()
+            assert plantao.versao == 1
+
+            ocupar_vaga(plantao.id)
+            db.session.commit()
+            assert plantao.versao == 2
+
+            plantao.observacoes = 'troca de sala'
+            db.session.commit()
+            assert plantao.versao == 3
+
+    def test_escolha_gera_delta_compacto(self, app, client, auth_headers):
+        with app.app_context():
+            plantao_id = Plantao.query.first().id
+
+        assert client.post(f'/api/plantoes/{plantao_id}/escolher', headers=auth_headers).status_code == 201
+
+        with app.app_context():
+            evento, = app.difusor.descarregar()
+        assert evento['seq'] == 1
+        delta, = evento['plantoes']
+        assert delta['cursor'] == evento['cursor'] > 0
+        assert {k: v for k, v in delta.items() if k not in ('data', 'cursor')} == {
+            'id': plantao_id, 'turno': 'manha', 'status': 'reservado',
+            'ocupadas': 1, 'max_plantonistas': 2, 'versao': 2
+        }
+
+    def test_alteracoes_na_janela_viram_um_delta(self, app):
+        with app.app_context():
+            plantao = Plantao.query.first()
+            for _ in range(2):
+                ocupar_vaga(plantao.id)
+                db.session.commit()
+                app.difusor.registrar(plantao)
+
+            evento, = app.difusor.descarregar()
+            assert app.difusor.descarregar() == []
+
+            app.difusor.registrar_remocao(plantao.id, plantao.data)
+            seguinte, = app.difusor.descarregar()
+
+        assert [(p['ocupadas'], p['versao']) for p in evento['plantoes']] == [(2, 3)]
+        assert seguinte['seq'] == evento['seq'] + 1
+        assert seguinte['plantoes'][0]['removido'] is True
+
+
+class TestSalasAutenticadas:
+
+    def test_conexao_sem_token_recusada(self, app):
+        assert not app.socketio.test_client(app).is_connected()
+        assert not app.socketio.test_client(app, auth={'token': 'invalido'}).is_connected()
+
+    def test_delta_vai_so_para_a_sala_do_mes(self, app, auth_headers, gestor_headers):
+        hoje = date.today()
+        deste_mes = _conectar(app, auth_headers, hoje)
+        do_proximo = _conectar(app, gestor_headers, hoje + relativedelta(months=1))
+
+        with app.app_context():
+            app.difusor.registrar(Plantao.query.first())
+            app.difusor.descarregar()
+
+        assert _nomes(deste_mes) == ['plantoes_delta']
+        assert _nomes(do_proximo) == []
+
+    def test_assinar_outro_mes_troca_a_sala(self, app, auth_headers):
+        cliente = _conectar(app, auth_headers, date.today() + relativedelta(months=1))
+        resposta = cliente.emit('assinar_mes', {'mes': date.today().strftime('%Y-%m')}, callback=True)
+        assert resposta['sucesso'] is True
+        assert cliente.emit('assinar_mes', {'mes': 'novembro'}, callback=True)['sucesso'] is False
+
+        with app.app_context():
+            app.difusor.registrar(Plantao.query.first())
+            app.difusor.descarregar()
+
+        assert _nomes(cliente) == ['plantoes_delta']
+
+    def test_notificacao_pessoal_so_para_o_usuario(self, app, auth_headers, gestor_headers):
+        from models import Usuario
+        plantonista = _conectar(app, auth_headers)
+        gestor = _conectar(app, gestor_headers)
+
+        with app.app_context():
+            usuario = Usuario.query.filter_by(email='plantonista@test.com').first()
+            notify_user(usuario.id, 'Sua reserva foi processada')
+
+        assert _nomes(plantonista) == ['notification']
+        assert _nomes(gestor) == []
+
+    def test_reconexao_com_cursor_recebe_o_que_mudou(self, app, client, auth_headers):
+        with app.app_context():
+            plantao_id = Plantao.query.first().id
+        client.post(f'/api/plantoes/{plantao_id}/escolher', headers=auth_headers)
+
+        cliente = app.socketio.test_client(app, auth={'token': _token(auth_headers), 'cursor': 0})
+        eventos = {e['name']: e['args'][0] for e in cliente.get_received()}
+
+        alteracoes = eventos['plantoes_alteracoes']
+        assert alteracoes['mes'] == date.today().strftime('%Y-%m')
+        assert [p['id'] for p in alteracoes['plantoes']] == [plantao_id]
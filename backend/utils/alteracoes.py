@@ -0,0 +1,211 @@
+"""
+Feed de alterações de plantões e alocações
+
+Cada mutação grava, na mesma transação, uma linha em alteracoes com a
+entidade alterada. A posição no feed é o cursor: clientes que
+reconectam pedem GET /api/plantoes/changes?since=<cursor> e recebem o
+estado atual de cada entidade alterada desde então, uma vez só, em vez
+de recarregar o mês inteiro. O mesmo cursor vai nos eventos
+'plantoes_delta' e pode ser enviado na conexão do socket para retomar.
+
+O cursor só pode avançar sobre alterações que não podem mais aparecer
+atrás dele. No SQLite as escritas já são serializadas e o cursor é o id
+da linha. No Postgres transações concorrentes gravam sem se esperar (não
+há trava global: as reservas continuam concorrendo só pela linha do
+plantão), então cada linha leva o txid da sua transação e o cursor é
+esse txid. A leitura só entrega transações abaixo do xmin do snapshot
+(todas já terminadas) e o cursor devolvido nunca passa dele: uma
+transação ainda aberta, mesmo com txid menor, nunca fica para trás.
+Uma transação de escrita muito longa segura o feed até terminar.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, insert, literal, null, select, text
+from sqlalchemy.orm import joinedload
+from models import db, Alteracao, Plantao, Alocacao, Plantonista, Configuracao
+
+# Configuração com o maior cursor já removido por limpar_alteracoes
+CHAVE_HORIZONTE = 'feed_alteracoes_horizonte'
+LIMITE_PADRAO = 500
+LIMITE_MAXIMO = 2000
+
+
+class CursorExpirado(Exception):
+    """Alterações posteriores ao cursor já foram removidas: recarregar tudo"""
+
+
+def _postgres():
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+
+def _coluna_cursor():
+    return Alteracao.transacao if _postgres() else Alteracao.id
+
+
+def _fronteira():
+    """Maior cursor seguro no Postgres: transações abaixo do xmin já terminaram"""
+    return db.session.execute(text('SELECT txid_snapshot_xmin(txid_current_snapshot()) - 1')).scalar()
+
+
+def registrar_alteracao(plantao, alocacao=None, plantao_removido=False, alocacao_removida=False):
+    """
+    Grava no feed a alteração do plantão e, se houver, da alocação (sem commit)
+
+    Returns:
+        int: Cursor a partir do qual um cliente recebe esta alteração
+    """
+    # Alocação recém-adicionada ainda não tem id antes do flush
+    db.session.flush()
+    transacao = cursor = None
+    if _postgres():
+        # O cursor do delta é a fronteira vista por esta transação: quem retoma
+        # dele recebe esta alteração e qualquer outra ainda aberta agora
+        transacao, cursor = db.session.execute(
+            text('SELECT txid_current(), txid_snapshot_xmin(txid_current_snapshot()) - 1')
+        ).one()
+
+    agora = datetime.utcnow()
+    linhas = [Alteracao(entidade='plantao', entidade_id=str(plantao.id), data=plantao.data,
+                        removido=plantao_removido, transacao=transacao, created_at=agora)]
+    if alocacao is not None:
+        linhas.append(Alteracao(entidade='alocacao', entidade_id=str(alocacao.id), data=plantao.data,
+                                removido=alocacao_removida, transacao=transacao, created_at=agora))
+    db.session.add_all(linhas)
+    db.session.flush()
+
+    if cursor is None:
+        cursor = linhas[-1].id
+    # Lido por utils/difusor.py para levar o cursor no delta do socket
+    db.session.info.setdefault('cursores_feed', {})[str(plantao.id)] = cursor
+    return cursor
+
+
+def registrar_plantoes_criados(inicio, fim, criado_em):
+    """Grava no feed os plantões inseridos em lote por gerar_plantoes (sem commit)"""
+    transacao = func.txid_current() if _postgres() else null()
+    db.session.execute(insert(Alteracao).from_select(
+        ['entidade', 'entidade_id', 'data', 'removido', 'transacao', 'created_at'],
+        select(literal('plantao'), Plantao.id, Plantao.data, literal(False), transacao,
+               literal(criado_em, db.DateTime))
+        .where(Plantao.data >= inicio, Plantao.data <= fim, Plantao.created_at == criado_em)
+    ))
+
+
+def cursor_feed(plantao_id):
+    """Cursor da última alteração do plantão registrada nesta sessão"""
+    return db.session.info.get('cursores_feed', {}).pop(str(plantao_id), None)
+
+
+def cursor_atual():
+    if _postgres():
+        return _fronteira()
+    return db.session.query(func.max(Alteracao.id)).scalar() or 0
+
+
+def alteracoes_desde(cursor, inicio=None, fim=None, limite=LIMITE_PADRAO):
+    """
+    Estado atual das entidades alteradas depois do cursor, uma vez cada
+
+    Args:
+        cursor (int): Cursor da leitura anterior
+        inicio, fim (date): Restringe às alterações de plantões do período
+        limite (int): Máximo de alterações lidas do feed
+
+    Returns:
+        dict: cursor, tem_mais, plantoes, alocacoes e removidos
+
+    Raises:
+        CursorExpirado: Se alterações após o cursor já foram removidas
+    """
+    horizonte = db.session.execute(
+        select(Configuracao.valor).where(Configuracao.chave == CHAVE_HORIZONTE)
+    ).scalar()
+    if horizonte is not None and cursor < horizonte:
+        raise CursorExpirado()
+
+    postgres = _postgres()
+    coluna = Alteracao.transacao if postgres else Alteracao.id
+    filtros = [coluna > cursor]
+    fronteira = None
+    if postgres:
+        fronteira = max(_fronteira(), cursor)
+        filtros.append(coluna <= fronteira)
+    if inicio:
+        filtros += [Alteracao.data >= inicio, Alteracao.data <= fim]
+    linhas = db.session.execute(
+        select(Alteracao).where(*filtros).order_by(coluna, Alteracao.id).limit(limite + 1)
+    ).scalars().all()
+    tem_mais = len(linhas) > limite
+    linhas = linhas[:limite]
+
+    if tem_mais and fronteira is not None:
+        # Uma transação nunca fica dividida entre páginas
+        ultima = linhas[-1].transacao
+        if linhas[0].transacao == ultima:
+            linhas = db.session.execute(
+                select(Alteracao).where(*filtros[1:], Alteracao.transacao == ultima).order_by(Alteracao.id)
+            ).scalars().all()
+        else:
+            linhas = [a for a in linhas if a.transacao != ultima]
+
+    if tem_mais or fronteira is None:
+        novo_cursor = getattr(linhas[-1], coluna.key) if linhas else cursor
+    else:
+        # Tudo até a fronteira foi lido (mesmo sem linhas do filtro)
+        novo_cursor = fronteira
+
+    # Compacta: só a última alteração de cada entidade importa
+    ultimas = {}
+    for alteracao in linhas:
+        ultimas[(alteracao.entidade, alteracao.entidade_id)] = alteracao
+
+    ids = {'plantao': [], 'alocacao': []}
+    removidos = {'plantao': [], 'alocacao': []}
+    for (entidade, entidade_id), alteracao in ultimas.items():
+        (removidos if alteracao.removido else ids)[entidade].append(entidade_id)
+
+    plantoes = Plantao.query.filter(Plantao.id.in_(ids['plantao'])).all() if ids['plantao'] else []
+    alocacoes = Alocacao.query.options(
+        joinedload(Alocacao.plantonista).joinedload(Plantonista.usuario)
+    ).filter(Alocacao.id.in_(ids['alocacao'])).all() if ids['alocacao'] else []
+
+    # Excluídos depois da última alteração lida
+    removidos['plantao'] += sorted(set(ids['plantao']) - {p.id for p in plantoes})
+    removidos['alocacao'] += sorted(set(ids['alocacao']) - {a.id for a in alocacoes})
+
+    return {
+        'cursor': novo_cursor,
+        'tem_mais': tem_mais,
+        'plantoes': [p.to_dict() for p in plantoes],
+        'alocacoes': [a.to_dict() for a in alocacoes],
+        'removidos': {'plantoes': removidos['plantao'], 'alocacoes': removidos['alocacao']}
+    }
+
+
+def limpar_alteracoes(dias):
+    """
+    Remove do feed as alterações com mais de `dias` dias
+
+    A última alteração é mantida e o maior cursor removido fica gravado
+    como horizonte, para que cursores anteriores a ele sejam
+    reconhecidos como expirados.
+
+    Returns:
+        int: Linhas removidas
+    """
+    coluna = _coluna_cursor()
+    ultima = db.session.query(func.max(Alteracao.id)).scalar() or 0
+    corte = datetime.utcnow() - timedelta(days=dias)
+    removidas = (Alteracao.created_at < corte, Alteracao.id < ultima)
+
+    horizonte = db.session.query(func.max(coluna)).filter(*removidas).scalar()
+    if horizonte is None:
+        return 0
+    cfg = Configuracao.query.filter_by(chave=CHAVE_HORIZONTE).first()
+    if cfg is None:
+        cfg = Configuracao(chave=CHAVE_HORIZONTE, descricao='Maior cursor removido do feed de alterações')
+        db.session.add(cfg)
+    cfg.valor = max(horizonte, cfg.valor or 0)
+
+    resultado = db.session.execute(delete(Alteracao).where(*removidas))
+    db.session.commit()
+    return resultado.rowcount
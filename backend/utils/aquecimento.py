@@ -0,0 +1,153 @@
+"""
+Aquecimento do cache antes das janelas de abertura das escolhas
+
+No dia de abertura (utils/reservas.py) o 1º colocado escolhe às 08:00 e
+cada posição seguinte uma hora depois. CACHE_AQUECIMENTO_ANTECEDENCIA
+segundos antes de cada janela, um worker faz as leituras que os
+plantonistas vão fazer (calendário do mês seguinte, disponíveis, ranking
+e cronograma) para que as primeiras requisições já encontrem o cache
+pronto. Durante o dia de abertura, toda invalidação agenda um novo
+aquecimento, agrupando as invalidações de uma rajada.
+
+As leituras passam pelo test_client da própria aplicação, com o token de
+um usuário real de cada papel: as chaves de cache são exatamente as das
+requisições dos clientes.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from dateutil.relativedelta import relativedelta
+from flask_jwt_extended import create_access_token
+from models import db, Usuario, Plantonista
+from utils.reservas import janelas_abertura
+from utils.tokens import claims_usuario
+
+
+class AquecedorCache:
+    """Worker que pré-calcula as leituras da abertura das escolhas"""
+
+    def __init__(self, app=None):
+        self._app = None
+        self._pendente = threading.Event()
+        self._worker = None
+        self.ultimo_aquecimento = None
+        self.aquecimentos = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._app = app
+        app.aquecedor = self
+        if app.config['CACHE_AQUECIMENTO']:
+            self._worker = threading.Thread(target=self._trabalhar, daemon=True, name='aquecedor-cache')
+            self._worker.start()
+
+    # --- Calendário ---
+
+    def janelas(self, agora=None):
+        """Instantes de liberação da próxima abertura (mesmo relógio de validar_janela_escolha)"""
+        agora = agora or datetime.utcnow()
+        return [inicio for _, inicio in janelas_abertura(agora.date())]
+
+    def em_abertura(self, agora=None):
+        """True entre o aquecimento da primeira janela e uma hora após a última"""
+        agora = agora or datetime.utcnow()
+        janelas = self.janelas(agora)
+        antecedencia = timedelta(seconds=self._app.config['CACHE_AQUECIMENTO_ANTECEDENCIA'])
+        return janelas[0] - antecedencia <= agora <= janelas[-1] + timedelta(hours=1)
+
+    def proximo_aquecimento(self, agora=None):
+        """Próximo instante agendado (antecedência antes de uma janela)"""
+        agora = agora or datetime.utcnow()
+        antecedencia = timedelta(seconds=self._app.config['CACHE_AQUECIMENTO_ANTECEDENCIA'])
+        for inicio in self.janelas(agora):
+            if inicio - antecedencia > agora:
+                return inicio - antecedencia
+        # Todas as janelas desta abertura já passaram: primeira da próxima
+        return self.janelas(agora + relativedelta(days=1))[0] - antecedencia
+
+    # --- Aquecimento ---
+
+    def _tokens(self):
+        """Tokens de curta duração de um plantonista e de um gestor ativos"""
+        tokens = {}
+        plantonista = Usuario.query.join(Plantonista).filter(Usuario.ativo.is_(True)) \
+            .order_by(Plantonista.ranking.asc()).first()
+        gestor = Usuario.query.filter(Usuario.ativo.is_(True), Usuario.tipo.in_(['gestor', 'admin'])).first()
+        for papel, usuario in (('plantonista', plantonista), ('gestor', gestor)):
+            if usuario is not None:
+                tokens[papel] = create_access_token(
+                    identity=str(usuario.id),
+                    additional_claims=claims_usuario(usuario),
+                    expires_delta=timedelta(minutes=5)
+                )
+        db.session.remove()
+        return tokens
+
+    def leituras(self, agora=None):
+        """(papel, caminho) das leituras aquecidas para a próxima abertura"""
+        agora = agora or datetime.utcnow()
+        mes = self.janelas(agora)[0].date() + relativedelta(months=1)
+        return [
+            ('plantonista', f'/api/plantoes/mes/{mes.year}/{mes.month}'),
+            ('plantonista', '/api/plantoes/disponiveis'),
+            ('plantonista', '/api/plantoes/abertura'),
+            ('plantonista', '/api/pontuacao/ranking'),
+            ('gestor', '/api/pontuacao/ranking'),
+        ]
+
+    def aquecer(self):
+        """
+        Executa as leituras da abertura, preenchendo o cache
+
+        Returns:
+            dict: Caminho -> estado do cache (X-Cache) ou status de erro
+        """
+        with self._app.app_context():
+            tokens = self._tokens()
+
+        resultado = {}
+        cliente = self._app.test_client()
+        for papel, caminho in self.leituras():
+            token = tokens.get(papel)
+            if token is None:
+                continue
+            try:
+                resposta = cliente.get(caminho, headers={'Authorization': f'Bearer {token}'})
+                resultado[f'{papel} {caminho}'] = resposta.headers.get('X-Cache', resposta.status_code)
+            except Exception as e:
+                resultado[f'{papel} {caminho}'] = f'erro: {e}'
+
+        self.ultimo_aquecimento = datetime.utcnow()
+        self.aquecimentos += 1
+        return resultado
+
+    def apos_invalidacao(self):
+        """Agenda um novo aquecimento se a abertura estiver em andamento"""
+        if self._worker is not None and self.em_abertura():
+            self._pendente.set()
+
+    # --- Worker ---
+
+    def _trabalhar(self):
+        while True:
+            alvo = self.proximo_aquecimento()
+            espera = (alvo - datetime.utcnow()).total_seconds()
+            if self._pendente.wait(max(espera, 0)):
+                # Agrupa a rajada de invalidações de uma sequência de escolhas
+                time.sleep(self._app.config['CACHE_AQUECIMENTO_AGRUPAR'])
+                self._pendente.clear()
+            elif not self._reservar_janela(alvo):
+                continue
+            try:
+                self.aquecer()
+            except Exception as e:
+                print(f"❌ Erro no aquecimento do cache: {e}")
+
+    def _reservar_janela(self, alvo):
+        """Com vários workers, apenas um aquece cada janela agendada"""
+        with self._app.app_context():
+            try:
+                return bool(self._app.cache.add(f"aquecimento:{alvo.isoformat()}", 1, timeout=3600))
+            except Exception:
+                return True
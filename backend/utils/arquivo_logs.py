@@ -0,0 +1,302 @@
+"""
+Arquivamento do log de auditoria em segmentos compactados
+
+No Postgres a tabela logs é particionada por mês (database/init.sql).
+Meses mais antigos que LOGS_MESES_ATIVOS são exportados para um segmento
+JSON Lines compactado (gzip) em LOGS_ARQUIVO_DIR, com um índice lateral
+(.json) que guarda o período e as contagens por usuário, tabela e ação.
+Depois da exportação a partição é removida (DROP); em bancos sem a
+partição os registros do mês são apagados.
+
+Segmentos nunca são reescritos: registros que chegarem a um mês já
+arquivado vão para um novo segmento do mesmo mês (logs_AAAA_MM.2...).
+buscar_arquivados lê os segmentos na mesma ordem (created_at, id) da
+tabela, para GET /api/logs paginar pelos dois como se fossem um só.
+
+Cada segmento é uma sequência de membros gzip independentes de
+LINHAS_POR_BLOCO linhas, e o índice lateral guarda a chave da primeira
+linha e o byte de início de cada bloco. A leitura a partir de um cursor
+salta direto para o bloco que o contém, então páginas profundas custam
+no máximo um bloco descompactado a mais que as primeiras.
+"""
+import glob
+import gzip
+import hashlib
+import heapq
+import json
+import os
+from collections import Counter
+from datetime import date, datetime
+from dateutil.relativedelta import relativedelta
+from flask import current_app
+from sqlalchemy import text
+from models import db, Log
+
+# Linhas por membro gzip do segmento (granularidade do salto por cursor)
+LINHAS_POR_BLOCO = 1000
+
+# --- Partições (Postgres) ---
+
+def _nome_particao(mes):
+    return f'logs_{mes.year:04d}_{mes.month:02d}'
+
+
+def _logs_particionada():
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return False
+    relkind = db.session.execute(
+        text("SELECT relkind FROM pg_class WHERE relname = 'logs'")
+    ).scalar()
+    return relkind == 'p'
+
+
+def _particao_existe(nome):
+    return db.session.execute(
+        text('SELECT to_regclass(:nome) IS NOT NULL'), {'nome': nome}
+    ).scalar()
+
+
+def garantir_particoes(meses_a_frente=2):
+    """
+    Cria as partições mensais do mês atual e dos próximos meses
+
+    Sem efeito fora do Postgres ou com a tabela logs não particionada.
+
+    Returns:
+        list: Nomes das partições criadas
+    """
+    if not _logs_particionada():
+        return []
+
+    inicio = date.today().replace(day=1)
+    criadas = []
+    for i in range(meses_a_frente + 1):
+        mes = inicio + relativedelta(months=i)
+        nome = _nome_particao(mes)
+        if _particao_existe(nome):
+            continue
+        try:
+            db.session.execute(text(
+                f"CREATE TABLE {nome} PARTITION OF logs "
+                f"FOR VALUES FROM ('{mes.isoformat()}') TO ('{(mes + relativedelta(months=1)).isoformat()}')"
+            ))
+            db.session.commit()
+            criadas.append(nome)
+        except Exception as e:
+            # Mês que já tem registros em logs_padrao: continua lá até ser arquivado
+            db.session.rollback()
+            print(f"⚠️ Não foi possível criar a partição {nome}: {e}")
+    return criadas
+
+
+# --- Exportação ---
+
+def _diretorio():
+    diretorio = current_app.config['LOGS_ARQUIVO_DIR']
+    os.makedirs(diretorio, exist_ok=True)
+    return diretorio
+
+
+def _proximo_segmento(diretorio, mes):
+    base = os.path.join(diretorio, _nome_particao(mes))
+    caminho, n = base, 1
+    while os.path.exists(f'{caminho}.jsonl.gz'):
+        n += 1
+        caminho = f'{base}.{n}'
+    return caminho
+
+
+def arquivar_mes(mes):
+    """
+    Exporta os logs de um mês para um novo segmento e os remove do banco
+
+    Args:
+        mes (date): Qualquer dia do mês a arquivar
+
+    Returns:
+        dict: Índice lateral do segmento, ou None se o mês não tinha logs
+    """
+    mes = mes.replace(day=1)
+    fim = mes + relativedelta(months=1)
+    query = Log.query.filter(Log.created_at >= mes, Log.created_at < fim) \
+        .order_by(Log.created_at.desc(), Log.id.desc())
+
+    caminho = _proximo_segmento(_diretorio(), mes)
+    usuarios, tabelas, acoes = Counter(), Counter(), Counter()
+    total, mais_recente, mais_antigo = 0, None, None
+    sha = hashlib.sha256()
+
+    blocos, bloco = [], []
+
+    # Escreve em .tmp e renomeia: um segmento visível está sempre completo
+    with open(f'{caminho}.jsonl.gz.tmp', 'wb') as f:
+        for log in query.yield_per(1000):
+            dados = log.to_dict()
+            linha = json.dumps(dados, ensure_ascii=False, default=str) + '\n'
+            if not bloco:
+                blocos.append({'created_at': str(dados['created_at']), 'id': str(dados['id']), 'offset': f.tell()})
+            bloco.append(linha)
+            if len(bloco) >= LINHAS_POR_BLOCO:
+                f.write(gzip.compress(''.join(bloco).encode('utf-8')))
+                bloco.clear()
+            sha.update(linha.encode('utf-8'))
+            usuarios[log.usuario_id or ''] += 1
+            tabelas[log.tabela or ''] += 1
+            acoes[log.acao] += 1
+            mais_recente = mais_recente or log.created_at
+            mais_antigo = log.created_at
+            total += 1
+        if bloco:
+            f.write(gzip.compress(''.join(bloco).encode('utf-8')))
+
+    if not total:
+        os.remove(f'{caminho}.jsonl.gz.tmp')
+        return None
+
+    indice = {
+        'segmento': os.path.basename(f'{caminho}.jsonl.gz'),
+        'mes': mes.isoformat(),
+        'total': total,
+        'inicio': mais_antigo.isoformat(),
+        'fim': mais_recente.isoformat(),
+        'usuarios': dict(usuarios),
+        'tabelas': dict(tabelas),
+        'acoes': dict(acoes),
+        'sha256': sha.hexdigest(),
+        'blocos': blocos,
+        'arquivado_em': datetime.utcnow().isoformat()
+    }
+    with open(f'{caminho}.json.tmp', 'w', encoding='utf-8') as f:
+        json.dump(indice, f, ensure_ascii=False)
+    os.replace(f'{caminho}.jsonl.gz.tmp', f'{caminho}.jsonl.gz')
+    os.replace(f'{caminho}.json.tmp', f'{caminho}.json')
+
+    particao = _nome_particao(mes)
+    if _logs_particionada() and _particao_existe(particao):
+        db.session.execute(text(f'DROP TABLE {particao}'))
+    else:
+        Log.query.filter(Log.created_at >= mes, Log.created_at < fim).delete(synchronize_session=False)
+    db.session.commit()
+
+    return indice
+
+
+def arquivar_logs(meses_ativos=None):
+    """
+    Arquiva todos os meses anteriores à janela de LOGS_MESES_ATIVOS meses
+
+    Returns:
+        list: Índices dos segmentos gerados
+    """
+    if meses_ativos is None:
+        meses_ativos = current_app.config['LOGS_MESES_ATIVOS']
+    corte = date.today().replace(day=1) - relativedelta(months=meses_ativos - 1)
+
+    mais_antigo = db.session.query(db.func.min(Log.created_at)).scalar()
+    if mais_antigo is None:
+        return []
+
+    mes = mais_antigo.date().replace(day=1)
+    segmentos = []
+    while mes < corte:
+        indice = arquivar_mes(mes)
+        if indice:
+            segmentos.append(indice)
+        mes += relativedelta(months=1)
+    return segmentos
+
+
+# --- Leitura ---
+
+def listar_segmentos():
+    """Índices laterais dos segmentos arquivados, do mais recente ao mais antigo"""
+    diretorio = current_app.config['LOGS_ARQUIVO_DIR']
+    indices = []
+    for caminho in glob.glob(os.path.join(diretorio, 'logs_*.json')):
+        with open(caminho, encoding='utf-8') as f:
+            indices.append(json.load(f))
+    return sorted(indices, key=lambda i: i['fim'], reverse=True)
+
+
+def _chave(log):
+    return datetime.fromisoformat(log['created_at']), log['id']
+
+
+def _contagem_filtrada(indice, usuario_id=None, tabela=None, acao=None):
+    """Limite superior de registros do segmento que passam nos filtros"""
+    contagens = [indice['total']]
+    if usuario_id:
+        contagens.append(indice['usuarios'].get(usuario_id, 0))
+    if tabela:
+        contagens.append(indice['tabelas'].get(tabela, 0))
+    if acao:
+        contagens.append(sum(n for a, n in indice['acoes'].items() if a.startswith(acao)))
+    return min(contagens)
+
+
+def _inicio_leitura(indice, posicao):
+    """Byte do bloco que contém o cursor (0 sem cursor ou em segmentos sem blocos)"""
+    inicio = 0
+    if posicao:
+        # Blocos em ordem decrescente: o último com a primeira chave >= posição contém a fronteira
+        for bloco in indice.get('blocos', ()):
+            if _chave(bloco) < posicao:
+                break
+            inicio = bloco['offset']
+    return inicio
+
+
+def _ler_segmento(indice, posicao, usuario_id, tabela, acao):
+    caminho = os.path.join(current_app.config['LOGS_ARQUIVO_DIR'], indice['segmento'])
+    with open(caminho, 'rb') as bruto:
+        bruto.seek(_inicio_leitura(indice, posicao))
+        with gzip.open(bruto, 'rt', encoding='utf-8') as f:
+            for linha in f:
+                log = json.loads(linha)
+                if posicao and _chave(log) >= posicao:
+                    continue
+                if usuario_id and log['usuario_id'] != usuario_id:
+                    continue
+                if tabela and log['tabela'] != tabela:
+                    continue
+                if acao and not log['acao'].startswith(acao):
+                    continue
+                yield log
+
+
+def buscar_arquivados(limite, posicao=None, piso=None, usuario_id=None, tabela=None, acao=None):
+    """
+    Logs arquivados em ordem (created_at, id) decrescente
+
+    Args:
+        limite (int): Máximo de registros
+        posicao (tuple): (created_at, id) exclusivo a partir do qual buscar
+        piso (datetime): Ignora segmentos inteiramente anteriores a esta data
+        usuario_id, tabela: Filtros exatos
+        acao: Prefixo da ação
+
+    Returns:
+        list: Logs no formato de Log.to_dict()
+    """
+    candidatos = []
+    for indice in listar_segmentos():
+        if posicao and datetime.fromisoformat(indice['inicio']) > posicao[0]:
+            continue
+        if piso and datetime.fromisoformat(indice['fim']) < piso:
+            continue
+        if not _contagem_filtrada(indice, usuario_id, tabela, acao):
+            continue
+        candidatos.append(_ler_segmento(indice, posicao, usuario_id, tabela, acao))
+
+    # Segmentos de um mesmo mês podem se sobrepor no tempo: intercala por chave
+    logs = []
+    for log in heapq.merge(*candidatos, key=_chave, reverse=True):
+        logs.append(log)
+        if len(logs) >= limite:
+            break
+    return logs
+
+
+def contar_arquivados(usuario_id=None, tabela=None, acao=None):
+    """Total aproximado de logs arquivados que passam nos filtros"""
+    return sum(_contagem_filtrada(i, usuario_id, tabela, acao) for i in listar_segmentos())
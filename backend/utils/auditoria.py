@@ -0,0 +1,185 @@
+"""
+Gravação assíncrona e em lote do log de auditoria
+
+log_acao apenas coloca o registro num buffer em memória; um worker em
+segundo plano grava os registros acumulados com um INSERT de várias linhas
+quando o buffer atinge AUDITORIA_LOTE ou a cada AUDITORIA_INTERVALO
+segundos. Assim a auditoria não abre transação nem faz commit da sessão
+da requisição. O buffer é descarregado no encerramento do processo.
+"""
+import atexit
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+from sqlalchemy import insert
+from models import db, Log
+
+
+class AuditoriaLogs:
+    """Buffer de registros de auditoria com worker de gravação em lote"""
+
+    def __init__(self, app=None):
+        self._buffer = None
+        self._lote_pronto = threading.Event()
+        self._parar = threading.Event()
+        self._lock_gravacao = threading.Lock()
+        self._lock_worker = threading.Lock()
+        self._worker = None
+        self._app = None
+        self._contadores = {
+            'enfileirados': 0,
+            'gravados': 0,
+            'descartados': 0,
+            'lotes': 0,
+            'falhas': 0
+        }
+        self._ultimo_lote = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._app = app
+        self._buffer = queue.Queue(maxsize=app.config['AUDITORIA_MAX_BUFFER'])
+        app.auditoria = self
+        if app.config['AUDITORIA_ASSINCRONA']:
+            atexit.register(self.encerrar)
+
+    # --- Enfileiramento (caminho da requisição) ---
+
+    def registrar(self, usuario_id, acao, tabela=None, registro_id=None, detalhes=None, ip_address=None):
+        """
+        Coloca um registro no buffer (sem acesso ao banco)
+
+        Returns:
+            bool: False se o buffer estava cheio e o registro foi descartado
+        """
+        registro = {
+            'id': str(uuid.uuid4()),
+            'usuario_id': str(usuario_id) if usuario_id else None,
+            'acao': acao,
+            'tabela': tabela,
+            'registro_id': str(registro_id) if registro_id else None,
+            'detalhes': detalhes,
+            'ip_address': ip_address,
+            'created_at': datetime.utcnow()
+        }
+
+        try:
+            self._buffer.put_nowait(registro)
+        except queue.Full:
+            self._contadores['descartados'] += 1
+            print(f"⚠️ Buffer de auditoria cheio, registro '{acao}' descartado")
+            return False
+
+        self._contadores['enfileirados'] += 1
+
+        if self._app.config['AUDITORIA_ASSINCRONA']:
+            self._iniciar_worker()
+            if self._buffer.qsize() >= self._app.config['AUDITORIA_LOTE']:
+                self._lote_pronto.set()
+        return True
+
+    def metricas(self):
+        """Profundidade do buffer e contadores acumulados do processo"""
+        return {
+            'pendentes': self._buffer.qsize(),
+            'capacidade': self._buffer.maxsize,
+            'ultimo_lote': self._ultimo_lote.isoformat() if self._ultimo_lote else None,
+            **self._contadores
+        }
+
+    # --- Gravação ---
+
+    def descarregar(self):
+        """
+        Grava tudo o que está no buffer (no contexto de aplicação atual)
+
+        Returns:
+            int: Registros gravados
+        """
+        gravados = 0
+        with self._lock_gravacao:
+            while True:
+                lote = self._retirar_lote()
+                if not lote:
+                    return gravados
+                gravados += self._gravar(lote)
+
+    def _retirar_lote(self):
+        lote = []
+        tamanho = self._app.config['AUDITORIA_LOTE']
+        while len(lote) < tamanho:
+            try:
+                lote.append(self._buffer.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _gravar(self, lote):
+        try:
+            db.session.execute(insert(Log).values(lote))
+            db.session.commit()
+        except Exception as e:
+            # Um registro inválido (ex.: usuário excluído) não derruba o lote inteiro
+            db.session.rollback()
+            self._contadores['falhas'] += 1
+            print(f"❌ Erro ao gravar lote de auditoria ({len(lote)} registros): {e}")
+            return self._gravar_individualmente(lote)
+
+        self._contadores['gravados'] += len(lote)
+        self._contadores['lotes'] += 1
+        self._ultimo_lote = datetime.utcnow()
+        return len(lote)
+
+    def _gravar_individualmente(self, lote):
+        gravados = 0
+        for registro in lote:
+            try:
+                db.session.execute(insert(Log).values(registro))
+                db.session.commit()
+                gravados += 1
+            except Exception:
+                db.session.rollback()
+                self._contadores['descartados'] += 1
+        self._contadores['gravados'] += gravados
+        return gravados
+
+    # --- Worker ---
+
+    def _iniciar_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock_worker:
+            if self._worker is None or not self._worker.is_alive():
+                self._parar.clear()
+                self._worker = threading.Thread(target=self._trabalhar, daemon=True, name='auditoria-logs')
+                self._worker.start()
+
+    def _trabalhar(self):
+        intervalo = self._app.config['AUDITORIA_INTERVALO']
+        while not self._parar.is_set():
+            self._lote_pronto.wait(intervalo)
+            self._lote_pronto.clear()
+            self._descarregar_no_contexto()
+        self._descarregar_no_contexto()
+
+    def _descarregar_no_contexto(self):
+        with self._app.app_context():
+            try:
+                self.descarregar()
+            except Exception as e:
+                print(f"❌ Erro no worker de auditoria: {e}")
+            finally:
+                db.session.remove()
+
+    def encerrar(self, timeout=5):
+        """Para o worker e grava o que restou no buffer"""
+        self._parar.set()
+        self._lote_pronto.set()
+        worker = self._worker
+        if worker is not None and worker.is_alive():
+            worker.join(timeout)
+        if self._buffer.qsize():
+            self._descarregar_no_contexto()
@@ -1,7 +1,8 @@
 from functools import wraps
-from flask import request, jsonify
-from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
-from models import Usuario, db
+from flask import request, jsonify, current_app, has_request_context
+from flask_jwt_extended import verify_jwt_in_request
+from models import db
+from utils.tokens import tipo_usuario_atual, usuario_atual
 import re
 
 
@@ -19,10 +20,9 @@ def admin_required(fn):
     @wraps(fn)
     def wrapper(*args, **kwargs):
         verify_jwt_in_request()
-        user_id = get_jwt_identity()
-        user = Usuario.query.get(user_id)
         
-        if not user or user.tipo != 'admin':
+        # Papel vem do claim do token (sem consulta ao banco)
+        if tipo_usuario_atual() != 'admin':
             return jsonify({'error': 'Acesso negado. Apenas administradores.'}), 403
         
         return fn(*args, **kwargs)
@@ -34,10 +34,9 @@ def gestor_required(fn):
     @wraps(fn)
     def wrapper(*args, **kwargs):
         verify_jwt_in_request()
-        user_id = get_jwt_identity()
-        user = Usuario.query.get(user_id)
         
-        if not user or user.tipo not in ['admin', 'gestor']:
+        # Papel vem do claim do token (sem consulta ao banco)
+        if tipo_usuario_atual() not in ['admin', 'gestor']:
             return jsonify({'error': 'Acesso negado. Apenas gestores e administradores.'}), 403
         
         return fn(*args, **kwargs)
@@ -45,9 +44,8 @@ def gestor_required(fn):
 
 
 def get_current_user():
-    """Retorna o usuário atual baseado no JWT"""
-    user_id = get_jwt_identity()
-    return Usuario.query.get(user_id)
+    """Retorna o usuário atual baseado no JWT (uma consulta por requisição)"""
+    return usuario_atual()
 
 
 def validar_email(email):
@@ -80,17 +78,27 @@ def criar_erro(mensagem, codigo=400):
 
 
 def log_acao(usuario_id, acao, tabela=None, registro_id=None, detalhes=None, ip_address=None):
-    """Registra ação no log de auditoria"""
+    """
+    Registra ação no log de auditoria
+
+    O registro vai para o buffer de utils/auditoria.py e é gravado em lote
+    por um worker: não abre transação nem faz commit da sessão atual.
+    """
+    ip_address = ip_address or (request.remote_addr if has_request_context() else None)
+
+    auditoria = getattr(current_app, 'auditoria', None)
+    if auditoria is not None:
+        auditoria.registrar(usuario_id, acao, tabela, registro_id, detalhes, ip_address)
+        return
+
+    # Aplicação sem o buffer (scripts): gravação direta
     from models import Log
-    
-    log = Log(
+    db.session.add(Log(
         usuario_id=usuario_id,
         acao=acao,
         tabela=tabela,
         registro_id=registro_id,
         detalhes=detalhes,
-        ip_address=ip_address or request.remote_addr
-    )
-    
-    db.session.add(log)
+        ip_address=ip_address
+    ))
     db.session.commit()
@@ -0,0 +1,362 @@
+"""
+Busca de usuários por nome ou email digitado livremente
+
+O índice fica em memória em cada worker: nome e parte local do email de
+todos os usuários, sem acentos e em minúsculas, com um mapa de nome
+exato e listas invertidas por palavra. Um nome exato é um acesso a
+dicionário. Nas demais buscas, cada palavra digitada é comparada só com
+o vocabulário (as palavras distintas dos nomes, bem menos numerosas que
+os usuários): igual, prefixo (por bisect no vocabulário ordenado) ou
+parecida por trigramas (como o pg_trgm: cada palavra com dois espaços
+antes e um depois). Só os cadastros dessas palavras são pontuados, sem
+varredura da tabela nem ILIKE.
+
+Cada candidato recebe uma nota de 0 a 1. A resolução só escolhe um
+cadastro quando ele se destaca dos demais; senão a ambiguidade é
+informada com os candidatos, em vez de ficar com o primeiro encontrado.
+
+Sincronização: inserir, excluir ou mudar nome, email, tipo ou status de
+um usuário invalida a tag de cache 'usuarios' após o commit. Cada
+worker compara a geração da tag (lida da camada local do cache) com a do
+seu índice e o remonta, com uma consulta, quando ela muda. Inserções em
+massa sem o ORM (ex: benchmarks) devem chamar invalidar().
+"""
+import bisect
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from models import db, Usuario, Plantonista
+from utils.cache_utils import geracoes_tags, invalidate_tags
+
+TAG_USUARIOS = 'usuarios'
+
+# Peso de uma palavra da consulta igual, prefixo ou parecida (x similaridade de trigramas)
+PESO_IGUAL = 1.0
+PESO_PREFIXO = 0.8
+PESO_SIMILAR = 0.9
+SIMILARIDADE_MINIMA = 0.5
+
+# Nota mínima para aparecer entre os candidatos
+NOTA_MINIMA = 0.3
+
+# Nota mínima e vantagem sobre o segundo candidato para resolver um nome
+NOTA_RESOLUCAO = 0.6
+MARGEM_RESOLUCAO = 0.15
+
+# Campos que entram no índice: mudanças neles invalidam os índices
+_CAMPOS_INDEXADOS = ('nome', 'email', 'tipo', 'ativo')
+
+
+def normalizar_nome(nome):
+    """Minúsculas, sem acentos e com espaços simples"""
+    sem_acentos = unicodedata.normalize('NFKD', str(nome)).encode('ascii', 'ignore').decode()
+    return ' '.join(sem_acentos.lower().split())
+
+
+def _palavras(texto):
+    return re.findall(r'[a-z0-9]+', normalizar_nome(texto))
+
+
+def _trigramas(palavras):
+    trigramas = set()
+    for palavra in palavras:
+        completa = f'  {palavra} '
+        trigramas.update(completa[i:i + 3] for i in range(len(completa) - 2))
+    return frozenset(trigramas)
+
+
+class NomeNaoEncontrado(ValueError):
+    """Nenhum cadastro corresponde ao texto"""
+
+
+class NomeAmbiguo(ValueError):
+    """Mais de um cadastro corresponde ao texto"""
+
+    def __init__(self, mensagem, candidatos):
+        super().__init__(mensagem)
+        self.candidatos = candidatos
+
+
+class IndiceNomes:
+    """Índice de nomes e emails de usuários, montado com uma única consulta"""
+
+    def __init__(self, registros):
+        """
+        Args:
+            registros: Iterável de (usuario_id, plantonista_id, nome, email, tipo, ativo)
+        """
+        self.registros = []
+        self._por_nome = defaultdict(list)
+        self._por_email = {}
+        # Documento: nome ou parte local do email ('jose.silva' -> 'jose silva') de um registro
+        self._documentos = []
+        self._postagens = defaultdict(list)
+
+        for i, (usuario_id, plantonista_id, nome, email, tipo, ativo) in enumerate(registros):
+            self.registros.append({
+                'usuario_id': str(usuario_id),
+                'plantonista_id': str(plantonista_id) if plantonista_id else None,
+                'nome': nome,
+                'email': email,
+                'tipo': tipo,
+                'ativo': bool(ativo)
+            })
+            email = (email or '').lower()
+            self._por_email[email] = i
+            self._por_nome[' '.join(_palavras(nome))].append(i)
+
+            for texto in (nome, email.split('@', 1)[0]):
+                palavras = frozenset(_palavras(texto))
+                if palavras:
+                    for palavra in palavras:
+                        self._postagens[palavra].append(len(self._documentos))
+                    self._documentos.append((i, palavras))
+
+        # Vocabulário ordenado (prefixos por bisect) e trigramas de cada palavra (erros de digitação)
+        self._vocabulario = sorted(self._postagens)
+        self._trigramas = defaultdict(list)
+        self._quantidade_trigramas = {}
+        for palavra in self._vocabulario:
+            if not palavra.isalpha():
+                # Números e identificadores ('user42') só por igualdade ou prefixo
+                continue
+            trigramas = _trigramas([palavra])
+            self._quantidade_trigramas[palavra] = len(trigramas)
+            for trigrama in trigramas:
+                self._trigramas[trigrama].append(palavra)
+
+    @classmethod
+    def carregar(cls):
+        return cls(db.session.execute(
+            select(Usuario.id, Plantonista.id, Usuario.nome, Usuario.email, Usuario.tipo, Usuario.ativo)
+            .outerjoin(Plantonista, Plantonista.usuario_id == Usuario.id)
+        ).all())
+
+    def __len__(self):
+        return len(self.registros)
+
+    def _variantes(self, palavra):
+        """Palavras do vocabulário que correspondem a uma palavra da consulta, com o peso"""
+        pesos = {}
+        if palavra in self._postagens:
+            pesos[palavra] = PESO_IGUAL
+        # Prefixos incluem iniciais: 's' vale para silva, souza...
+        posicao = bisect.bisect_right(self._vocabulario, palavra)
+        while posicao < len(self._vocabulario) and self._vocabulario[posicao].startswith(palavra):
+            pesos[self._vocabulario[posicao]] = PESO_PREFIXO
+            posicao += 1
+
+        trigramas = _trigramas([palavra])
+        comuns = Counter()
+        for trigrama in trigramas:
+            comuns.update(self._trigramas.get(trigrama, ()))
+        # Similaridade nunca passa de comuns / trigramas da consulta
+        minimo = SIMILARIDADE_MINIMA * len(trigramas)
+        for variante, quantidade in comuns.items():
+            if quantidade >= minimo and variante not in pesos:
+                similaridade = quantidade / (len(trigramas) + self._quantidade_trigramas[variante] - quantidade)
+                if similaridade >= SIMILARIDADE_MINIMA:
+                    pesos[variante] = PESO_SIMILAR * similaridade
+        return pesos
+
+    def _melhores(self, pesos):
+        """Documento -> maior peso entre as variantes de uma palavra"""
+        melhores = {}
+        for variante, peso in pesos.items():
+            for documento in self._postagens[variante]:
+                if peso > melhores.get(documento, 0):
+                    melhores[documento] = peso
+        return melhores
+
+    def _aceito(self, i, tipo, ativos):
+        registro = self.registros[i]
+        if tipo and registro['tipo'] != tipo:
+            return False
+        return not ativos or registro['ativo']
+
+    def buscar(self, texto, tipo=None, limite=10, ativos=False):
+        """
+        Candidatos para o texto, do mais ao menos provável
+
+        Todas as palavras da consulta precisam corresponder (iguais, como
+        prefixo ou parecidas) a palavras do nome ou do email. A nota
+        combina a qualidade dessas correspondências (70%) com a fração
+        do nome coberta pela consulta (30%): 'Ana' dá 0,85 para 'Ana
+        Costa', e o nome completo, 1.
+
+        Args:
+            texto: Nome (completo, parcial, sem acentos) ou email
+            tipo: Restringe a um tipo de usuário (ex: 'plantonista')
+            limite: Máximo de candidatos
+            ativos: Só usuários ativos
+
+        Returns:
+            list: Registros com a 'nota' (0 a 1)
+        """
+        texto = (texto or '').strip()
+        if '@' in texto:
+            i = self._por_email.get(texto.lower())
+            if i is not None and self._aceito(i, tipo, ativos):
+                return [{**self.registros[i], 'nota': 1.0}]
+
+        palavras = list(dict.fromkeys(_palavras(texto)))
+        if not palavras:
+            return []
+
+        # Começa pela palavra com menos documentos; para as demais, percorre as
+        # listas invertidas ou confere os documentos que restaram (o que for menor)
+        variantes = sorted(
+            ((sum(len(self._postagens[v]) for v in pesos), pesos) for pesos in map(self._variantes, palavras)),
+            key=lambda item: item[0]
+        )
+        somas = self._melhores(variantes[0][1])
+        for custo, pesos in variantes[1:]:
+            if custo <= 4 * len(somas):
+                melhores = self._melhores(pesos)
+                somas = {d: soma + melhores[d] for d, soma in somas.items() if d in melhores}
+                continue
+            restantes = {}
+            for documento, soma in somas.items():
+                melhor = max((pesos.get(p, 0) for p in self._documentos[documento][1]), default=0)
+                if melhor:
+                    restantes[documento] = soma + melhor
+            somas = restantes
+
+        notas = {}
+        for documento, soma in somas.items():
+            i, palavras_documento = self._documentos[documento]
+            if not self._aceito(i, tipo, ativos):
+                continue
+            nota = 0.7 * soma / len(palavras) + 0.3 * len(palavras) / max(len(palavras_documento), len(palavras))
+            if nota >= NOTA_MINIMA and nota > notas.get(i, 0):
+                notas[i] = nota
+
+        ordem = sorted(notas.items(), key=lambda n: (-n[1], self.registros[n[0]]['nome']))
+        return [{**self.registros[i], 'nota': round(nota, 3)} for i, nota in ordem[:limite]]
+
+    def resolver(self, texto, tipo=None, ativos=False):
+        """
+        Cadastro que corresponde ao texto
+
+        Um nome exato (ignorando acentos, caixa e espaços) ou email único
+        resolve direto. Sem isso, o melhor candidato precisa de nota
+        NOTA_RESOLUCAO e de MARGEM_RESOLUCAO sobre o segundo.
+
+        Raises:
+            NomeNaoEncontrado: Nenhum candidato
+            NomeAmbiguo: Mais de um candidato plausível (em .candidatos)
+        """
+        chave = ' '.join(_palavras(texto))
+        if not chave:
+            raise NomeNaoEncontrado('Nome não informado')
+        exatos = [
+            i for i in self._por_nome.get(chave, ())
+            if self._aceito(i, tipo, ativos)
+        ]
+        if len(exatos) == 1:
+            return self.registros[exatos[0]]
+        if exatos:
+            candidatos = [{**self.registros[i], 'nota': 1.0} for i in exatos]
+            raise NomeAmbiguo(self._mensagem_ambiguo(candidatos), candidatos)
+
+        candidatos = self.buscar(texto, tipo=tipo, ativos=ativos, limite=5)
+        escolhido = decidir(candidatos)
+        if escolhido:
+            return escolhido
+        plausiveis = [c for c in candidatos if c['nota'] >= NOTA_RESOLUCAO]
+        if not plausiveis:
+            raise NomeNaoEncontrado('Plantonista não encontrado' if tipo == 'plantonista' else 'Usuário não encontrado')
+        raise NomeAmbiguo(self._mensagem_ambiguo(plausiveis), plausiveis)
+
+    @staticmethod
+    def _mensagem_ambiguo(candidatos):
+        return f"Nome ambíguo: {', '.join(c['nome'] for c in candidatos)}"
+
+
+def decidir(candidatos):
+    """Melhor candidato, se ele se destaca dos demais (None se ambíguo ou fraco)"""
+    if not candidatos or candidatos[0]['nota'] < NOTA_RESOLUCAO:
+        return None
+    if len(candidatos) > 1 and candidatos[1]['nota'] > candidatos[0]['nota'] - MARGEM_RESOLUCAO:
+        return None
+    return candidatos[0]
+
+
+class BuscaNomes:
+    """Índice de nomes do worker, remontado quando os usuários mudam"""
+
+    def __init__(self, app=None):
+        self._indice = None
+        self._geracao = None
+        self._lock = threading.Lock()
+        self._contadores = {'montagens': 0, 'consultas': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.busca_nomes = self
+
+    def indice(self):
+        """Índice atual (remontado se a tag 'usuarios' mudou desde a montagem)"""
+        geracoes = geracoes_tags([TAG_USUARIOS])
+        geracao = geracoes[0] if geracoes else self._geracao
+        indice = self._indice
+        if indice is not None and geracao == self._geracao:
+            return indice
+
+        with self._lock:
+            if self._indice is None or geracao != self._geracao:
+                # A geração é lida antes da consulta: uma mudança no meio remonta de novo
+                self._indice = IndiceNomes.carregar()
+                self._geracao = geracao
+                self._contadores['montagens'] += 1
+            return self._indice
+
+    def buscar(self, texto, **filtros):
+        self._contadores['consultas'] += 1
+        return self.indice().buscar(texto, **filtros)
+
+    def resolver(self, texto, **filtros):
+        self._contadores['consultas'] += 1
+        return self.indice().resolver(texto, **filtros)
+
+    def invalidar(self):
+        """Descarta o índice deste worker e avisa os demais"""
+        self._indice = None
+        invalidate_tags(TAG_USUARIOS)
+
+    def metricas(self):
+        return {'usuarios': len(self._indice) if self._indice is not None else None, **self._contadores}
+
+
+# --- Sincronização com o cadastro ---
+
+@event.listens_for(Session, 'before_flush')
+def _marcar_mudanca_de_usuarios(session, flush_context, instances):
+    for obj in (*session.new, *session.deleted):
+        if isinstance(obj, (Usuario, Plantonista)):
+            session.info['usuarios_alterados'] = True
+            return
+    for obj in session.dirty:
+        if isinstance(obj, Usuario):
+            estado = inspect(obj)
+            if any(getattr(estado.attrs, campo).history.has_changes() for campo in _CAMPOS_INDEXADOS):
+                session.info['usuarios_alterados'] = True
+                return
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar_indices(session):
+    if session.info.pop('usuarios_alterados', None) and has_app_context():
+        busca = getattr(current_app, 'busca_nomes', None)
+        if busca is not None:
+            busca.invalidar()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_mudancas(session):
+    session.info.pop('usuarios_alterados', None)
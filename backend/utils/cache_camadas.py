@@ -0,0 +1,345 @@
+"""
+Cache em duas camadas: LRU em memória do processo na frente do Redis
+
+Leituras encontradas na camada local (L1) não vão ao Redis (L2). Toda
+escrita, remoção ou incremento passa pelas duas camadas e é publicada
+num barramento de invalidação, para que os outros workers descartem a
+cópia local da chave. O barramento usa pub/sub do Redis; em testes e
+sem Redis, um barramento em memória.
+
+Um disjuntor protege o Redis: após CACHE_DISJUNTOR_FALHAS erros seguidos
+o L2 deixa de ser consultado por CACHE_DISJUNTOR_PAUSA segundos e o
+cache segue só com o L1. Como invalidações podem ter sido perdidas nesse
+intervalo, o L1 é esvaziado quando o Redis volta. O TTL curto do L1
+(CACHE_L1_TTL) limita quanto tempo uma cópia local pode ficar defasada.
+"""
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class LRULocal:
+    """Dicionário LRU limitado em itens e em tempo de vida"""
+
+    def __init__(self, max_itens, ttl):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self._itens = OrderedDict()  # chave -> (expira_em, valor)
+        self._lock = threading.Lock()
+        self.contadores = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirados': 0}
+
+    def get(self, chave):
+        """
+        Returns:
+            tuple: (encontrado, valor)
+        """
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                self.contadores['misses'] += 1
+                return False, None
+            if item[0] <= time.monotonic():
+                del self._itens[chave]
+                self.contadores['expirados'] += 1
+                self.contadores['misses'] += 1
+                return False, None
+            self._itens.move_to_end(chave)
+            self.contadores['hits'] += 1
+            return True, item[1]
+
+    def set(self, chave, valor, timeout=None):
+        if self.max_itens <= 0:
+            return
+        # timeout 0/None (sem expiração no Redis) fica com o TTL do L1
+        ttl = min(timeout, self.ttl) if timeout else self.ttl
+        with self._lock:
+            self._itens[chave] = (time.monotonic() + ttl, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+                self.contadores['evictions'] += 1
+
+    def delete(self, chave):
+        with self._lock:
+            self._itens.pop(chave, None)
+
+    def clear(self):
+        with self._lock:
+            self._itens.clear()
+
+    def __len__(self):
+        return len(self._itens)
+
+
+class Disjuntor:
+    """Suspende o acesso ao Redis após falhas seguidas"""
+
+    FECHADO = 'fechado'
+    ABERTO = 'aberto'
+    SEMI_ABERTO = 'semi_aberto'
+
+    def __init__(self, falhas_max, pausa, ao_fechar=None):
+        self.falhas_max = falhas_max
+        self.pausa = pausa
+        self._ao_fechar = ao_fechar
+        self._falhas = 0
+        self._aberto_ate = 0
+        self._lock = threading.Lock()
+        self.estado = self.FECHADO
+        self.aberturas = 0
+
+    def permite(self):
+        """True se o Redis pode ser consultado agora"""
+        with self._lock:
+            if self.estado == self.FECHADO:
+                return True
+            if self.estado == self.ABERTO and time.monotonic() >= self._aberto_ate:
+                # Uma única tentativa decide se fecha ou reabre
+                self.estado = self.SEMI_ABERTO
+                return True
+            return False
+
+    def sucesso(self):
+        with self._lock:
+            reabriu = self.estado != self.FECHADO
+            self._falhas = 0
+            self.estado = self.FECHADO
+        if reabriu and self._ao_fechar:
+            self._ao_fechar()
+
+    def falha(self):
+        with self._lock:
+            self._falhas += 1
+            if self.estado == self.SEMI_ABERTO or self._falhas >= self.falhas_max:
+                if self.estado != self.ABERTO:
+                    self.aberturas += 1
+                self.estado = self.ABERTO
+                self._aberto_ate = time.monotonic() + self.pausa
+
+
+class BarramentoLocal:
+    """Barramento de invalidação em memória (testes e processo único)"""
+
+    def __init__(self):
+        self._assinantes = []
+        self.publicadas = 0
+
+    def assinar(self, callback):
+        self._assinantes.append(callback)
+
+    def publicar(self, mensagem):
+        self.publicadas += 1
+        for callback in list(self._assinantes):
+            callback(mensagem)
+
+
+class BarramentoRedis:
+    """Barramento de invalidação via pub/sub do Redis, entre workers e máquinas"""
+
+    CANAL = 'cache:invalidacao'
+
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url, socket_timeout=5, socket_connect_timeout=2)
+        self._assinantes = []
+        self._thread = None
+        self.publicadas = 0
+
+    def assinar(self, callback):
+        self._assinantes.append(callback)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._ouvir, daemon=True, name='cache-invalidacao')
+            self._thread.start()
+
+    def publicar(self, mensagem):
+        self._redis.publish(self.CANAL, json.dumps(mensagem))
+        self.publicadas += 1
+
+    def _entregar(self, mensagem):
+        for callback in list(self._assinantes):
+            callback(mensagem)
+
+    def _ouvir(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.CANAL)
+                # Invalidações publicadas enquanto estávamos desconectados se perderam
+                self._entregar({'limpar': True})
+                for item in pubsub.listen():
+                    if item.get('type') == 'message':
+                        self._entregar(json.loads(item['data']))
+            except Exception as e:
+                print(f"⚠️ Barramento de cache desconectado: {e}")
+                time.sleep(1)
+
+
+class CacheDuasCamadas:
+    """
+    L1 em memória na frente do cache do Flask-Caching (Redis)
+
+    Expõe as operações usadas por utils/cache_utils.py (get, get_many,
+    set, delete, inc, add) e substitui app.cache.
+    """
+
+    def __init__(self, app=None, cache=None, barramento=None):
+        self.l2 = cache
+        self.l1 = None
+        self.disjuntor = None
+        self.barramento = barramento
+        self.origem = str(uuid.uuid4())
+        self.contadores_l2 = {'hits': 0, 'misses': 0, 'erros': 0, 'ignorados': 0}
+        self.contadores_barramento = {'recebidas': 0, 'erros': 0}
+        if app is not None:
+            self.init_app(app, cache)
+
+    def init_app(self, app, cache):
+        self.l2 = cache
+        self.l1 = LRULocal(app.config['CACHE_L1_MAX'], app.config['CACHE_L1_TTL'])
+        self.disjuntor = Disjuntor(
+            app.config['CACHE_DISJUNTOR_FALHAS'],
+            app.config['CACHE_DISJUNTOR_PAUSA'],
+            ao_fechar=self.l1.clear
+        )
+
+        if self.barramento is None:
+            if app.config.get('CACHE_TYPE') in ('redis', 'RedisCache') and app.config['CACHE_BARRAMENTO'] == 'redis':
+                self.barramento = BarramentoRedis(app.config['CACHE_REDIS_URL'])
+            else:
+                self.barramento = BarramentoLocal()
+        self.barramento.assinar(self._receber)
+
+        app.cache = self
+
+    # --- Barramento ---
+
+    def _publicar(self, *chaves):
+        try:
+            self.barramento.publicar({'origem': self.origem, 'chaves': list(chaves)})
+        except Exception as e:
+            self.contadores_barramento['erros'] += 1
+            print(f"⚠️ Erro ao publicar invalidação de cache: {e}")
+
+    def _receber(self, mensagem):
+        if mensagem.get('origem') == self.origem:
+            return
+        self.contadores_barramento['recebidas'] += 1
+        if mensagem.get('limpar'):
+            self.l1.clear()
+            return
+        for chave in mensagem.get('chaves', []):
+            self.l1.delete(chave)
+
+    # --- Acesso ao L2 protegido pelo disjuntor ---
+
+    def _l2(self, operacao, *args, **kwargs):
+        """
+        Executa uma operação no L2
+
+        Returns:
+            tuple: (ok, resultado); ok=False com o disjuntor aberto ou em erro
+        """
+        if not self.disjuntor.permite():
+            self.contadores_l2['ignorados'] += 1
+            return False, None
+        try:
+            resultado = getattr(self.l2, operacao)(*args, **kwargs)
+        except Exception as e:
+            self.contadores_l2['erros'] += 1
+            self.disjuntor.falha()
+            print(f"❌ Erro no Redis ({operacao}): {e}")
+            return False, None
+        self.disjuntor.sucesso()
+        return True, resultado
+
+    # --- Operações ---
+
+    def get(self, chave):
+        encontrado, valor = self.l1.get(chave)
+        if encontrado:
+            return valor
+
+        ok, valor = self._l2('get', chave)
+        if not ok:
+            return None
+        if valor is None:
+            self.contadores_l2['misses'] += 1
+            return None
+        self.contadores_l2['hits'] += 1
+        self.l1.set(chave, valor)
+        return valor
+
+    def get_many(self, *chaves):
+        valores = {}
+        faltando = []
+        for chave in chaves:
+            encontrado, valor = self.l1.get(chave)
+            if encontrado:
+                valores[chave] = valor
+            else:
+                faltando.append(chave)
+
+        if faltando:
+            ok, lidos = self._l2('get_many', *faltando)
+            for chave, valor in zip(faltando, lidos if ok else [None] * len(faltando)):
+                if ok:
+                    self.contadores_l2['hits' if valor is not None else 'misses'] += 1
+                if valor is not None:
+                    self.l1.set(chave, valor)
+                valores[chave] = valor
+        return [valores[c] for c in chaves]
+
+    def set(self, chave, valor, timeout=None):
+        self.l1.set(chave, valor, timeout)
+        ok, _ = self._l2('set', chave, valor, timeout=timeout)
+        self._publicar(chave)
+        return ok
+
+    def delete(self, chave):
+        self.l1.delete(chave)
+        ok, _ = self._l2('delete', chave)
+        self._publicar(chave)
+        return ok
+
+    def inc(self, chave, delta=1):
+        ok, valor = self._l2('inc', chave, delta)
+        if not ok:
+            # Sem Redis: contador só neste processo até o disjuntor fechar
+            encontrado, atual = self.l1.get(chave)
+            valor = int(atual or 0) + delta
+        self.l1.set(chave, valor)
+        self._publicar(chave)
+        return valor
+
+    def add(self, chave, valor, timeout=None):
+        """SET NX no Redis (travas); sem Redis, só neste processo"""
+        ok, adicionado = self._l2('add', chave, valor, timeout=timeout)
+        if ok:
+            return adicionado
+        encontrado, _ = self.l1.get(chave)
+        if encontrado:
+            return False
+        self.l1.set(chave, valor, timeout)
+        return True
+
+    def metricas(self):
+        """Contadores por camada, estado do disjuntor e do barramento"""
+        return {
+            'l1': {
+                'itens': len(self.l1),
+                'capacidade': self.l1.max_itens,
+                **self.l1.contadores
+            },
+            'l2': dict(self.contadores_l2),
+            'disjuntor': {
+                'estado': self.disjuntor.estado,
+                'aberturas': self.disjuntor.aberturas
+            },
+            'barramento': {
+                'tipo': type(self.barramento).__name__,
+                'publicadas': self.barramento.publicadas,
+                **self.contadores_barramento
+            }
+        }
@@ -1,10 +1,33 @@
 """
 Utilitários para cache Redis
+
+Respostas de rotas são guardadas já serializadas (corpo JSON em bytes,
+status e cabeçalhos), nunca como objetos Response. Cada entrada recebe
+tags ('plantoes:2025-03', 'ranking', 'bi'...) e cada tag tem um contador
+de geração no cache. A entrada guarda as gerações com que foi calculada;
+invalidar uma tag é só incrementar o contador (O(1)) e toda entrada com
+geração antiga passa a ser obsoleta.
+
+Entradas obsoletas (invalidadas ou com o timeout vencido) continuam
+guardadas por CACHE_STALE_TIMEOUT segundos. Na próxima leitura, uma
+única requisição obtém a trava da chave e recalcula; as demais recebem a
+versão obsoleta (X-Cache: STALE) ou, se não houver, aguardam o novo
+valor. Assim uma invalidação na abertura das escolhas gera um recálculo
+por chave, e não um por cliente conectado.
+
+Cada entrada guarda também um ETag forte (hash do corpo) e a hora em que
+o corpo mudou pela última vez. Requisições condicionais (If-None-Match /
+If-Modified-Since) com a entrada em dia recebem 304 sem recalcular nem
+transferir o corpo; Cache-Control: no-cache faz navegadores e proxies
+sempre revalidarem.
 """
-from flask import current_app, request
+from flask import current_app, request, Response
 from flask_jwt_extended import get_jwt_identity
 import json
+import threading
+import time
 from datetime import datetime, date
+from dateutil.relativedelta import relativedelta
 import hashlib
 from functools import wraps
 
@@ -95,135 +118,316 @@ def cache_delete(key):
         return False
 
 
-def cache_clear_pattern(pattern):
+# --- Tags e gerações ---
+
+def _chave_tag(tag):
+    return f"tag:{tag}"
+
+
+def geracoes_tags(tags):
     """
-    Remove todas as chaves que correspondem a um padrão
-    
+    Geração atual de cada tag (0 se nunca invalidada), em uma única leitura
+
+    Returns:
+        list: Gerações na mesma ordem de tags
+    """
+    if not tags:
+        return []
+    try:
+        valores = current_app.cache.get_many(*[_chave_tag(t) for t in tags])
+        return [int(v or 0) for v in valores]
+    except Exception as e:
+        print(f"❌ Erro ao ler gerações de cache {tags}: {e}")
+        return None
+
+
+def invalidate_tags(*tags):
+    """
+    Invalida todas as entradas marcadas com qualquer uma das tags
+
     Args:
-        pattern (str): Padrão das chaves (ex: 'ranking_*')
+        *tags (str): Tags a invalidar (ex: 'ranking', 'plantoes:2025-03')
     """
+    if not hasattr(current_app, 'cache'):
+        return False
     try:
-        if hasattr(current_app, 'cache'):
-            # Para Flask-Caching com Redis
-            if hasattr(current_app.cache.cache, 'delete_many'):
-                current_app.cache.cache.delete_many(pattern)
-            print(f"🗑️ Cache limpo: {pattern}")
-            return True
-        else:
-            print("⚠️ Cache não configurado")
-            return False
+        atomico = _cache_redis()
+        for tag in tags:
+            chave = _chave_tag(tag)
+            if atomico:
+                # INCR do Redis: atômico entre workers e sem expiração
+                current_app.cache.inc(chave)
+            else:
+                # Sem timeout: a geração não pode voltar para um valor já usado
+                current_app.cache.set(chave, int(current_app.cache.get(chave) or 0) + 1, timeout=0)
     except Exception as e:
-        print(f"❌ Erro ao limpar cache {pattern}: {e}")
+        print(f"❌ Erro ao invalidar tags {tags}: {e}")
         return False
 
+    # Na abertura das escolhas, recoloca as leituras quentes no cache
+    aquecedor = getattr(current_app, 'aquecedor', None)
+    if aquecedor is not None:
+        aquecedor.apos_invalidacao()
+    return True
+
+
+def tag_mes(dia):
+    """Tag dos plantões do mês de uma data (ex: 'plantoes:2025-03')"""
+    return f"plantoes:{dia.year:04d}-{dia.month:02d}"
 
-def cached_function(timeout=None, key_prefix=None):
+
+def tags_periodo(inicio, fim):
     """
-    Decorator para cachear resultado de função
-    
-    Args:
-        timeout (int): Timeout do cache
-        key_prefix (str): Prefixo da chave
-    
-    Usage:
-        @cached_function(timeout=600, key_prefix='ranking')
-        def get_ranking():
-            return expensive_operation()
-    """
-    def decorator(func):
-        def wrapper(*args, **kwargs):
-            # Gerar chave baseada na função e argumentos
-            func_name = func.__name__
-            prefix = key_prefix or func_name
-            
-            # Criar hash dos argumentos para chave única
-            args_str = str(args) + str(sorted(kwargs.items()))
-            args_hash = hashlib.md5(args_str.encode()).hexdigest()[:8]
-            
-            cache_key = get_cache_key(prefix, args_hash)
-            
-            # Tentar buscar no cache
-            cached_result = cache_get(cache_key)
-            if cached_result is not None:
-                print(f"🎯 Cache hit: {cache_key}")
-                return cached_result
-            
-            # Executar função e cachear resultado
-            result = func(*args, **kwargs)
-            if result is not None:
-                cache_set(cache_key, result, timeout)
-                print(f"💾 Cache miss -> cached: {cache_key}")
-            
-            return result
-        
-        return wrapper
-    return decorator
+    Tags dos plantões de um período
 
+    Períodos abertos (sem início ou fim) dependem de qualquer mês e usam
+    'plantoes:todos', invalidada junto com cada mês.
+    """
+    if not inicio or not fim:
+        return ['plantoes', 'plantoes:todos']
+    tags = ['plantoes']
+    mes = inicio.replace(day=1)
+    while mes <= fim:
+        tags.append(tag_mes(mes))
+        mes += relativedelta(months=1)
+    return tags
 
-# Funções específicas para limpar cache de diferentes tipos
-def invalidate_rankings_cache():
-    """Invalida cache de rankings"""
-    cache_clear_pattern('ranking_*')
 
+# --- Cache de respostas ---
+
+def _serializar_resposta(resultado):
+    """Converte o retorno da rota em (corpo, status, cabeçalhos) picklável"""
+    if isinstance(resultado, tuple):
+        resposta, status = resultado[0], resultado[1]
+    else:
+        resposta, status = resultado, None
+    if not isinstance(resposta, Response):
+        resposta = current_app.make_response(resposta)
+    status = status or resposta.status_code
+    cabecalhos = [(k, v) for k, v in resposta.headers.items() if k.lower() not in ('content-length', 'set-cookie')]
+    return {
+        'corpo': resposta.get_data(),
+        'status': status,
+        'cabecalhos': cabecalhos
+    }
 
-def invalidate_stats_cache():
-    """Invalida cache de estatísticas"""
-    cache_clear_pattern('stats_*')
 
+def _carimbar_entrada(entrada, anterior):
+    """ETag forte do corpo e hora da última mudança (mantida se o corpo não mudou)"""
+    entrada['etag'] = hashlib.sha256(entrada['corpo']).hexdigest()[:32]
+    if anterior is not None and anterior.get('etag') == entrada['etag']:
+        entrada['modificado_em'] = anterior['modificado_em']
+    else:
+        entrada['modificado_em'] = datetime.utcnow().replace(microsecond=0)
 
-def invalidate_plantoes_cache():
-    """Invalida cache de plantões"""
-    cache_clear_pattern('plantoes_*')
 
+def _montar_resposta(entrada, estado, escopo=None):
+    resposta = Response(entrada['corpo'], status=entrada['status'], headers=entrada['cabecalhos'])
+    resposta.headers['X-Cache'] = estado
+    if entrada.get('etag'):
+        resposta.set_etag(entrada['etag'])
+        resposta.last_modified = entrada['modificado_em']
+        # Proxies só guardam respostas autenticadas marcadas como public
+        visibilidade = 'public' if escopo == ESCOPO_GLOBAL else 'private'
+        resposta.headers['Cache-Control'] = f'{visibilidade}, no-cache'
+        if escopo != ESCOPO_GLOBAL:
+            resposta.vary.add('Authorization')
+        # 304 sem corpo se o cliente já tem esta versão
+        resposta.make_conditional(request)
+    return resposta
 
-def cached_function(timeout=300, key_prefix='default'):
+
+def _entrada_fresca(entrada, geracoes, timeout):
+    """Entrada calculada com as gerações atuais e dentro do timeout"""
+    return entrada.get('geracoes') == geracoes and time.time() - entrada.get('criado_em', 0) < timeout
+
+
+# --- Travas de recálculo (single-flight) ---
+
+_travas_locais = {}
+_lock_travas_locais = threading.Lock()
+
+
+def _cache_redis():
+    return current_app.config.get('CACHE_TYPE') in ('redis', 'RedisCache')
+
+
+def _adquirir_trava(chave):
     """
-    Decorator para cache de funções/rotas
-    
+    Reserva o recálculo de uma chave
+
+    Com Redis a trava é um SET NX com expiração, válida entre workers e
+    máquinas; sem Redis, um registro em memória do processo.
+
+    Returns:
+        bool: True se esta requisição deve recalcular
+    """
+    validade = current_app.config.get('CACHE_TRAVA_TIMEOUT', 30)
+    if _cache_redis():
+        try:
+            return bool(current_app.cache.add(f"trava:{chave}", 1, timeout=validade))
+        except Exception as e:
+            # Redis fora do ar: cada requisição recalcula, como sem cache
+            print(f"❌ Erro ao obter trava de cache {chave}: {e}")
+            return True
+
+    agora = time.monotonic()
+    with _lock_travas_locais:
+        if _travas_locais.get(chave, 0) > agora:
+            return False
+        _travas_locais[chave] = agora + validade
+        return True
+
+
+def _liberar_trava(chave):
+    if _cache_redis():
+        try:
+            current_app.cache.delete(f"trava:{chave}")
+        except Exception as e:
+            print(f"❌ Erro ao liberar trava de cache {chave}: {e}")
+        return
+    with _lock_travas_locais:
+        _travas_locais.pop(chave, None)
+
+
+def _aguardar_entrada(chave, geracoes, timeout):
+    """Espera (até CACHE_ESPERA_MAX segundos) a entrada recalculada por outra requisição"""
+    limite = time.monotonic() + current_app.config.get('CACHE_ESPERA_MAX', 2.0)
+    while time.monotonic() < limite:
+        time.sleep(0.05)
+        entrada = cache_get(chave)
+        if entrada is not None and _entrada_fresca(entrada, geracoes, timeout):
+            return entrada
+    return None
+
+
+# Escopos de compartilhamento de uma entrada de cache
+ESCOPO_GLOBAL = 'global'    # mesma resposta para todos os usuários autorizados
+ESCOPO_PAPEL = 'papel'      # uma entrada por papel (plantonista, gestor, admin)
+ESCOPO_USUARIO = 'usuario'  # uma entrada por usuário
+
+ESCOPOS = (ESCOPO_GLOBAL, ESCOPO_PAPEL, ESCOPO_USUARIO)
+
+
+def _identidade_escopo(escopo):
+    """Parte da chave que separa as entradas conforme o escopo"""
+    if escopo == ESCOPO_GLOBAL:
+        return None
+    if escopo == ESCOPO_PAPEL:
+        from utils.tokens import tipo_usuario_atual
+        return f"papel:{tipo_usuario_atual()}"
+    return f"usuario:{get_jwt_identity() or 'anonymous'}"
+
+
+def cached_function(timeout=300, key_prefix='default', tags=None, escopo=ESCOPO_USUARIO):
+    """
+    Decorator para cache de rotas com invalidação por tags
+
+    Apenas respostas 200 são guardadas. A chave inclui a rota, a query
+    string e a identidade do escopo; a entrada guarda as gerações das
+    tags com que foi calculada. timeout é o tempo em que a entrada é
+    servida como fresca; depois dele (ou após invalidação) ela ainda é
+    servida como obsoleta enquanto outra requisição recalcula. Respostas
+    guardadas levam ETag e Last-Modified e respondem 304 às requisições
+    condicionais que já têm a versão atual. O
+    decorator deve ficar abaixo dos de autenticação: com escopo global ou
+    por papel, a entrada é servida a qualquer usuário que chegue até ele.
+
     Args:
-        timeout (int): Tempo de cache em segundos
+        timeout (int): Tempo em segundos em que a entrada é fresca
         key_prefix (str): Prefixo para a chave do cache
+        tags (list|callable): Tags da entrada, ou função que recebe os
+            argumentos da rota e devolve as tags
+        escopo (str): ESCOPO_GLOBAL, ESCOPO_PAPEL ou ESCOPO_USUARIO
+
+    Usage:
+        @cached_function(timeout=1800, key_prefix='ranking', tags=['ranking'], escopo=ESCOPO_PAPEL)
+        def get_ranking():
+            ...
     """
+    if escopo not in ESCOPOS:
+        raise ValueError(f'Escopo de cache inválido: {escopo}')
+
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             # Verificar se cache está disponível
             if not hasattr(current_app, 'cache'):
                 return f(*args, **kwargs)
-            
-            # Gerar chave única baseada na função, argumentos e usuário
-            user_id = get_jwt_identity() if get_jwt_identity() else 'anonymous'
-            
-            # Hash dos argumentos para garantir unicidade
+
+            try:
+                tags_entrada = tags(*args, **kwargs) if callable(tags) else list(tags or [])
+            except Exception:
+                # Argumentos inválidos: a própria rota responde o erro
+                return f(*args, **kwargs)
+
+            geracoes = geracoes_tags(tags_entrada)
+            if geracoes is None:
+                return f(*args, **kwargs)
+
+            # Chave estável baseada na rota, argumentos e escopo (sem as gerações)
             args_hash = hashlib.md5(
                 json.dumps({
-                    'args': str(args),
-                    'kwargs': str(kwargs),
-                    'user': user_id,
-                    'path': request.path if request else 'no_request'
+                    'path': request.path,
+                    'query': sorted(request.args.items(multi=True)),
+                    'kwargs': {k: str(v) for k, v in kwargs.items()},
+                    'escopo': _identidade_escopo(escopo),
                 }, sort_keys=True).encode()
-            ).hexdigest()[:8]
-            
-            cache_key = f"{key_prefix}_{f.__name__}_{args_hash}"
-            
+            ).hexdigest()
+
+            cache_key = f"{key_prefix}:{f.__name__}:{args_hash}"
+
+            entrada = cache_get(cache_key)
+            if entrada is not None and _entrada_fresca(entrada, geracoes, timeout):
+                return _montar_resposta(entrada, 'HIT', escopo)
+
+            # Single-flight: só quem obtém a trava recalcula
+            if not _adquirir_trava(cache_key):
+                if entrada is not None:
+                    return _montar_resposta(entrada, 'STALE', escopo)
+                entrada = _aguardar_entrada(cache_key, geracoes, timeout)
+                if entrada is not None:
+                    return _montar_resposta(entrada, 'HIT', escopo)
+                # Quem tinha a trava demorou demais: calcula sem cachear
+                return _montar_resposta(_serializar_resposta(f(*args, **kwargs)), 'MISS')
+
             try:
-                # Tentar buscar do cache
-                cached_result = cache_get(cache_key)
-                if cached_result is not None:
-                    return cached_result
-                
-                # Se não encontrou no cache, executar função
-                result = f(*args, **kwargs)
-                
-                # Salvar no cache
-                cache_set(cache_key, result, timeout)
-                
-                return result
-                
-            except Exception as e:
-                # Se houver erro com cache, executar função normalmente
-                current_app.logger.warning(f"Erro no cache: {e}")
-                return f(*args, **kwargs)
-                
+                anterior, entrada = entrada, _serializar_resposta(f(*args, **kwargs))
+                if entrada['status'] == 200:
+                    _carimbar_entrada(entrada, anterior)
+                    entrada['geracoes'] = geracoes
+                    entrada['criado_em'] = time.time()
+                    stale = current_app.config.get('CACHE_STALE_TIMEOUT', 0)
+                    cache_set(cache_key, entrada, timeout + stale)
+            finally:
+                _liberar_trava(cache_key)
+            return _montar_resposta(entrada, 'MISS', escopo)
+
         return decorated_function
-    return decorator
\ No newline at end of file
+    return decorator
+
+
+# Funções específicas para invalidar cache de diferentes tipos
+def invalidate_rankings_cache():
+    """Invalida cache de rankings"""
+    invalidate_tags('ranking')
+
+
+def invalidate_stats_cache():
+    """Invalida cache de estatísticas e BI"""
+    invalidate_tags('bi')
+
+
+def invalidate_plantoes_cache(*datas):
+    """
+    Invalida cache de plantões
+
+    Args:
+        *datas (date): Datas dos plantões alterados; sem datas invalida
+            todos os meses
+    """
+    if not datas:
+        invalidate_tags('plantoes')
+        return
+    meses = {tag_mes(d) for d in datas}
+    invalidate_tags('plantoes:todos', *sorted(meses))
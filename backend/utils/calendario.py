@@ -0,0 +1,164 @@
+"""
+Leitura otimizada e geração em lote do calendário de plantões
+"""
+import uuid
+from calendar import monthrange
+from datetime import datetime, timedelta
+from dateutil.relativedelta import relativedelta
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload, joinedload
+from models import db, Plantao, Alocacao, Plantonista, Configuracao
+from utils.db_utils import inserir_ignorando_duplicados
+from utils.alteracoes import registrar_plantoes_criados
+
+
+# Número máximo de queries emitidas por carregar_calendario, independente da
+# quantidade de plantões e alocações no período:
+#   1) plantões do período
+#   2) alocações desses plantões (selectin) já com plantonista e usuário (join)
+MAX_QUERIES_CALENDARIO = 2
+
+# Geração de plantões: padrões usados quando a configuração não existe
+DIAS_SEMANA = ['segunda', 'terca', 'quarta', 'quinta', 'sexta', 'sabado', 'domingo']
+TURNOS_PADRAO = ['manha', 'tarde']
+DIAS_FUNCIONAMENTO_PADRAO = DIAS_SEMANA[:6]  # segunda a sábado
+MAX_MESES_GERACAO = 24
+
+
+def carregar_calendario(inicio=None, fim=None, apenas_confirmadas=False):
+    """
+    Carrega plantões de um período já com alocações e nomes dos plantonistas
+
+    Args:
+        inicio (date): Primeiro dia do período (inclusivo)
+        fim (date): Último dia do período (inclusivo)
+        apenas_confirmadas (bool): Inclui apenas alocações confirmadas na lista
+
+    Returns:
+        list: Plantões serializados, cada um com a chave 'alocacoes'
+    """
+    query = Plantao.query.options(
+        selectinload(Plantao.alocacoes)
+        .joinedload(Alocacao.plantonista)
+        .joinedload(Plantonista.usuario)
+    )
+
+    if inicio:
+        query = query.filter(Plantao.data >= inicio)
+    if fim:
+        query = query.filter(Plantao.data <= fim)
+
+    plantoes = query.order_by(Plantao.data, Plantao.turno).all()
+
+    return [serializar_plantao(p, apenas_confirmadas) for p in plantoes]
+
+
+def serializar_plantao(plantao, apenas_confirmadas=False):
+    """Serializa um plantão com alocações já carregadas (sem novas queries)"""
+    plantao_dict = plantao.to_dict()
+
+    alocacoes = plantao.alocacoes or []
+    if apenas_confirmadas:
+        alocacoes = [a for a in alocacoes if a.status == 'confirmado']
+
+    plantao_dict['alocacoes'] = [a.to_dict() for a in alocacoes]
+    return plantao_dict
+
+
+def carregar_configuracao_geracao():
+    """
+    Lê turnos e dias de funcionamento da tabela configuracoes (uma query)
+
+    'turnos' pode ser o objeto de horários ({"manha": {...}, "tarde": {...}})
+    ou uma lista de nomes; 'dias_funcionamento' aceita nomes (segunda...domingo)
+    ou números de weekday (0=segunda).
+
+    Returns:
+        tuple: (lista de turnos, conjunto de weekdays de funcionamento)
+    """
+    valores = dict(db.session.execute(
+        select(Configuracao.chave, Configuracao.valor)
+        .where(Configuracao.chave.in_(['turnos', 'dias_funcionamento']))
+    ).all())
+
+    turnos = list(valores.get('turnos') or TURNOS_PADRAO)
+
+    dias = set()
+    for dia in valores.get('dias_funcionamento') or DIAS_FUNCIONAMENTO_PADRAO:
+        if isinstance(dia, int):
+            dias.add(dia % 7)
+        elif dia in DIAS_SEMANA:
+            dias.add(DIAS_SEMANA.index(dia))
+
+    return turnos, dias
+
+
+def gerar_plantoes(inicio, fim=None, max_plantonistas=None):
+    """
+    Cria os plantões de um intervalo de meses em lote (sem commit)
+
+    Uma query lê os plantões já existentes no intervalo e um INSERT de
+    várias linhas com ON CONFLICT (data, turno) DO NOTHING cria o restante,
+    então gerações simultâneas do mesmo mês não duplicam plantões.
+
+    Args:
+        inicio (date): Qualquer dia do primeiro mês
+        fim (date): Qualquer dia do último mês (padrão: o próprio mês de inicio)
+        max_plantonistas (int): Vagas por turno (padrão: MAX_PLANTONISTAS_POR_TURNO)
+
+    Returns:
+        dict: criados, existentes, inicio e fim do período gerado
+    """
+    primeiro_dia = inicio.replace(day=1)
+    ultimo_mes = (fim or inicio).replace(day=1)
+    ultimo_dia = ultimo_mes.replace(day=monthrange(ultimo_mes.year, ultimo_mes.month)[1])
+
+    if ultimo_dia < primeiro_dia:
+        raise ValueError('O mês final deve ser posterior ao inicial')
+    if primeiro_dia + relativedelta(months=MAX_MESES_GERACAO) <= ultimo_mes:
+        raise ValueError(f'É possível gerar no máximo {MAX_MESES_GERACAO} meses por vez')
+
+    if max_plantonistas is None:
+        max_plantonistas = current_app.config.get('MAX_PLANTONISTAS_POR_TURNO', 2)
+
+    turnos, dias_funcionamento = carregar_configuracao_geracao()
+
+    candidatos = []
+    dia = primeiro_dia
+    while dia <= ultimo_dia:
+        if dia.weekday() in dias_funcionamento:
+            candidatos.extend((dia, turno) for turno in turnos)
+        dia += timedelta(days=1)
+
+    existentes = set(db.session.execute(
+        select(Plantao.data, Plantao.turno)
+        .where(Plantao.data >= primeiro_dia, Plantao.data <= ultimo_dia)
+    ).all())
+
+    agora = datetime.utcnow()
+    linhas = [
+        {
+            'id': str(uuid.uuid4()),
+            'data': dia,
+            'turno': turno,
+            'status': 'disponivel',
+            'max_plantonistas': max_plantonistas,
+            'ocupadas': 0,
+            'created_at': agora,
+            'updated_at': agora
+        }
+        for dia, turno in candidatos
+        if (dia, turno) not in existentes
+    ]
+
+    criados = inserir_ignorando_duplicados(Plantao, linhas, ['data', 'turno']) if linhas else 0
+    if criados:
+        registrar_plantoes_criados(primeiro_dia, ultimo_dia, agora)
+
+    return {
+        'criados': criados,
+        'existentes': len(candidatos) - criados,
+        'inicio': primeiro_dia.isoformat(),
+        'fim': ultimo_dia.isoformat()
+    }
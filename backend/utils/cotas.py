@@ -0,0 +1,156 @@
+"""
+Livro-razão mensal de plantões por plantonista (tabela cotas_mensais)
+
+Cada linha guarda, para um plantonista e um mês, o total de plantões
+confirmados e um bitmap dos dias já ocupados. O limite mensal
+(Plantonista.max_plantoes_mes) e a regra de um plantão por dia viram um
+único UPDATE condicional sobre uma linha, em vez de joins sobre o mês.
+"""
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import select, update
+from models import db, Alocacao, Plantao, CotaMensal
+from utils.db_utils import inserir_ignorando_duplicados
+
+
+MASCARA_DIAS = (1 << 31) - 1
+
+# Motivos de recusa retornados por ocupar_cota
+MESMO_DIA = 'mesmo_dia'
+LIMITE_MENSAL = 'limite_mensal'
+
+
+def _bit_dia(dia):
+    return 1 << (dia.day - 1)
+
+
+def _garantir_cota(plantonista_id, mes_referencia):
+    inserir_ignorando_duplicados(
+        CotaMensal,
+        [{'plantonista_id': plantonista_id, 'mes_referencia': mes_referencia, 'total': 0, 'dias': 0}],
+        ['plantonista_id', 'mes_referencia']
+    )
+
+
+def ocupar_cota(plantonista_id, dia, limite=None):
+    """
+    Registra um plantão confirmado no livro-razão (sem commit)
+
+    Args:
+        plantonista_id (str): ID do plantonista
+        dia (date): Data do plantão
+        limite (int): Máximo de plantões no mês, ou None para não limitar
+
+    Returns:
+        str: None se registrou, ou o motivo da recusa (MESMO_DIA, LIMITE_MENSAL)
+    """
+    mes_referencia = dia.replace(day=1)
+    bit = _bit_dia(dia)
+    _garantir_cota(plantonista_id, mes_referencia)
+
+    condicoes = [
+        CotaMensal.plantonista_id == plantonista_id,
+        CotaMensal.mes_referencia == mes_referencia,
+        CotaMensal.dias.op('&')(bit) == 0
+    ]
+    if limite is not None:
+        condicoes.append(CotaMensal.total < limite)
+
+    resultado = db.session.execute(
+        update(CotaMensal)
+        .where(*condicoes)
+        .values(
+            total=CotaMensal.total + 1,
+            dias=CotaMensal.dias.op('|')(bit),
+            updated_at=datetime.utcnow()
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if resultado.rowcount == 1:
+        return None
+
+    dias = db.session.execute(
+        select(CotaMensal.dias).where(
+            CotaMensal.plantonista_id == plantonista_id,
+            CotaMensal.mes_referencia == mes_referencia
+        )
+    ).scalar()
+    return MESMO_DIA if (dias or 0) & bit else LIMITE_MENSAL
+
+
+def liberar_cota(plantonista_id, dia):
+    """Remove um plantão confirmado do livro-razão (sem commit)"""
+    bit = _bit_dia(dia)
+
+    db.session.execute(
+        update(CotaMensal)
+        .where(
+            CotaMensal.plantonista_id == plantonista_id,
+            CotaMensal.mes_referencia == dia.replace(day=1),
+            CotaMensal.dias.op('&')(bit) != 0
+        )
+        .values(
+            total=CotaMensal.total - 1,
+            dias=CotaMensal.dias.op('&')(MASCARA_DIAS ^ bit),
+            updated_at=datetime.utcnow()
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def verificar_cotas(corrigir=False):
+    """
+    Compara o livro-razão com as alocações confirmadas
+
+    Args:
+        corrigir (bool): Regrava as linhas divergentes
+
+    Returns:
+        list: Divergências (plantonista_id, mes_referencia, total, real_total, dias, real_dias)
+    """
+    reais = defaultdict(lambda: [0, 0])
+    alocacoes = db.session.execute(
+        select(Alocacao.plantonista_id, Plantao.data)
+        .join(Plantao, Plantao.id == Alocacao.plantao_id)
+        .where(Alocacao.status == 'confirmado')
+    ).all()
+    for plantonista_id, dia in alocacoes:
+        chave = (str(plantonista_id), dia.replace(day=1))
+        reais[chave][0] += 1
+        reais[chave][1] |= _bit_dia(dia)
+
+    registradas = {
+        (str(c.plantonista_id), c.mes_referencia): (c.total, c.dias)
+        for c in CotaMensal.query.all()
+    }
+
+    divergencias = []
+    for chave in set(reais) | set(registradas):
+        total, dias = registradas.get(chave, (0, 0))
+        real_total, real_dias = reais.get(chave, (0, 0))
+        if (total, dias) != (real_total, real_dias):
+            divergencias.append({
+                'plantonista_id': chave[0],
+                'mes_referencia': chave[1].isoformat(),
+                'total': total,
+                'real_total': real_total,
+                'dias': dias,
+                'real_dias': real_dias
+            })
+
+    if corrigir and divergencias:
+        for d in divergencias:
+            mes_referencia = datetime.strptime(d['mes_referencia'], '%Y-%m-%d').date()
+            _garantir_cota(d['plantonista_id'], mes_referencia)
+            db.session.execute(
+                update(CotaMensal)
+                .where(
+                    CotaMensal.plantonista_id == d['plantonista_id'],
+                    CotaMensal.mes_referencia == mes_referencia
+                )
+                .values(total=d['real_total'], dias=d['real_dias'], updated_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+        db.session.commit()
+
+    return sorted(divergencias, key=lambda d: (d['mes_referencia'], d['plantonista_id']))
@@ -0,0 +1,101 @@
+"""
+Utilitários de SQL compartilhados entre Postgres e SQLite
+"""
+from models import db
+
+
+def inserir_ignorando_duplicados(modelo, linhas, colunas_conflito, lote=500):
+    """
+    INSERT de várias linhas com ON CONFLICT (colunas) DO NOTHING
+
+    Args:
+        modelo: Modelo SQLAlchemy de destino
+        linhas (list): Dicionários com os valores de cada linha
+        colunas_conflito (list): Colunas da constraint UNIQUE
+        lote (int): Linhas por instrução (limite de parâmetros do SQLite)
+
+    Returns:
+        int: Número de linhas efetivamente inseridas
+    """
+    if not linhas:
+        return 0
+
+    insert = _insert_dialeto()
+    inseridas = 0
+    for i in range(0, len(linhas), lote):
+        instrucao = insert(modelo).values(linhas[i:i + lote]).on_conflict_do_nothing(
+            index_elements=colunas_conflito
+        )
+        inseridas += db.session.execute(instrucao).rowcount
+    return inseridas
+
+
+def _insert_dialeto():
+    dialeto = db.session.get_bind().dialect.name
+    if dialeto == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialeto == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f'ON CONFLICT não suportado para {dialeto}')
+    return insert
+
+
+def inserir_ou_atualizar(modelo, linhas, colunas_conflito, colunas_atualizar, lote=None):
+    """
+    INSERT de várias linhas com ON CONFLICT (colunas) DO UPDATE
+
+    As linhas não podem repetir a chave de conflito: o Postgres não
+    atualiza a mesma linha duas vezes no mesmo comando.
+
+    Args:
+        modelo: Modelo SQLAlchemy de destino
+        linhas (list): Dicionários com os valores de cada linha
+        colunas_conflito (list): Colunas da constraint UNIQUE
+        colunas_atualizar (list): Colunas sobrescritas quando a linha já existe
+        lote (int): Linhas por instrução; padrão: todas numa instrução no
+            Postgres e 500 no SQLite (limite de parâmetros)
+
+    Returns:
+        int: Número de linhas inseridas ou atualizadas
+    """
+    if not linhas:
+        return 0
+
+    insert = _insert_dialeto()
+    if lote is None:
+        lote = len(linhas) if db.session.get_bind().dialect.name == 'postgresql' else 500
+
+    afetadas = 0
+    for i in range(0, len(linhas), lote):
+        instrucao = insert(modelo).values(linhas[i:i + lote])
+        instrucao = instrucao.on_conflict_do_update(
+            index_elements=colunas_conflito,
+            set_={coluna: instrucao.excluded[coluna] for coluna in colunas_atualizar}
+        )
+        afetadas += db.session.execute(instrucao).rowcount
+    return afetadas
+
+
+def contar_aproximado(query):
+    """
+    Total estimado de linhas de uma consulta, sem COUNT(*) na tabela inteira
+
+    No Postgres usa a estimativa do planejador (EXPLAIN), que vem das
+    estatísticas da tabela; nos demais bancos faz a contagem exata.
+
+    Args:
+        query: Query SQLAlchemy com os filtros desejados (sem LIMIT)
+
+    Returns:
+        int: Número estimado de linhas
+    """
+    dialeto = db.session.get_bind().dialect
+    if dialeto.name != 'postgresql':
+        return query.order_by(None).count()
+
+    compilada = query.order_by(None).statement.compile(dialect=dialeto)
+    plano = db.session.connection().exec_driver_sql(
+        f'EXPLAIN (FORMAT JSON) {compilada}', compilada.params
+    ).scalar()
+    return int(plano[0]['Plan']['Plan Rows'])
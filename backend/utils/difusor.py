@@ -0,0 +1,138 @@
+"""
+Difusão agrupada das alterações de plantões via WebSocket
+
+Na abertura das escolhas cada reserva emitia o plantão e a alocação
+inteiros para toda a sala 'plantonistas'. O difusor acumula as
+alterações por plantão durante WEBSOCKET_AGRUPAR segundos e emite, para
+a sala de cada mês afetado (utils/websocket.py), um único evento
+'plantoes_delta' com apenas os campos que mudam numa reserva (id,
+ocupadas, status, versao). Várias reservas do mesmo plantão na janela
+viram um único delta, com a versão mais recente.
+
+Cada delta leva o cursor do feed de alterações (utils/alteracoes.py) e
+o evento, o maior deles: com ele o cliente retoma por
+GET /api/plantoes/changes?since=<cursor> depois de uma desconexão.
+
+Cada evento leva um número de sequência crescente da sala (INCR no
+Redis, comum a todos os workers). O cliente que perceber um salto na
+sequência do mês perdeu eventos e deve recarregar os plantões; como a
+entrega entre workers não garante ordem estrita, deltas de um mesmo
+plantão devem ser aplicados só se a versao for maior que a conhecida.
+"""
+import threading
+from collections import defaultdict
+from datetime import date, datetime
+from utils.websocket import sala_mes, PREFIXO_SALA_MES
+from utils.alteracoes import cursor_feed
+
+EVENTO = 'plantoes_delta'
+
+
+def delta_plantao(plantao):
+    """Campos do plantão enviados a cada alteração"""
+    return {
+        'id': str(plantao.id),
+        'data': plantao.data.isoformat() if plantao.data else None,
+        'turno': plantao.turno,
+        'status': plantao.status,
+        'ocupadas': plantao.ocupadas or 0,
+        'max_plantonistas': plantao.max_plantonistas,
+        'versao': plantao.versao,
+        'cursor': cursor_feed(plantao.id)
+    }
+
+
+class DifusorPlantoes:
+    """Acumula deltas de plantões e os emite em lote com número de sequência"""
+
+    def __init__(self, app=None):
+        self._app = None
+        self._pendentes = {}
+        self._lock = threading.Lock()
+        self._timer = None
+        self._sequencias_locais = defaultdict(int)
+        self._contadores = {'registrados': 0, 'emitidos': 0, 'eventos': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._app = app
+        app.difusor = self
+
+    # --- Registro (caminho da requisição) ---
+
+    def registrar(self, plantao):
+        """Agenda o delta do plantão (já persistido) para a próxima emissão"""
+        self.registrar_delta(delta_plantao(plantao))
+
+    def registrar_remocao(self, plantao_id, dia):
+        self.registrar_delta({
+            'id': str(plantao_id), 'data': dia.isoformat(), 'removido': True,
+            'versao': None, 'cursor': cursor_feed(plantao_id)
+        })
+
+    def registrar_delta(self, delta):
+        janela = self._app.config['WEBSOCKET_AGRUPAR']
+        with self._lock:
+            atual = self._pendentes.get(delta['id'])
+            if atual is None or (delta['versao'] or 0) >= (atual['versao'] or 0):
+                self._pendentes[delta['id']] = delta
+            self._contadores['registrados'] += 1
+            if janela and self._timer is None:
+                self._timer = threading.Timer(janela, self._descarregar_no_contexto)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def metricas(self):
+        return {
+            'pendentes': len(self._pendentes),
+            **self._contadores
+        }
+
+    # --- Emissão ---
+
+    def _proxima_sequencia(self, sala):
+        if self._app.config.get('CACHE_TYPE') in ('redis', 'RedisCache'):
+            return int(self._app.cache.inc(f'websocket:seq:{sala}'))
+        with self._lock:
+            self._sequencias_locais[sala] += 1
+            return self._sequencias_locais[sala]
+
+    def descarregar(self):
+        """
+        Emite os deltas acumulados, um evento por sala de mês
+
+        Returns:
+            list: Eventos emitidos (com a sala em 'mes')
+        """
+        with self._lock:
+            self._timer = None
+            deltas = list(self._pendentes.values())
+            self._pendentes.clear()
+
+        por_sala = defaultdict(list)
+        for delta in deltas:
+            por_sala[sala_mes(date.fromisoformat(delta['data']))].append(delta)
+
+        eventos = []
+        for sala, deltas_sala in por_sala.items():
+            cursores = [d['cursor'] for d in deltas_sala if d.get('cursor')]
+            evento = {
+                'mes': sala[len(PREFIXO_SALA_MES):],
+                'seq': self._proxima_sequencia(sala),
+                'cursor': max(cursores) if cursores else None,
+                'plantoes': deltas_sala,
+                'timestamp': datetime.utcnow().isoformat()
+            }
+            self._app.socketio.emit(EVENTO, evento, room=sala)
+            self._contadores['emitidos'] += len(deltas_sala)
+            self._contadores['eventos'] += 1
+            eventos.append(evento)
+        return eventos
+
+    def _descarregar_no_contexto(self):
+        with self._app.app_context():
+            try:
+                self.descarregar()
+            except Exception as e:
+                print(f"❌ Erro ao emitir deltas de plantões: {e}")
@@ -0,0 +1,216 @@
+"""
+Sala de espera para a abertura das escolhas (dia 25)
+
+Na abertura todo o top 10 tenta escolher no mesmo minuto. Em vez de cada
+requisição disputar uma conexão do pool, as escolhas entram numa fila de
+prioridade (ranking, ordem de chegada) e são processadas por um número
+limitado de workers. O cliente recebe um ticket, que pode consultar em
+GET /api/plantoes/fila/<ticket_id> ou aguardar o evento 'reserva_processada'
+na sala do usuário via Socket.IO.
+"""
+import itertools
+import queue
+import threading
+import time
+import uuid
+from flask import current_app
+from models import db, Plantonista
+from utils.reservas import reservar_plantao, concluir_escolha, ReservaNegada
+from utils.websocket import notify_user
+
+
+# Estados de um ticket
+NA_FILA = 'na_fila'
+PROCESSANDO = 'processando'
+CONFIRMADO = 'confirmado'
+RECUSADO = 'recusado'
+ERRO = 'erro'
+
+FINALIZADOS = (CONFIRMADO, RECUSADO, ERRO)
+
+
+class FilaCheia(Exception):
+    """Sala de espera atingiu FILA_RESERVAS_MAX"""
+
+
+class FilaReservas:
+    """Fila de escolhas com admissão controlada e workers limitados"""
+
+    def __init__(self, app=None):
+        self._fila = queue.PriorityQueue()
+        self._tickets = {}
+        self._lock = threading.Lock()
+        self._sequencia = itertools.count()
+        self._workers = []
+        self._app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._app = app
+        app.fila_reservas = self
+
+    # --- Admissão ---
+
+    def enfileirar(self, plantao_id, plantonista, usuario_id, ip_address=None):
+        """
+        Coloca uma escolha na sala de espera
+
+        Um plantonista com ticket pendente para o mesmo plantão recebe o
+        mesmo ticket de volta (requisições repetidas não furam a fila).
+
+        Returns:
+            dict: Ticket (id, status, posicao, ...)
+
+        Raises:
+            FilaCheia: Se a fila atingiu FILA_RESERVAS_MAX
+        """
+        self._limpar_expirados()
+
+        with self._lock:
+            for ticket in self._tickets.values():
+                if (ticket['plantao_id'] == str(plantao_id)
+                        and ticket['plantonista_id'] == str(plantonista.id)
+                        and ticket['status'] not in FINALIZADOS):
+                    return self._publico(ticket)
+
+            if self.pendentes() >= self._app.config['FILA_RESERVAS_MAX']:
+                raise FilaCheia()
+
+            ticket = {
+                'id': str(uuid.uuid4()),
+                'sequencia': next(self._sequencia),
+                'plantao_id': str(plantao_id),
+                'plantonista_id': str(plantonista.id),
+                'usuario_id': str(usuario_id),
+                'ranking': plantonista.ranking or 99,
+                'ip_address': ip_address,
+                'status': NA_FILA,
+                'criado_em': time.time(),
+                'finalizado_em': None,
+                'mensagem': None,
+                'codigo': None,
+                'alocacao': None
+            }
+            self._tickets[ticket['id']] = ticket
+            self._fila.put((ticket['ranking'], ticket['sequencia'], ticket['id']))
+            publico = self._publico(ticket)
+
+        self._iniciar_workers()
+        return publico
+
+    def consultar(self, ticket_id):
+        """Estado atual do ticket (None se não existir ou expirou)"""
+        with self._lock:
+            ticket = self._tickets.get(ticket_id)
+            return self._publico(ticket) if ticket else None
+
+    def pendentes(self):
+        """Quantidade de tickets aguardando processamento"""
+        return sum(1 for t in self._tickets.values() if t['status'] == NA_FILA)
+
+    def _posicao(self, ticket):
+        chave = (ticket['ranking'], ticket['sequencia'])
+        return 1 + sum(
+            1 for t in self._tickets.values()
+            if t['status'] == NA_FILA and (t['ranking'], t['sequencia']) < chave
+        )
+
+    def _publico(self, ticket):
+        dados = {
+            'id': ticket['id'],
+            'plantao_id': ticket['plantao_id'],
+            'usuario_id': ticket['usuario_id'],
+            'status': ticket['status'],
+            'mensagem': ticket['mensagem'],
+            'codigo': ticket['codigo'],
+            'alocacao': ticket['alocacao']
+        }
+        if ticket['status'] == NA_FILA:
+            dados['posicao'] = self._posicao(ticket)
+        return dados
+
+    def _limpar_expirados(self):
+        limite = time.time() - self._app.config['FILA_RESERVAS_TICKET_TTL']
+        with self._lock:
+            expirados = [
+                tid for tid, t in self._tickets.items()
+                if t['status'] in FINALIZADOS and t['finalizado_em'] < limite
+            ]
+            for tid in expirados:
+                del self._tickets[tid]
+
+    # --- Processamento ---
+
+    def _iniciar_workers(self):
+        total = self._app.config['FILA_RESERVAS_WORKERS']
+        with self._lock:
+            self._workers = [w for w in self._workers if w.is_alive()]
+            while len(self._workers) < total:
+                worker = threading.Thread(target=self._trabalhar, daemon=True, name='fila-reservas')
+                worker.start()
+                self._workers.append(worker)
+
+    def _trabalhar(self):
+        while True:
+            _, _, ticket_id = self._fila.get()
+            with self._app.app_context():
+                try:
+                    self._processar(ticket_id)
+                finally:
+                    db.session.remove()
+
+    def processar_proximo(self):
+        """
+        Processa o próximo ticket na thread atual (usado em testes e scripts)
+
+        Returns:
+            dict: Ticket processado, ou None se a fila estiver vazia
+        """
+        try:
+            _, _, ticket_id = self._fila.get_nowait()
+        except queue.Empty:
+            return None
+        self._processar(ticket_id)
+        return self.consultar(ticket_id)
+
+    def _processar(self, ticket_id):
+        with self._lock:
+            ticket = self._tickets.get(ticket_id)
+            if not ticket or ticket['status'] != NA_FILA:
+                return
+            ticket['status'] = PROCESSANDO
+
+        try:
+            plantonista = db.session.get(Plantonista, ticket['plantonista_id'])
+            alocacao, plantao = reservar_plantao(ticket['plantao_id'], plantonista)
+        except ReservaNegada as e:
+            self._finalizar(ticket, RECUSADO, e.mensagem, e.codigo)
+            return
+        except Exception as e:
+            current_app.logger.error(f"Erro na fila de reservas: {e}")
+            self._finalizar(ticket, ERRO, f'Erro ao escolher plantão: {str(e)}', 500)
+            return
+
+        # A alocação já foi gravada: o ticket é confirmado antes dos efeitos
+        # posteriores, para uma falha neles não virar ERRO e um novo pedido
+        self._finalizar(ticket, CONFIRMADO, 'Plantão escolhido com sucesso', 201, alocacao.to_dict())
+        try:
+            concluir_escolha(ticket['usuario_id'], alocacao, plantao, ticket['ip_address'])
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Erro após confirmar a reserva {alocacao.id}: {e}")
+
+    def _finalizar(self, ticket, status, mensagem, codigo, alocacao=None):
+        with self._lock:
+            ticket.update({
+                'status': status,
+                'mensagem': mensagem,
+                'codigo': codigo,
+                'alocacao': alocacao,
+                'finalizado_em': time.time()
+            })
+            publico = self._publico(ticket)
+
+        notify_user(ticket['usuario_id'], publico, 'reserva_processada')
+
@@ -0,0 +1,295 @@
+"""
+Placar incremental do ranking mensal
+
+calcular_ranking_mes reordena o mês inteiro. Para a edição de uma única
+pontuação, o placar mantém a ordem de cada mês num conjunto ordenado
+(sorted set do Redis, comum a todos os workers) e, quando o mês editado
+é o do ranking vigente, regrava em Plantonista.ranking só as posições
+entre a antiga e a nova do plantonista editado.
+
+Sem Redis a lista ordenada é de cada processo e não vê as edições feitas
+em outros workers; nesse caso toda edição do mês vigente refaz o cálculo
+completo em vez de gravar posições a partir de uma ordem desatualizada.
+
+A ordem é a mesma do cálculo completo: pontos decrescentes, empate pelo
+id do plantonista. No Redis o score é -pontos, e o ZRANK desempata pelo
+membro em ordem crescente.
+
+Edições simultâneas em workers diferentes podem gravar posições fora de
+ordem. A cada RANKING_RECONCILIACAO segundos um worker refaz o cálculo
+completo do mês vigente e recarrega o placar, corrigindo desvios.
+"""
+import bisect
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import case, select, update
+from models import db, Pontuacao, Plantonista
+from utils.pontuacao import CalculadoraPontuacao, mes_ranking_vigente
+
+
+class PlacarLocal:
+    """Conjunto ordenado em memória (testes e ambiente sem Redis)"""
+
+    # Cada processo tem o seu: não é fonte confiável para edições incrementais
+    compartilhado = False
+
+    def __init__(self):
+        self._meses = {}
+        self._lock = threading.Lock()
+
+    def existe(self, mes):
+        return mes in self._meses
+
+    def carregar(self, mes, pontos):
+        with self._lock:
+            self._meses[mes] = (sorted((-p, pid) for pid, p in pontos.items()), dict(pontos))
+
+    def atualizar(self, mes, plantonista_id, pontos):
+        """Returns: (posição antiga ou None, posição nova), base 0"""
+        with self._lock:
+            ordem, atuais = self._meses[mes]
+            antiga = None
+            if plantonista_id in atuais:
+                antiga = bisect.bisect_left(ordem, (-atuais[plantonista_id], plantonista_id))
+                del ordem[antiga]
+            atuais[plantonista_id] = pontos
+            nova = bisect.bisect_left(ordem, (-pontos, plantonista_id))
+            ordem.insert(nova, (-pontos, plantonista_id))
+            return antiga, nova
+
+    def remover(self, mes, plantonista_id):
+        """Returns: posição antiga ou None, base 0"""
+        with self._lock:
+            ordem, atuais = self._meses[mes]
+            if plantonista_id not in atuais:
+                return None
+            antiga = bisect.bisect_left(ordem, (-atuais.pop(plantonista_id), plantonista_id))
+            del ordem[antiga]
+            return antiga
+
+    def intervalo(self, mes, inicio, fim):
+        """IDs das posições inicio..fim (inclusive, base 0)"""
+        with self._lock:
+            return [pid for _, pid in self._meses[mes][0][inicio:fim + 1]]
+
+    def tamanho(self, mes):
+        return len(self._meses[mes][0]) if mes in self._meses else 0
+
+
+class PlacarRedis:
+    """Sorted set por mês no Redis: O(log n) por edição, comum aos workers"""
+
+    PREFIXO = 'ranking:placar:'
+    compartilhado = True
+
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url, socket_timeout=5, socket_connect_timeout=2)
+
+    def _chave(self, mes):
+        return f"{self.PREFIXO}{mes.isoformat()}"
+
+    def existe(self, mes):
+        return bool(self._redis.exists(self._chave(mes)))
+
+    def carregar(self, mes, pontos):
+        # Monta numa chave temporária e troca com RENAME: leitores nunca veem o placar pela metade
+        temporaria = f"{self._chave(mes)}:carga"
+        pipe = self._redis.pipeline()
+        pipe.delete(temporaria)
+        if pontos:
+            pipe.zadd(temporaria, {pid: -p for pid, p in pontos.items()})
+            pipe.rename(temporaria, self._chave(mes))
+        else:
+            pipe.delete(self._chave(mes))
+        pipe.execute()
+
+    def atualizar(self, mes, plantonista_id, pontos):
+        chave = self._chave(mes)
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.zrank(chave, plantonista_id)
+        pipe.zadd(chave, {plantonista_id: -pontos})
+        pipe.zrank(chave, plantonista_id)
+        antiga, _, nova = pipe.execute()
+        return antiga, nova
+
+    def remover(self, mes, plantonista_id):
+        chave = self._chave(mes)
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.zrank(chave, plantonista_id)
+        pipe.zrem(chave, plantonista_id)
+        antiga, _ = pipe.execute()
+        return antiga
+
+    def intervalo(self, mes, inicio, fim):
+        return [pid.decode() for pid in self._redis.zrange(self._chave(mes), inicio, fim)]
+
+    def tamanho(self, mes):
+        return self._redis.zcard(self._chave(mes))
+
+
+class PlacarRanking:
+    """Mantém Plantonista.ranking a cada edição de pontuação, sem recalcular o mês"""
+
+    def __init__(self, app=None):
+        self._app = None
+        self.backend = None
+        self._worker = None
+        self._contadores = {'edicoes': 0, 'posicoes_gravadas': 0, 'reconciliacoes': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._app = app
+        app.placar = self
+        if app.config.get('CACHE_TYPE') in ('redis', 'RedisCache'):
+            self.backend = PlacarRedis(app.config['CACHE_REDIS_URL'])
+        else:
+            self.backend = PlacarLocal()
+        if app.config['RANKING_RECONCILIACAO']:
+            self._worker = threading.Thread(target=self._trabalhar, daemon=True, name='placar-ranking')
+            self._worker.start()
+
+    # --- Cálculo completo ---
+
+    def reconciliar(self, mes=None):
+        """
+        Recalcula o ranking do mês (padrão: o vigente) e recarrega o placar
+
+        Returns:
+            list: Pontuações do mês, da melhor para a pior
+        """
+        if isinstance(mes, str):
+            mes = datetime.strptime(mes, '%Y-%m-%d').date()
+        mes = mes or mes_ranking_vigente()
+        if mes is None:
+            return []
+        ranking = CalculadoraPontuacao().calcular_ranking_mes(mes)
+        self._carregar(mes, ranking)
+        self._contadores['reconciliacoes'] += 1
+        return ranking
+
+    def _carregar(self, mes, pontuacoes):
+        try:
+            self.backend.carregar(mes, {p.plantonista_id: float(p.pontos_total or 0) for p in pontuacoes})
+        except Exception as e:
+            # Sem placar a próxima edição faz o cálculo completo
+            print(f"❌ Erro ao carregar placar do ranking {mes}: {e}")
+
+    def _carregar_do_banco(self, mes):
+        linhas = db.session.execute(
+            select(Pontuacao.plantonista_id, Pontuacao.pontos_total)
+            .where(Pontuacao.mes_referencia == mes)
+        ).all()
+        self.backend.carregar(mes, {pid: float(pontos or 0) for pid, pontos in linhas})
+
+    # --- Edições ---
+
+    def atualizar(self, pontuacao):
+        """
+        Aplica a pontuação já gravada de um plantonista (após o commit)
+
+        Returns:
+            int: Nova posição no mês (base 1), ou None se recalculou o mês
+                ou se o placar não é compartilhado entre os workers
+        """
+        mes = pontuacao.mes_referencia
+        pontos = float(pontuacao.pontos_total or 0)
+        vigente = mes == mes_ranking_vigente()
+        if not self.backend.compartilhado:
+            # Outros workers podem ter editado o mês: cálculo completo
+            if vigente:
+                self.reconciliar(mes)
+            return None
+        try:
+            if not self.backend.existe(mes):
+                if vigente:
+                    # Posições no banco podem não refletir a ordem: cálculo completo
+                    self.reconciliar(mes)
+                    return None
+                # Já inclui a pontuação editada
+                self._carregar_do_banco(mes)
+            antiga, nova = self.backend.atualizar(mes, pontuacao.plantonista_id, pontos)
+        except Exception as e:
+            print(f"❌ Erro no placar do ranking: {e}")
+            if vigente:
+                self.reconciliar(mes)
+            return None
+
+        self._contadores['edicoes'] += 1
+        if vigente:
+            if antiga is None:
+                # Entrou no mês: todos a partir da nova posição descem uma
+                inicio, fim = nova, self.backend.tamanho(mes) - 1
+            else:
+                inicio, fim = min(antiga, nova), max(antiga, nova)
+            self._gravar_posicoes(mes, inicio, fim, pontuacao.plantonista_id, pontos)
+        return nova + 1
+
+    def remover(self, plantonista_id, mes):
+        """Retira do placar a pontuação excluída (após o commit)"""
+        vigente = mes == mes_ranking_vigente()
+        if not self.backend.compartilhado:
+            if vigente:
+                self.reconciliar(mes)
+            return
+        try:
+            if not self.backend.existe(mes):
+                if vigente:
+                    self.reconciliar(mes)
+                return
+            antiga = self.backend.remover(mes, plantonista_id)
+        except Exception as e:
+            print(f"❌ Erro no placar do ranking: {e}")
+            if vigente:
+                self.reconciliar(mes)
+            return
+
+        self._contadores['edicoes'] += 1
+        if vigente and antiga is not None:
+            # Os seguintes sobem uma posição; o excluído mantém a sua, como no cálculo completo
+            self._gravar_posicoes(mes, antiga, self.backend.tamanho(mes) - 1)
+
+    def _gravar_posicoes(self, mes, inicio, fim, plantonista_id=None, pontos=None):
+        """Grava em Plantonista.ranking as posições inicio..fim (base 0) do placar"""
+        ids = self.backend.intervalo(mes, inicio, fim) if fim >= inicio else []
+        if ids:
+            posicoes = {pid: inicio + i + 1 for i, pid in enumerate(ids)}
+            db.session.execute(
+                update(Plantonista)
+                .where(Plantonista.id.in_(ids))
+                .values(ranking=case(posicoes, value=Plantonista.id))
+                .execution_options(synchronize_session=False)
+            )
+        if plantonista_id is not None:
+            db.session.execute(
+                update(Plantonista)
+                .where(Plantonista.id == plantonista_id)
+                .values(pontuacao_total=pontos)
+                .execution_options(synchronize_session=False)
+            )
+        db.session.commit()
+        self._contadores['posicoes_gravadas'] += len(ids)
+
+    def metricas(self):
+        return {
+            'backend': 'redis' if isinstance(self.backend, PlacarRedis) else 'local',
+            **self._contadores
+        }
+
+    # --- Worker ---
+
+    def _trabalhar(self):
+        intervalo = self._app.config['RANKING_RECONCILIACAO']
+        while True:
+            time.sleep(intervalo)
+            with self._app.app_context():
+                try:
+                    # Com vários workers, apenas um reconcilia em cada intervalo
+                    if self._app.cache.add('ranking:reconciliacao', 1, timeout=max(intervalo - 1, 1)):
+                        self.reconciliar()
+                except Exception as e:
+                    print(f"❌ Erro na reconciliação do ranking: {e}")
+                finally:
+                    db.session.remove()
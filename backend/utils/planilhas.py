@@ -0,0 +1,86 @@
+"""
+Leitura de planilhas de pontuação linha a linha (CSV e XLSX)
+
+Os leitores são geradores de dicts com os cabeçalhos normalizados
+('Nome' -> 'nome', 'Placa Bairro Foco' -> 'placa_bairro_foco'): o
+arquivo nunca é carregado inteiro em memória. O upload multipart já
+chega num arquivo temporário (o Werkzeug passa para disco acima de
+500 KB), de onde as linhas são lidas sob demanda.
+
+XLSX requer o openpyxl (modo read_only, que também lê por linha); sem
+ele só CSV é aceito.
+"""
+import codecs
+import csv
+import io
+from itertools import chain
+from utils.busca_nomes import normalizar_nome
+
+try:
+    import openpyxl
+except ImportError:  # XLSX indisponível: só CSV
+    openpyxl = None
+
+
+class PlanilhaInvalida(Exception):
+    """Arquivo em formato não suportado ou sem cabeçalho"""
+
+
+def _coluna(cabecalho):
+    return normalizar_nome(cabecalho or '').replace(' ', '_')
+
+
+def ler_csv(arquivo):
+    """
+    Linhas de um CSV (UTF-8, separador ',' ou ';' detectado pelo cabeçalho)
+
+    Args:
+        arquivo: Arquivo binário (ex: FileStorage.stream)
+    """
+    texto = codecs.getreader('utf-8-sig')(arquivo, errors='replace')
+    cabecalho = texto.readline()
+    if not cabecalho.strip():
+        raise PlanilhaInvalida('Planilha vazia')
+    separador = ';' if cabecalho.count(';') > cabecalho.count(',') else ','
+
+    leitor = csv.reader(chain([cabecalho], texto), delimiter=separador)
+    colunas = [_coluna(c) for c in next(leitor)]
+    for valores in leitor:
+        if any(v.strip() for v in valores):
+            yield dict(zip(colunas, valores))
+
+
+def ler_xlsx(arquivo):
+    """Linhas da primeira aba de um XLSX"""
+    if openpyxl is None:
+        raise PlanilhaInvalida('Leitura de XLSX indisponível no servidor (instale openpyxl) - envie CSV')
+    try:
+        pasta = openpyxl.load_workbook(arquivo, read_only=True, data_only=True)
+    except Exception as e:
+        raise PlanilhaInvalida(f'XLSX inválido: {e}')
+    try:
+        linhas = pasta.worksheets[0].iter_rows(values_only=True)
+        colunas = [_coluna(c) for c in next(linhas, ())]
+        if not any(colunas):
+            raise PlanilhaInvalida('Planilha vazia')
+        for valores in linhas:
+            if any(v not in (None, '') for v in valores):
+                yield dict(zip(colunas, valores))
+    finally:
+        pasta.close()
+
+
+def ler_planilha(arquivo, nome_arquivo):
+    """
+    Gerador de linhas conforme a extensão do arquivo (.csv ou .xlsx)
+
+    Raises:
+        PlanilhaInvalida: Extensão não suportada
+    """
+    extensao = (nome_arquivo or '').rsplit('.', 1)[-1].lower()
+    if extensao == 'csv':
+        return ler_csv(arquivo)
+    if extensao == 'xlsx':
+        # O openpyxl precisa de um arquivo com seek (o temporário do upload)
+        return ler_xlsx(arquivo if hasattr(arquivo, 'seek') else io.BytesIO(arquivo.read()))
+    raise PlanilhaInvalida('Formato não suportado: envie .csv ou .xlsx')
@@ -1,7 +1,45 @@
+from flask import current_app
 from models import Pontuacao, Plantonista, Configuracao, db
 from datetime import datetime, date
 from dateutil.relativedelta import relativedelta
-from sqlalchemy import func
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import joinedload
+from utils.db_utils import inserir_ou_atualizar
+import uuid
+
+# Configuração com o mês cujo ranking está gravado em Plantonista.ranking
+CHAVE_MES_VIGENTE = 'ranking_mes_vigente'
+
+# Colunas lidas da planilha de importação e seus tipos
+CAMPOS_PLANILHA = {
+    'vendas': int,
+    'age_bairro_foco': int,
+    'age_canoas_poa': int,
+    'age_outros': int,
+    'acima_1mm': int,
+    'placa_bairro_foco': float,
+    'placa_canoas_poa': float,
+    'placa_outros': float
+}
+
+
+# Linhas válidas gravadas por upsert na importação
+LOTE_IMPORTACAO = 500
+
+
+def _converter(valor, tipo):
+    """Número de uma célula; texto aceita vírgula decimal ('1,5')"""
+    if isinstance(valor, str):
+        valor = valor.strip().replace(',', '.')
+    return tipo(valor or 0)
+
+
+def mes_ranking_vigente():
+    """Mês do último ranking calculado (ou o mais recente com pontuação)"""
+    cfg = Configuracao.query.filter_by(chave=CHAVE_MES_VIGENTE).first()
+    if cfg:
+        return datetime.strptime(cfg.valor, '%Y-%m-%d').date()
+    return db.session.query(func.max(Pontuacao.mes_referencia)).scalar()
 
 
 class CalculadoraPontuacao:
@@ -74,66 +112,125 @@ class CalculadoraPontuacao:
         
         return pontuacao
     
+    def _expressoes_pontos(self):
+        """Mesmas fórmulas de calcular_pontos, como expressões SQL sobre a tabela pontuacao"""
+        def peso(coluna, chave):
+            return func.coalesce(coluna, 0) * self.config[chave]
+        
+        pontos_vendas = peso(Pontuacao.vendas, 'pontos_venda')
+        pontos_age = (
+            peso(Pontuacao.age_bairro_foco, 'pontos_bairro_foco')
+            + peso(Pontuacao.age_canoas_poa, 'pontos_outros_bairros')
+            + peso(Pontuacao.age_outros, 'pontos_outros_bairros')
+        )
+        pontos_placas = (
+            peso(Pontuacao.placa_bairro_foco, 'pontos_placa_foco')
+            + peso(Pontuacao.placa_canoas_poa, 'pontos_placa_outros')
+            + peso(Pontuacao.placa_outros, 'pontos_placa_outros')
+        )
+        return {
+            'pontos_vendas': pontos_vendas,
+            'pontos_agenciamentos': pontos_age,
+            'pontos_placas': pontos_placas,
+            'pontos_total': pontos_vendas + pontos_age + pontos_placas
+        }
+    
+    def _gravar_ranking(self, pontos):
+        """
+        Grava posição e pontuação dos plantonistas em um único UPDATE ... FROM
+        
+        Args:
+            pontos: Subquery com as colunas plantonista_id e pontos_total;
+                plantonistas fora dela mantêm o ranking anterior
+        """
+        # Empates desempatados pelo id: posições únicas e estáveis entre cálculos
+        posicoes = select(
+            pontos.c.plantonista_id,
+            pontos.c.pontos_total,
+            func.row_number().over(
+                order_by=(pontos.c.pontos_total.desc(), pontos.c.plantonista_id)
+            ).label('posicao')
+        ).subquery()
+        
+        db.session.execute(
+            update(Plantonista)
+            .where(Plantonista.id == posicoes.c.plantonista_id)
+            .values(ranking=posicoes.c.posicao, pontuacao_total=posicoes.c.pontos_total)
+            .execution_options(synchronize_session=False)
+        )
+    
     def calcular_ranking_mes(self, mes_referencia):
-        """Calcula ranking para um mês específico"""
-        if isinstance(mes_referencia, str):
-            mes_referencia = datetime.strptime(mes_referencia, '%Y-%m-%d').date()
+        """
+        Calcula ranking para um mês específico
         
-        # Buscar todas as pontuações do mês
-        pontuacoes = Pontuacao.query.filter_by(mes_referencia=mes_referencia).all()
+        Tudo no banco e em número fixo de comandos, qualquer que seja o
+        número de plantonistas: um UPDATE recalcula os pontos do mês com
+        os pesos da configuração e outro grava as posições (ROW_NUMBER).
         
-        # Calcular pontos para cada uma
-        for pont in pontuacoes:
-            self.calcular_pontos(pont)
+        Returns:
+            list: Pontuações do mês, da melhor para a pior
+        """
+        if isinstance(mes_referencia, str):
+            mes_referencia = datetime.strptime(mes_referencia, '%Y-%m-%d').date()
         
-        db.session.commit()
+        db.session.execute(
+            update(Pontuacao)
+            .where(Pontuacao.mes_referencia == mes_referencia)
+            .values(**self._expressoes_pontos())
+            .execution_options(synchronize_session=False)
+        )
         
-        # Ordenar por pontos (decrescente)
-        pontuacoes_ordenadas = sorted(pontuacoes, key=lambda x: float(x.pontos_total), reverse=True)
+        self._gravar_ranking(
+            select(Pontuacao.plantonista_id, Pontuacao.pontos_total)
+            .where(Pontuacao.mes_referencia == mes_referencia)
+            .subquery()
+        )
         
-        # Atribuir ranking
-        ranking_atual = 1
-        for pont in pontuacoes_ordenadas:
-            plantonista = Plantonista.query.get(pont.plantonista_id)
-            if plantonista:
-                plantonista.ranking = ranking_atual
-                plantonista.pontuacao_total = pont.pontos_total
-                ranking_atual += 1
+        # Edições seguintes deste mês atualizam as posições (utils/placar.py).
+        # Upsert incondicional: o número de comandos não depende do estado anterior
+        agora = datetime.utcnow()
+        inserir_ou_atualizar(Configuracao, [{
+            'id': str(uuid.uuid4()),
+            'chave': CHAVE_MES_VIGENTE,
+            'valor': mes_referencia.isoformat(),
+            'descricao': 'Mês do ranking vigente',
+            'created_at': agora,
+            'updated_at': agora
+        }], ['chave'], ['valor', 'updated_at'])
         
         db.session.commit()
         
-        return pontuacoes_ordenadas
+        return Pontuacao.query.options(
+            joinedload(Pontuacao.plantonista).joinedload(Plantonista.usuario)
+        ).filter_by(
+            mes_referencia=mes_referencia
+        ).order_by(
+            Pontuacao.pontos_total.desc(), Pontuacao.plantonista_id
+        ).all()
     
     def calcular_ranking_acumulado(self, meses=3):
         """Calcula ranking baseado nos últimos N meses"""
         data_fim = date.today().replace(day=1)
         data_inicio = data_fim - relativedelta(months=meses-1)
         
-        # Buscar pontuações dos últimos meses
-        pontuacoes = db.session.query(
+        # Soma das pontuações dos últimos meses
+        totais = select(
             Pontuacao.plantonista_id,
-            func.sum(Pontuacao.pontos_total).label('total')
-        ).filter(
+            func.sum(Pontuacao.pontos_total).label('pontos_total')
+        ).where(
             Pontuacao.mes_referencia >= data_inicio,
             Pontuacao.mes_referencia <= data_fim
         ).group_by(
             Pontuacao.plantonista_id
-        ).order_by(
-            func.sum(Pontuacao.pontos_total).desc()
-        ).all()
-        
-        # Atualizar ranking
-        ranking_atual = 1
-        for pont in pontuacoes:
-            plantonista = Plantonista.query.get(pont.plantonista_id)
-            if plantonista:
-                plantonista.ranking = ranking_atual
-                plantonista.pontuacao_total = pont.total
-                ranking_atual += 1
+        ).subquery()
         
+        self._gravar_ranking(totais)
         db.session.commit()
         
-        return pontuacoes
+        return db.session.execute(
+            select(totais.c.plantonista_id, totais.c.pontos_total.label('total'))
+            .order_by(totais.c.pontos_total.desc(), totais.c.plantonista_id)
+        ).all()
     
     def obter_ranking_atual(self):
         """Retorna o ranking atual ordenado"""
@@ -175,56 +272,123 @@ class CalculadoraPontuacao:
         
         return pontuacao
     
-    def importar_pontuacoes_planilha(self, mes_referencia, dados_planilha):
-        """Importa pontuações de uma planilha (formato dict)"""
-        resultados = {
-            'sucesso': [],
-            'erros': []
-        }
+    def importar_em_lotes(self, mes_referencia, itens, lote=LOTE_IMPORTACAO):
+        """
+        Importa pontuações de um iterável de linhas (dicts), sem commit
+        
+        As linhas são consumidas uma a uma e gravadas a cada `lote` linhas
+        válidas com um único upsert, então a memória não depende do
+        tamanho da planilha. Os nomes são resolvidos pelo índice de nomes
+        do worker (app.busca_nomes); nomes ambíguos são relatados com os
+        candidatos. O chamador deve recalcular o ranking do mês e fazer o
+        commit. Linhas inválidas são relatadas e não gravadas; se um
+        plantonista aparece de novo, vale a última linha e a anterior é
+        relatada como substituída.
         
-        for item in dados_planilha:
+        Yields:
+            dict: A cada lote, 'processadas' e 'importadas' (acumulados) e
+                os 'sucesso' e 'erros' do lote, com a linha (base 1) e o nome
+        """
+        if isinstance(mes_referencia, str):
+            mes_referencia = datetime.strptime(mes_referencia, '%Y-%m-%d').date()
+        
+        indice = current_app.busca_nomes.indice()
+        vistos = {}
+        pendentes = {}
+        erros = []
+        processadas = 0
+        
+        def gravar():
+            inserir_ou_atualizar(
+                Pontuacao,
+                [linha['valores'] for linha in pendentes.values()],
+                ['plantonista_id', 'mes_referencia'],
+                [*CAMPOS_PLANILHA, 'pontos_vendas', 'pontos_agenciamentos', 'pontos_placas', 'pontos_total', 'updated_at']
+            )
+            parcial = {
+                'processadas': processadas,
+                'importadas': len(vistos),
+                'sucesso': [
+                    {'linha': linha['linha'], 'nome': linha['nome'], 'pontos': float(linha['valores']['pontos_total'])}
+                    for linha in sorted(pendentes.values(), key=lambda l: l['linha'])
+                ],
+                'erros': list(erros)
+            }
+            pendentes.clear()
+            erros.clear()
+            return parcial
+        
+        for numero, item in enumerate(itens, start=1):
+            processadas = numero
+            nome = item.get('nome') if isinstance(item, dict) else None
             try:
-                # Buscar plantonista pelo nome
-                plantonista = Plantonista.query.join(
-                    'usuario'
-                ).filter(
-                    Usuario.nome.ilike(f"%{item['nome']}%")
-                ).first()
+                if not nome:
+                    raise ValueError('Nome não informado')
                 
-                if not plantonista:
-                    resultados['erros'].append({
-                        'nome': item['nome'],
-                        'erro': 'Plantonista não encontrado'
-                    })
-                    continue
+                plantonista_id = indice.resolver(nome, tipo='plantonista')['plantonista_id']
+                if plantonista_id is None:
+                    raise ValueError('Usuário sem registro de plantonista')
                 
-                # Criar pontuação
                 dados = {
-                    'vendas': item.get('vendas', 0),
-                    'age_bairro_foco': item.get('age_bairro_foco', 0),
-                    'age_canoas_poa': item.get('age_canoas_poa', 0),
-                    'age_outros': item.get('age_outros', 0),
-                    'acima_1mm': item.get('acima_1mm', 0),
-                    'placa_bairro_foco': item.get('placa_bairro_foco', 0),
-                    'placa_canoas_poa': item.get('placa_canoas_poa', 0),
-                    'placa_outros': item.get('placa_outros', 0)
+                    campo: _converter(item.get(campo), tipo)
+                    for campo, tipo in CAMPOS_PLANILHA.items()
                 }
-                
-                pontuacao = self.criar_pontuacao_mes(
-                    plantonista.id,
-                    mes_referencia,
-                    dados
-                )
-                
-                resultados['sucesso'].append({
-                    'nome': item['nome'],
-                    'pontos': float(pontuacao.pontos_total)
-                })
-                
-            except Exception as e:
-                resultados['erros'].append({
-                    'nome': item.get('nome', 'Desconhecido'),
-                    'erro': str(e)
+            except (TypeError, ValueError) as e:
+                erros.append({'linha': numero, 'nome': nome or 'Desconhecido', 'erro': str(e)})
+                continue
+            
+            if plantonista_id in vistos:
+                anterior_linha, anterior_nome = vistos[plantonista_id]
+                pendentes.pop(plantonista_id, None)
+                erros.append({
+                    'linha': anterior_linha,
+                    'nome': anterior_nome,
+                    'erro': f'Plantonista repetido na planilha (vale a linha {numero})'
                 })
+            vistos[plantonista_id] = (numero, nome)
+            
+            pontuacao = self.calcular_pontos(Pontuacao(**dados))
+            agora = datetime.utcnow()
+            pendentes[plantonista_id] = {
+                'linha': numero,
+                'nome': nome,
+                'valores': {
+                    'id': str(uuid.uuid4()),
+                    'plantonista_id': plantonista_id,
+                    'mes_referencia': mes_referencia,
+                    **dados,
+                    'pontos_vendas': pontuacao.pontos_vendas,
+                    'pontos_agenciamentos': pontuacao.pontos_agenciamentos,
+                    'pontos_placas': pontuacao.pontos_placas,
+                    'pontos_total': pontuacao.pontos_total,
+                    'created_at': agora,
+                    'updated_at': agora
+                }
+            }
+            
+            if len(pendentes) >= lote:
+                yield gravar()
+        
+        if pendentes or erros:
+            yield gravar()
+    
+    def importar_pontuacoes_planilha(self, mes_referencia, dados_planilha):
+        """
+        Importa pontuações de uma planilha (lista de dicts), sem commit
+        
+        Returns:
+            dict: 'sucesso' e 'erros' de todas as linhas (ver importar_em_lotes)
+        """
+        resultados = {
+            'sucesso': [],
+            'erros': []
+        }
+        for parcial in self.importar_em_lotes(mes_referencia, dados_planilha):
+            resultados['sucesso'] += parcial['sucesso']
+            resultados['erros'] += parcial['erros']
         
+        # Linha gravada num lote e substituída por outra num lote seguinte
+        substituidas = {erro['linha'] for erro in resultados['erros']}
+        resultados['sucesso'] = [s for s in resultados['sucesso'] if s['linha'] not in substituidas]
+        resultados['erros'].sort(key=lambda e: e['linha'])
         return resultados
@@ -0,0 +1,409 @@
+"""
+Motor transacional de reservas de plantões
+
+Toda mutação de alocação passa por aqui para manter o contador
+plantoes.ocupadas em sincronia com as alocações confirmadas.
+
+A vaga é ocupada com um UPDATE condicional (ocupadas < max_plantonistas):
+a própria instrução trava a linha do plantão (no SQLite, o banco inteiro
+para escrita) e garante a capacidade, de modo que duas requisições
+simultâneas nunca ocupam a mesma vaga. Limite mensal e regra de um
+plantão por dia são validados no livro-razão (utils/cotas.py) na mesma
+transação; qualquer recusa desfaz os incrementos.
+"""
+from datetime import date, datetime, time
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import case, delete, func, select, update
+from sqlalchemy.exc import IntegrityError
+from models import db, Plantao, Alocacao
+from utils.auth import log_acao
+from utils.websocket import notify_plantoes_delta
+from utils.alteracoes import registrar_alteracao
+from utils.cache_utils import invalidate_plantoes_cache, invalidate_rankings_cache
+from utils.cotas import ocupar_cota, liberar_cota, MESMO_DIA, LIMITE_MENSAL
+
+
+STATUS_ABERTOS = ('disponivel', 'reservado')
+
+# --- Meritocracia (Ranking) ---
+# Dia 25 é o dia padrão de abertura para o mês seguinte
+DIA_ABERTURA_PADRAO = 25
+HORA_INICIO = 8  # 1º lugar às 08:00
+RANKINGS_COM_HORARIO = 10  # Apenas top 10 tem restrição de horário
+
+
+class ReservaNegada(Exception):
+    """Regra de negócio impediu a reserva"""
+
+    def __init__(self, mensagem, codigo=400):
+        super().__init__(mensagem)
+        self.mensagem = mensagem
+        self.codigo = codigo
+
+
+def hora_liberacao(ranking):
+    """Hora em que o ranking pode escolher no dia de abertura (None = sem restrição)"""
+    ranking = ranking or 99
+    if ranking > RANKINGS_COM_HORARIO:
+        return None
+    return HORA_INICIO + (ranking - 1)
+
+
+def abertura_mes_seguinte(hoje=None):
+    """Data de abertura das escolhas do mês seguinte ao de hoje"""
+    hoje = hoje or date.today()
+    return hoje.replace(day=DIA_ABERTURA_PADRAO)
+
+
+def janelas_abertura(hoje=None):
+    """
+    Horários escalonados da próxima abertura, do 1º ao último colocado com horário
+
+    Returns:
+        list: (ranking, datetime) em ordem de liberação
+    """
+    hoje = hoje or date.today()
+    abertura = abertura_mes_seguinte(hoje)
+    if hoje > abertura:
+        abertura = abertura_mes_seguinte(hoje.replace(day=1) + relativedelta(months=1))
+    return [
+        (ranking, datetime.combine(abertura, time(hora_liberacao(ranking))))
+        for ranking in range(1, RANKINGS_COM_HORARIO + 1)
+    ]
+
+
+def validar_janela_escolha(plantao, plantonista, hoje=None, agora=None):
+    """
+    Regras de calendário e ranking para o plantonista escolher o plantão
+
+    Mês atual é livre; o mês seguinte abre no DIA_ABERTURA_PADRAO, com
+    horário escalonado pelo ranking para o top 10; meses posteriores
+    ainda não podem ser escolhidos.
+
+    Raises:
+        ReservaNegada: Se a escolha ainda não estiver liberada
+    """
+    hoje = hoje or date.today()
+    agora = agora or datetime.utcnow()
+
+    # Impedir escolha de plantões que já passaram
+    if plantao.data < hoje:
+        raise ReservaNegada('Não é possível escolher plantões de datas passadas', 400)
+
+    mes_atual = hoje.replace(day=1)
+    mes_seguinte = mes_atual + relativedelta(months=1)
+    mes_plantao = plantao.data.replace(day=1)
+
+    # Para plantões do mês atual - sem restrições de ranking
+    if mes_plantao == mes_atual:
+        return
+
+    # Para plantões muito futuros
+    if mes_plantao > mes_seguinte:
+        raise ReservaNegada('Não é possível escolher plantões tão distantes', 403)
+
+    # Para plantões do mês seguinte - aplicar regras de ranking
+    data_abertura = abertura_mes_seguinte(hoje)
+
+    # Se ainda não abriu
+    if hoje < data_abertura:
+        raise ReservaNegada(
+            f'A escolha para o mês {plantao.data.strftime("%m/%Y")} será liberada em {data_abertura.strftime("%d/%m/%Y")}',
+            403
+        )
+
+    # Se abriu hoje, verificar horário apenas para rankings altos
+    hora_permitida = hora_liberacao(plantonista.ranking)
+    if hoje == data_abertura and hora_permitida is not None and agora.hour < hora_permitida:
+        raise ReservaNegada(
+            f'Sua posição no ranking ({plantonista.ranking or 99}º) permite escolha a partir das {hora_permitida:02d}:00',
+            403
+        )
+
+
+def ocupar_vaga(plantao_id, exigir_aberto=True):
+    """
+    Incrementa plantoes.ocupadas se ainda houver vaga
+
+    Args:
+        plantao_id (str): ID do plantão
+        exigir_aberto (bool): Exige status disponivel/reservado
+
+    Returns:
+        bool: True se a vaga foi ocupada
+    """
+    condicoes = [Plantao.id == plantao_id, Plantao.ocupadas < Plantao.max_plantonistas]
+    if exigir_aberto:
+        condicoes.append(Plantao.status.in_(STATUS_ABERTOS))
+
+    resultado = db.session.execute(
+        update(Plantao)
+        .where(*condicoes)
+        .values(
+            ocupadas=Plantao.ocupadas + 1,
+            status=case(
+                (Plantao.ocupadas + 1 >= Plantao.max_plantonistas, 'confirmado'),
+                else_='reservado'
+            ),
+            updated_at=datetime.utcnow()
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return resultado.rowcount == 1
+
+
+def liberar_vaga(plantao_id):
+    """Decrementa plantoes.ocupadas e reabre o plantão para escolha"""
+    db.session.execute(
+        update(Plantao)
+        .where(Plantao.id == plantao_id, Plantao.ocupadas > 0)
+        .values(
+            ocupadas=Plantao.ocupadas - 1,
+            status=case(
+                (Plantao.status == 'cancelado', Plantao.status),
+                (Plantao.ocupadas - 1 > 0, 'reservado'),
+                else_='disponivel'
+            ),
+            updated_at=datetime.utcnow()
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _recarregar_plantao(plantao_id):
+    return db.session.get(Plantao, plantao_id, populate_existing=True)
+
+
+def _motivo_sem_vaga(plantao):
+    """Explica por que o UPDATE condicional não ocupou a vaga"""
+    if not plantao:
+        return ReservaNegada('Plantão não encontrado', 404)
+    if plantao.status not in STATUS_ABERTOS:
+        return ReservaNegada('Plantão não está disponível')
+    return ReservaNegada('Plantão sem vagas disponíveis')
+
+
+def _registrar_na_cota(plantao, plantonista, limite, msg_mesmo_dia):
+    """Ocupa o dia/mês no livro-razão ou levanta a recusa correspondente"""
+    motivo = ocupar_cota(plantonista.id, plantao.data, limite)
+    if motivo == MESMO_DIA:
+        raise ReservaNegada(msg_mesmo_dia)
+    if motivo == LIMITE_MENSAL:
+        raise ReservaNegada(f'Você atingiu o limite de {limite} plantões no mês')
+
+
+def reservar_plantao(plantao_id, plantonista):
+    """
+    Reserva uma vaga no plantão para o plantonista de forma atômica
+
+    Args:
+        plantao_id (str): ID do plantão
+        plantonista (Plantonista): Plantonista que está escolhendo
+
+    Returns:
+        tuple: (Alocacao, Plantao) já persistidos
+
+    Raises:
+        ReservaNegada: Se alguma regra impedir a reserva (transação desfeita)
+    """
+    try:
+        ocupou = ocupar_vaga(plantao_id)
+        plantao = _recarregar_plantao(plantao_id)
+
+        if not ocupou:
+            raise _motivo_sem_vaga(plantao)
+
+        if Alocacao.query.filter_by(plantao_id=plantao.id, plantonista_id=plantonista.id).first() is not None:
+            raise ReservaNegada('Você já escolheu este plantão')
+
+        _registrar_na_cota(
+            plantao, plantonista, plantonista.max_plantoes_mes,
+            'Não é permitido fazer dois plantões no mesmo dia'
+        )
+
+        alocacao = Alocacao(
+            plantao_id=plantao.id,
+            plantonista_id=plantonista.id,
+            status='confirmado',
+            tipo='escolha',
+            confirmado_em=datetime.utcnow()
+        )
+        db.session.add(alocacao)
+        registrar_alteracao(plantao, alocacao)
+        db.session.commit()
+        return alocacao, plantao
+
+    except ReservaNegada:
+        db.session.rollback()
+        raise
+    except IntegrityError:
+        # UNIQUE(plantao_id, plantonista_id): requisição duplicada concorrente
+        db.session.rollback()
+        raise ReservaNegada('Você já escolheu este plantão')
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def concluir_escolha(usuario_id, alocacao, plantao, ip_address=None):
+    """Efeitos posteriores a uma escolha confirmada: log, WebSocket e cache"""
+    # Log da ação
+    log_acao(usuario_id, 'escolher_plantao', 'alocacoes', alocacao.id, detalhes={
+        'plantao_id': str(plantao.id),
+        'data': plantao.data.isoformat(),
+        'turno': plantao.turno
+    }, ip_address=ip_address)
+
+    # Notificação WebSocket em tempo real (delta agrupado com as demais escolhas)
+    notify_plantoes_delta(plantao)
+
+    # Invalidar cache após mudança
+    invalidate_plantoes_cache(plantao.data)
+    invalidate_rankings_cache()
+
+
+def atribuir_plantao(plantao_id, plantonista):
+    """
+    Gestor aloca um plantonista no plantão (sem regras de ranking/limite mensal)
+
+    Uma alocação cancelada anterior do mesmo plantonista é reaproveitada,
+    respeitando o UNIQUE(plantao_id, plantonista_id).
+
+    Returns:
+        tuple: (Alocacao, Plantao) já persistidos
+
+    Raises:
+        ReservaNegada: Se alguma regra impedir a atribuição (transação desfeita)
+    """
+    try:
+        ocupou = ocupar_vaga(plantao_id, exigir_aberto=False)
+        plantao = _recarregar_plantao(plantao_id)
+
+        if not ocupou:
+            if not plantao:
+                raise ReservaNegada('Plantão não encontrado', 404)
+            raise ReservaNegada('Plantão já está lotado')
+
+        alocacao = Alocacao.query.filter_by(plantao_id=plantao.id, plantonista_id=plantonista.id).first()
+
+        if alocacao is not None and alocacao.status == 'confirmado':
+            raise ReservaNegada('Plantonista já está alocado neste plantão')
+
+        _registrar_na_cota(
+            plantao, plantonista, None,
+            'Não é permitido que um plantonista faça dois turnos no mesmo dia'
+        )
+
+        if alocacao is None:
+            alocacao = Alocacao(plantao_id=plantao.id, plantonista_id=plantonista.id)
+            db.session.add(alocacao)
+
+        alocacao.status = 'confirmado'
+        alocacao.tipo = 'atribuido'
+        alocacao.confirmado_em = datetime.utcnow()
+
+        registrar_alteracao(plantao, alocacao)
+        db.session.commit()
+        return alocacao, plantao
+
+    except ReservaNegada:
+        db.session.rollback()
+        raise
+    except IntegrityError:
+        db.session.rollback()
+        raise ReservaNegada('Plantonista já está alocado neste plantão')
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def liberar_alocacao(alocacao, novo_status='cancelado'):
+    """
+    Tira uma alocação do plantão, liberando a vaga se estava confirmada (sem commit)
+
+    A troca de status é condicional a status='confirmado', então dois
+    cancelamentos simultâneos da mesma alocação liberam a vaga uma só vez.
+
+    Args:
+        alocacao (Alocacao): Alocação a cancelar
+        novo_status (str): Status final, ou None para excluir a alocação
+
+    Returns:
+        bool: True se uma vaga confirmada foi liberada
+    """
+    plantao = alocacao.plantao
+    filtro = (Alocacao.id == alocacao.id, Alocacao.status == 'confirmado')
+    if novo_status is None:
+        instrucao = delete(Alocacao).where(*filtro)
+    else:
+        instrucao = update(Alocacao).where(*filtro).values(status=novo_status, updated_at=datetime.utcnow())
+
+    resultado = db.session.execute(instrucao.execution_options(synchronize_session='fetch'))
+    liberou = resultado.rowcount == 1
+
+    if liberou:
+        liberar_vaga(alocacao.plantao_id)
+        liberar_cota(alocacao.plantonista_id, plantao.data)
+    elif novo_status is None:
+        db.session.delete(alocacao)
+    else:
+        alocacao.status = novo_status
+
+    registrar_alteracao(plantao, alocacao, alocacao_removida=novo_status is None)
+    return liberou
+
+
+def verificar_ocupacao(corrigir=False):
+    """
+    Compara plantoes.ocupadas com a contagem real de alocações confirmadas
+
+    Args:
+        corrigir (bool): Regrava o contador dos plantões divergentes
+
+    Plantões com mais alocações confirmadas que max_plantonistas (sobras de
+    reservas anteriores ao contador) são apenas reportados: o CHECK do
+    contador não permite gravá-los e a correção exige decisão do gestor.
+
+    Returns:
+        list: Divergências encontradas (id, data, turno, ocupadas, real, excede_capacidade)
+    """
+    contagem = (
+        select(func.count(Alocacao.id))
+        .where(Alocacao.plantao_id == Plantao.id, Alocacao.status == 'confirmado')
+        .correlate(Plantao)
+        .scalar_subquery()
+    )
+
+    linhas = db.session.execute(
+        select(
+            Plantao.id, Plantao.data, Plantao.turno, Plantao.ocupadas,
+            Plantao.max_plantonistas, contagem.label('real')
+        )
+        .where(Plantao.ocupadas != contagem)
+        .order_by(Plantao.data, Plantao.turno)
+    ).all()
+
+    divergencias = [
+        {
+            'id': str(l.id),
+            'data': l.data.isoformat() if l.data else None,
+            'turno': l.turno,
+            'ocupadas': l.ocupadas,
+            'real': l.real,
+            'excede_capacidade': l.real > (l.max_plantonistas or 0)
+        }
+        for l in linhas
+    ]
+
+    corrigiveis = [d['id'] for d in divergencias if not d['excede_capacidade']]
+
+    if corrigir and corrigiveis:
+        db.session.execute(
+            update(Plantao)
+            .where(Plantao.id.in_(corrigiveis))
+            .values(ocupadas=contagem)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+    return divergencias
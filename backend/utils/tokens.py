@@ -0,0 +1,143 @@
+"""
+Claims de autorização no JWT e revogação de tokens
+
+O access token carrega 'tipo', 'plantonista_id' e 'versao' (a
+Usuario.token_versao do momento da emissão). Os decorators de permissão
+leem o papel direto do token, sem consultar o banco.
+
+Para revogar, basta incrementar Usuario.token_versao: isso acontece
+automaticamente quando o tipo ou o status ativo do usuário mudam, e via
+revogar_tokens() (troca de senha, logout de todas as sessões). A versão
+vigente fica no cache (Redis em produção), então a checagem por requisição
+também não vai ao banco; o banco só é lido quando a chave expira.
+"""
+from flask import g, has_app_context
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from models import db, Usuario
+from utils.cache_utils import cache_get, cache_set
+
+
+# Versão gravada no cache para usuários inativos ou inexistentes:
+# nenhum token confere com ela
+VERSAO_BLOQUEADA = -1
+
+# Tempo da versão no cache; ao expirar, a próxima requisição relê o banco
+TTL_VERSAO = 3600
+
+
+def _chave_versao(usuario_id):
+    return f"token_versao:{usuario_id}"
+
+
+def claims_usuario(usuario):
+    """
+    Claims adicionais do JWT para o usuário (login e refresh)
+
+    Também publica a versão vigente no cache, para que as requisições
+    seguintes validem o token sem consultar o banco.
+    """
+    versao = usuario.token_versao or 0
+    cache_set(_chave_versao(usuario.id), versao if usuario.ativo else VERSAO_BLOQUEADA, timeout=TTL_VERSAO)
+    return {
+        'tipo': usuario.tipo,
+        'plantonista_id': str(usuario.plantonista.id) if usuario.plantonista else None,
+        'versao': versao
+    }
+
+
+def versao_vigente(usuario_id):
+    """Versão de token aceita para o usuário (cache, com fallback no banco)"""
+    versao = cache_get(_chave_versao(usuario_id))
+    if versao is not None:
+        return versao
+
+    linha = db.session.execute(
+        select(Usuario.token_versao, Usuario.ativo).where(Usuario.id == usuario_id)
+    ).first()
+    versao = (linha.token_versao or 0) if linha and linha.ativo else VERSAO_BLOQUEADA
+
+    cache_set(_chave_versao(usuario_id), versao, timeout=TTL_VERSAO)
+    return versao
+
+
+def token_revogado(jwt_header, jwt_payload):
+    """Callback token_in_blocklist_loader do Flask-JWT-Extended"""
+    versao = jwt_payload.get('versao', 0)
+    return versao != versao_vigente(jwt_payload['sub'])
+
+
+def revogar_tokens(usuario):
+    """
+    Invalida todos os tokens emitidos para o usuário (sem commit)
+
+    A nova versão é publicada no cache após o commit (ver _publicar_versoes).
+    """
+    usuario.token_versao = (usuario.token_versao or 0) + 1
+
+
+def init_jwt(jwt):
+    """Registra os callbacks de revogação no JWTManager"""
+    jwt.token_in_blocklist_loader(token_revogado)
+
+
+def tipo_usuario_atual():
+    """Papel do usuário do token atual (claim, ou banco para tokens antigos)"""
+    tipo = get_jwt().get('tipo')
+    if tipo is None:
+        usuario = usuario_atual()
+        tipo = usuario.tipo if usuario else None
+    return tipo
+
+
+def plantonista_id_atual():
+    """ID do plantonista do token atual (None para gestores e admins)"""
+    claims = get_jwt()
+    if 'plantonista_id' in claims:
+        return claims['plantonista_id']
+    usuario = usuario_atual()
+    return str(usuario.plantonista.id) if usuario and usuario.plantonista else None
+
+
+def usuario_atual():
+    """Usuário do token atual, carregado no máximo uma vez por requisição"""
+    user_id = get_jwt_identity()
+    if g.get('_usuario_atual_id') != user_id:
+        g._usuario_atual = db.session.get(Usuario, user_id)
+        g._usuario_atual_id = user_id
+    return g._usuario_atual
+
+
+# --- Invalidação automática em mudança de papel/status ---
+
+@event.listens_for(Session, 'before_flush')
+def _versionar_mudanca_de_papel(session, flush_context, instances):
+    revogados = session.info.setdefault('tokens_revogados', {})
+
+    for obj in session.dirty:
+        if not isinstance(obj, Usuario):
+            continue
+        estado = inspect(obj)
+        mudou_papel = estado.attrs.tipo.history.has_changes() or estado.attrs.ativo.history.has_changes()
+        if mudou_papel and not estado.attrs.token_versao.history.has_changes():
+            revogar_tokens(obj)
+        if estado.attrs.token_versao.history.has_changes() or mudou_papel:
+            revogados[str(obj.id)] = obj.token_versao if obj.ativo else VERSAO_BLOQUEADA
+
+    for obj in session.deleted:
+        if isinstance(obj, Usuario):
+            revogados[str(obj.id)] = VERSAO_BLOQUEADA
+
+
+@event.listens_for(Session, 'after_commit')
+def _publicar_versoes(session):
+    revogados = session.info.pop('tokens_revogados', None)
+    if revogados and has_app_context():
+        for usuario_id, versao in revogados.items():
+            cache_set(_chave_versao(usuario_id), versao, timeout=TTL_VERSAO)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_versoes(session):
+    session.info.pop('tokens_revogados', None)
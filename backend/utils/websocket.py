@@ -1,13 +1,155 @@
 """
 Utilitários para eventos em tempo real via WebSocket
+
+Com vários workers, cada cliente fica conectado a um só processo. Os
+eventos emitidos aqui passam pela fila de mensagens do Socket.IO
+(SOCKETIO_MESSAGE_QUEUE, Redis) e cada worker entrega aos seus próprios
+clientes; sem a fila, só os clientes do worker que fez a escrita recebem.
+
+A conexão exige o access token (auth={'token': ...}). Conectado, o
+cliente entra na sala do próprio usuário, na sala geral e na sala do mês
+que está vendo (auth={'mes': 'AAAA-MM'}, trocado depois com o evento
+'assinar_mes'). Com auth={'cursor': ...} o cliente que reconecta recebe
+em 'plantoes_alteracoes' o que mudou no mês desde o cursor. Alterações de plantões vão só para a sala do mês do
+plantão e notificações pessoais só para a sala do usuário.
 """
-from flask import current_app
-from flask_socketio import emit
+import re
+from datetime import date, timedelta
+from dateutil.relativedelta import relativedelta
+from flask import current_app, request
+from flask_jwt_extended import decode_token
+from flask_socketio import emit, join_room, leave_room, rooms, ConnectionRefusedError
+
+# Todos os usuários autenticados (avisos gerais, como o ranking)
+SALA_TODOS = 'plantonistas'
+PREFIXO_SALA_MES = 'plantoes:'
+_FORMATO_MES = re.compile(r'^(\d{4})-(\d{2})$')
+
+
+def sala_usuario(usuario_id):
+    return f'user_{usuario_id}'
+
+
+def sala_mes(dia):
+    """Sala dos plantões do mês de uma data (ex: 'plantoes:2025-03')"""
+    return f'{PREFIXO_SALA_MES}{dia.year:04d}-{dia.month:02d}'
+
+
+def _mes_informado(valor):
+    """date do primeiro dia de um mês 'AAAA-MM', ou None se inválido"""
+    encontrado = _FORMATO_MES.match(valor or '')
+    if not encontrado:
+        return None
+    try:
+        return date(int(encontrado.group(1)), int(encontrado.group(2)), 1)
+    except ValueError:
+        return None
+
+
+def autenticar_conexao(auth):
+    """
+    Payload do access token enviado na conexão
+
+    Raises:
+        ConnectionRefusedError: Token ausente, inválido, expirado ou revogado
+    """
+    from utils.tokens import token_revogado
+
+    token = (auth or {}).get('token') or request.args.get('token')
+    if not token:
+        raise ConnectionRefusedError('Token de acesso obrigatório')
+    try:
+        payload = decode_token(token)
+    except Exception:
+        raise ConnectionRefusedError('Token inválido ou expirado')
+    if payload.get('type') != 'access' or token_revogado(None, payload):
+        raise ConnectionRefusedError('Token revogado')
+    return payload
+
+
+def _assinar_mes(mes):
+    for sala in rooms():
+        if sala.startswith(PREFIXO_SALA_MES):
+            leave_room(sala)
+    join_room(sala_mes(mes))
+
+
+def _retomar(cursor, mes):
+    """Envia ao cliente que reconectou as alterações do mês desde o cursor"""
+    from utils.alteracoes import alteracoes_desde, CursorExpirado
+
+    try:
+        cursor = int(cursor)
+    except (TypeError, ValueError):
+        return
+    fim = mes + relativedelta(months=1) - timedelta(days=1)
+    try:
+        alteracoes = alteracoes_desde(cursor, mes, fim)
+    except CursorExpirado:
+        alteracoes = {'expirado': True}
+    emit('plantoes_alteracoes', {'mes': mes.strftime('%Y-%m'), **alteracoes})
+
+
+def registrar_eventos(socketio):
+    """Handlers de conexão e assinatura das salas"""
+
+    @socketio.on('connect')
+    def handle_connect(auth=None):
+        payload = autenticar_conexao(auth)
+        join_room(sala_usuario(payload['sub']))
+        join_room(SALA_TODOS)
+        mes = _mes_informado((auth or {}).get('mes')) or date.today()
+        _assinar_mes(mes)
+        emit('connected', {'data': 'Conectado ao servidor de plantões'})
+        if (auth or {}).get('cursor') is not None:
+            _retomar(auth['cursor'], mes)
+
+    @socketio.on('disconnect')
+    def handle_disconnect():
+        print(f'Cliente desconectado: {request.sid}')
+
+    @socketio.on('assinar_mes')
+    def handle_assinar_mes(data):
+        """Troca a sala de mês do cliente (ex: {'mes': '2025-11'})"""
+        mes = _mes_informado((data or {}).get('mes'))
+        if mes is None:
+            return {'sucesso': False, 'mensagem': "Mês inválido, use 'AAAA-MM'"}
+        _assinar_mes(mes)
+        return {'sucesso': True, 'sala': sala_mes(mes)}
+
+
+def configurar_fila_mensagens(app):
+    """
+    URL da fila de mensagens do Socket.IO, ou None para entrega só no processo
+
+    Testa a conexão antes: com o Redis fora do ar o SocketIO segue sem
+    fila, como o cache segue com o SimpleCache.
+    """
+    url = app.config.get('SOCKETIO_MESSAGE_QUEUE')
+    if not url:
+        return None
+    try:
+        import redis
+        redis.Redis.from_url(url, socket_connect_timeout=2).ping()
+        print("✅ Fila de mensagens do Socket.IO configurada (Redis)")
+        return url
+    except Exception as e:
+        print(f"⚠️ Fila do Socket.IO indisponível ({e}); eventos só chegam aos clientes deste worker")
+        return None
+
+
+def metricas_socketio(socketio):
+    """Tipo da fila de mensagens em uso pelo SocketIO"""
+    manager = socketio.server.manager
+    return {
+        'fila': 'redis' if type(manager).__name__ == 'RedisManager' else 'local',
+        'canal': getattr(manager, 'channel', None)
+    }
 
 
 def notify_plantao_update(plantao_data, event_type='plantao_updated'):
     """
-    Notifica todos os clientes sobre atualizações de plantões
+    Notifica os clientes que acompanham o mês do plantão
     
     Args:
         plantao_data (dict): Dados do plantão
@@ -15,31 +157,55 @@ def notify_plantao_update(plantao_data, event_type='plantao_updated'):
     """
     try:
         if hasattr(current_app, 'socketio'):
+            sala = sala_mes(date.fromisoformat(plantao_data['data']))
             current_app.socketio.emit(event_type, {
                 'plantao': plantao_data,
                 'timestamp': plantao_data.get('updated_at') or plantao_data.get('created_at')
-            }, room='plantonistas')
-            print(f"✅ WebSocket: {event_type} enviado para sala 'plantonistas'")
+            }, room=sala)
+            print(f"✅ WebSocket: {event_type} enviado para sala '{sala}'")
         else:
             print("⚠️ WebSocket: SocketIO não configurado")
     except Exception as e:
         print(f"❌ Erro no WebSocket: {e}")
 
 
-def notify_alocacao_update(alocacao_data, event_type='alocacao_updated'):
+def notify_plantoes_delta(*plantoes, removidos=()):
+    """
+    Agenda os deltas dos plantões alterados para a próxima emissão agrupada
+    (utils/difusor.py), em vez de emitir cada objeto inteiro na hora
+    
+    Args:
+        *plantoes (Plantao): Plantões já persistidos
+        removidos (iterable): (id, data) de plantões excluídos
+    """
+    try:
+        difusor = getattr(current_app, 'difusor', None)
+        if difusor is None:
+            print("⚠️ WebSocket: difusor de plantões não configurado")
+            return
+        for plantao in plantoes:
+            difusor.registrar(plantao)
+        for plantao_id, dia in removidos:
+            difusor.registrar_remocao(plantao_id, dia)
+    except Exception as e:
+        print(f"❌ Erro no WebSocket: {e}")
+
+
+def notify_alocacao_update(alocacao_data, event_type='alocacao_updated', dia=None):
     """
     Notifica sobre atualizações de alocações de plantões
     
     Args:
         alocacao_data (dict): Dados da alocação
         event_type (str): Tipo do evento
+        dia (date): Data do plantão; restringe o envio à sala do mês
     """
     try:
         if hasattr(current_app, 'socketio'):
             current_app.socketio.emit(event_type, {
                 'alocacao': alocacao_data,
                 'timestamp': alocacao_data.get('confirmado_em')
-            }, room='plantonistas')
+            }, room=sala_mes(dia) if dia else SALA_TODOS)
             print(f"✅ WebSocket: {event_type} enviado")
         else:
             print("⚠️ WebSocket: SocketIO não configurado")
@@ -56,7 +222,7 @@ def notify_ranking_update(ranking_data):
             current_app.socketio.emit('ranking_updated', {
                 'rankings': ranking_data,
                 'timestamp': None
-            }, room='plantonistas')
+            }, room=SALA_TODOS)
             print(f"✅ WebSocket: ranking_updated enviado")
         else:
             print("⚠️ WebSocket: SocketIO não configurado")
@@ -74,9 +240,22 @@ def notify_user(user_id, message, event_type='notification'):
                 'message': message,
                 'user_id': user_id,
                 'timestamp': None
-            }, room=f'user_{user_id}')
+            }, room=sala_usuario(user_id))
             print(f"✅ WebSocket: {event_type} enviado para user_{user_id}")
         else:
             print("⚠️ WebSocket: SocketIO não configurado")
     except Exception as e:
-        print(f"❌ Erro no WebSocket: {e}")
\ No newline at end of file
+        print(f"❌ Erro no WebSocket: {e}")
+
+
+def notify_importacao(user_id, progresso):
+    """
+    Progresso de uma importação de planilha, só para quem a enviou
+    """
+    try:
+        if hasattr(current_app, 'socketio'):
+            current_app.socketio.emit('importacao_progresso', progresso, room=sala_usuario(user_id))
+        else:
+            print("⚠️ WebSocket: SocketIO não configurado")
+    except Exception as e:
+        print(f"❌ Erro no WebSocket: {e}")
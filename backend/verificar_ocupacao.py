@@ -0,0 +1,90 @@
+"""
+Verifica (e opcionalmente corrige) o contador plantoes.ocupadas e o
+livro-razão mensal cotas_mensais; antes disso cria as colunas que bancos
+anteriores não têm (plantoes.ocupadas, plantoes.versao, usuarios.token_versao)
+
+Uso:
+    python verificar_ocupacao.py            # apenas relata divergências
+    python verificar_ocupacao.py --corrigir # recalcula a partir de alocacoes
+"""
+import sys
+from sqlalchemy import inspect, text
+from app import create_app
+from models import db
+from utils.reservas import verificar_ocupacao
+from utils.cotas import verificar_cotas
+
+
+def garantir_coluna_ocupadas():
+    """Adiciona plantoes.ocupadas em bancos criados antes do contador"""
+    colunas = [c['name'] for c in inspect(db.engine).get_columns('plantoes')]
+    if 'ocupadas' in colunas:
+        return False
+
+    db.session.execute(text('ALTER TABLE plantoes ADD COLUMN ocupadas INTEGER NOT NULL DEFAULT 0'))
+    db.session.commit()
+    return True
+
+
+def garantir_coluna_versao():
+    """Adiciona plantoes.versao (deltas do WebSocket) em bancos anteriores a ela"""
+    colunas = [c['name'] for c in inspect(db.engine).get_columns('plantoes')]
+    if 'versao' in colunas:
+        return False
+
+    db.session.execute(text('ALTER TABLE plantoes ADD COLUMN versao INTEGER NOT NULL DEFAULT 1'))
+    db.session.commit()
+    return True
+
+
+def garantir_coluna_token_versao():
+    """Adiciona usuarios.token_versao (revogação de JWTs) em bancos anteriores a ela"""
+    colunas = [c['name'] for c in inspect(db.engine).get_columns('usuarios')]
+    if 'token_versao' in colunas:
+        return False
+
+    db.session.execute(text('ALTER TABLE usuarios ADD COLUMN token_versao INTEGER NOT NULL DEFAULT 0'))
+    db.session.commit()
+    return True
+
+
+def main(corrigir=False):
+    app, _ = create_app('development')
+
+    with app.app_context():
+        if garantir_coluna_ocupadas():
+            print("Coluna plantoes.ocupadas criada; recalculando contadores...")
+            corrigir = True
+        if garantir_coluna_versao():
+            print("Coluna plantoes.versao criada")
+        if garantir_coluna_token_versao():
+            print("Coluna usuarios.token_versao criada")
+
+        cotas = verificar_cotas(corrigir=corrigir)
+        for c in cotas:
+            print(f"Cota {c['mes_referencia']} [{c['plantonista_id']}]: total={c['total']} real={c['real_total']}")
+        if cotas:
+            estado = 'corrigidas' if corrigir else 'divergentes (use --corrigir)'
+            print(f"{'✅' if corrigir else '⚠️'} {len(cotas)} cotas mensais {estado}")
+
+        divergencias = verificar_ocupacao(corrigir=corrigir)
+
+        if not divergencias:
+            print("✅ Contadores de ocupação conferem com as alocações")
+            return 1 if cotas and not corrigir else 0
+
+        for d in divergencias:
+            aviso = ' (EXCEDE CAPACIDADE: resolver manualmente)' if d['excede_capacidade'] else ''
+            print(f"{d['data']} {d['turno']} [{d['id']}]: ocupadas={d['ocupadas']} real={d['real']}{aviso}")
+
+        if corrigir:
+            corrigidas = len([d for d in divergencias if not d['excede_capacidade']])
+            print(f"✅ {corrigidas} de {len(divergencias)} plantões corrigidos")
+        else:
+            print(f"⚠️ {len(divergencias)} divergências (use --corrigir para recalcular)")
+
+        return 1 if not corrigir or any(d['excede_capacidade'] for d in divergencias) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main('--corrigir' in sys.argv))
@@ -0,0 +1,19 @@
+"""
+Entrada WSGI de produção (gunicorn + eventlet)
+
+Cada processo atende um conjunto de conexões Socket.IO; os eventos
+emitidos por qualquer processo chegam a todos pela fila Redis
+(SOCKETIO_MESSAGE_QUEUE). O gunicorn não faz sessão fixa entre os
+próprios workers, então rode várias instâncias de um worker cada atrás
+de um balanceador com sessão fixa (ver PRODUCTION_GUIDE.md):
+
+    gunicorn -k eventlet -w 1 --bind 0.0.0.0:5001 wsgi:app
+    gunicorn -k eventlet -w 1 --bind 0.0.0.0:5002 wsgi:app
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import os
+from app import create_app
+
+app, socketio = create_app(os.getenv('FLASK_ENV', 'production'))
@@ -12,6 +12,7 @@ CREATE TABLE usuarios (
     senha VARCHAR(255) NOT NULL,
     tipo VARCHAR(20) NOT NULL CHECK (tipo IN ('admin', 'gestor', 'plantonista')),
     ativo BOOLEAN DEFAULT true,
+    token_versao INTEGER NOT NULL DEFAULT 0, -- incrementada para revogar os JWTs emitidos
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -59,10 +60,13 @@ CREATE TABLE plantoes (
     turno VARCHAR(10) NOT NULL CHECK (turno IN ('manha', 'tarde')),
     status VARCHAR(20) DEFAULT 'disponivel' CHECK (status IN ('disponivel', 'reservado', 'confirmado', 'cancelado')),
     max_plantonistas INTEGER DEFAULT 2,
+    ocupadas INTEGER NOT NULL DEFAULT 0, -- alocações confirmadas, mantido pelo backend
+    versao INTEGER NOT NULL DEFAULT 1, -- incrementada a cada alteração (deltas do WebSocket)
     observacoes TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    UNIQUE(data, turno)
+    UNIQUE(data, turno),
+    CONSTRAINT ck_plantoes_ocupadas CHECK (ocupadas >= 0 AND ocupadas <= max_plantonistas)
 );
 
 -- Tabela de Alocações de Plantões
@@ -79,6 +83,29 @@ CREATE TABLE alocacoes (
     UNIQUE(plantao_id, plantonista_id)
 );
 
+-- Livro-razão de plantões por plantonista/mês (limite mensal e regra de um plantão por dia)
+CREATE TABLE cotas_mensais (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    plantonista_id UUID NOT NULL REFERENCES plantonistas(id) ON DELETE CASCADE,
+    mes_referencia DATE NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0 CHECK (total >= 0),
+    dias INTEGER NOT NULL DEFAULT 0, -- bit (dia - 1) ligado = já tem plantão confirmado no dia
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_cotas_plantonista_mes UNIQUE(plantonista_id, mes_referencia)
+);
+
+-- Feed de alterações de plantões e alocações (GET /api/plantoes/changes)
+-- Só inserção; o id é o cursor. Entradas antigas são removidas por arquivar_logs.py
+CREATE TABLE alteracoes (
+    id BIGSERIAL PRIMARY KEY,
+    entidade VARCHAR(20) NOT NULL CHECK (entidade IN ('plantao', 'alocacao')),
+    entidade_id UUID NOT NULL,
+    data DATE NOT NULL, -- data do plantão
+    removido BOOLEAN NOT NULL DEFAULT FALSE,
+    transacao BIGINT, -- txid_current() da transação: cursor do feed
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Tabela de Histórico de Trocas
 CREATE TABLE trocas (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -102,17 +129,35 @@ CREATE TABLE configuracoes (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
--- Tabela de Logs/Auditoria
+-- Tabela de Logs/Auditoria, particionada por mês
+-- Meses antigos são exportados e removidos por backend/arquivar_logs.py
 CREATE TABLE logs (
-    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    id UUID NOT NULL DEFAULT uuid_generate_v4(),
     usuario_id UUID REFERENCES usuarios(id),
     acao VARCHAR(100) NOT NULL,
     tabela VARCHAR(50),
     registro_id UUID,
     detalhes JSONB,
     ip_address VARCHAR(45),
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (created_at, id)
+) PARTITION BY RANGE (created_at);
+
+-- Recebe registros de meses sem partição (arquivar_logs.py cria as próximas)
+CREATE TABLE logs_padrao PARTITION OF logs DEFAULT;
+
+DO $$
+DECLARE
+    mes DATE;
+BEGIN
+    FOR i IN 0..2 LOOP
+        mes := date_trunc('month', CURRENT_DATE)::date + (i || ' months')::interval;
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF logs FOR VALUES FROM (%L) TO (%L)',
+            'logs_' || to_char(mes, 'YYYY_MM'), mes, (mes + interval '1 month')::date
+        );
+    END LOOP;
+END $$;
 
 -- Índices para melhorar performance
 CREATE INDEX idx_usuarios_email ON usuarios(email);
@@ -123,12 +168,17 @@ CREATE INDEX idx_pontuacao_plantonista ON pontuacao(plantonista_id);
 CREATE INDEX idx_pontuacao_mes ON pontuacao(mes_referencia);
 CREATE INDEX idx_plantoes_data ON plantoes(data);
 CREATE INDEX idx_plantoes_status ON plantoes(status);
+CREATE INDEX idx_plantoes_com_vaga ON plantoes(data)
+    WHERE status IN ('disponivel', 'reservado') AND ocupadas < max_plantonistas;
 CREATE INDEX idx_alocacoes_plantao ON alocacoes(plantao_id);
 CREATE INDEX idx_alocacoes_plantonista ON alocacoes(plantonista_id);
+CREATE INDEX idx_alteracoes_data_id ON alteracoes(data, id);
+CREATE INDEX idx_alteracoes_transacao ON alteracoes(transacao, id);
 CREATE INDEX idx_alocacoes_status ON alocacoes(status);
 CREATE INDEX idx_trocas_status ON trocas(status);
-CREATE INDEX idx_logs_usuario ON logs(usuario_id);
-CREATE INDEX idx_logs_created ON logs(created_at);
+CREATE INDEX idx_logs_usuario_created ON logs(usuario_id, created_at, id);
+CREATE INDEX idx_logs_tabela_created ON logs(tabela, created_at, id);
+CREATE INDEX idx_logs_acao ON logs(acao varchar_pattern_ops);
 
 -- Função para atualizar updated_at automaticamente
 CREATE OR REPLACE FUNCTION atualizar_updated_at()
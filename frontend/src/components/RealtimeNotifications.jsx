@@ -30,6 +30,10 @@ const RealtimeNotifications = () => {
     switch (message.type) {
       case 'plantao_updated':
         return `Plantão atualizado: ${message.data.plantao?.data || 'Data não disponível'}`;
+      case 'plantoes_delta':
+        return message.data.plantoes.length === 1
+          ? `Plantão atualizado: ${message.data.plantoes[0].data || 'Data não disponível'}`
+          : `${message.data.plantoes.length} plantões atualizados`;
       case 'alocacao_created':
         return `Novo plantonista alocado!`;
       case 'ranking_updated':
@@ -42,6 +46,7 @@ const RealtimeNotifications = () => {
   const getNotificationIcon = (type) => {
     switch (type) {
       case 'plantao_updated':
+      case 'plantoes_delta':
         return '📅';
       case 'alocacao_created':
         return '👤';
@@ -55,6 +60,7 @@ const RealtimeNotifications = () => {
   const getNotificationColor = (type) => {
     switch (type) {
       case 'plantao_updated':
+      case 'plantoes_delta':
         return 'bg-blue-500';
       case 'alocacao_created':
         return 'bg-green-500';
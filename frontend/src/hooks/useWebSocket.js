@@ -1,12 +1,23 @@
 import { useEffect, useRef, useState } from 'react';
 import { io } from 'socket.io-client';
+import { format } from 'date-fns';
+import { useAuthStore } from '../store/authStore';
 
-const useWebSocket = () => {
+// mes: 'AAAA-MM' inicial; o servidor só envia plantões do mês assinado
+const useWebSocket = (mes = format(new Date(), 'yyyy-MM')) => {
   const socketRef = useRef(null);
   const [isConnected, setIsConnected] = useState(false);
   const [lastMessage, setLastMessage] = useState(null);
+  const token = useAuthStore((state) => state.token);
+  const mesRef = useRef(mes);
+  const sequenciasRef = useRef(new Map());
+  const versoesRef = useRef(new Map());
+  // Cursor do feed de alterações: retoma do ponto em que parou ao reconectar
+  const cursorRef = useRef(null);
 
   useEffect(() => {
+    if (!token) return undefined;
+
     // URL do backend - ajustar conforme o ambiente
     const serverUrl = import.meta.env.DEV 
       ? 'http://localhost:5000' 
@@ -15,7 +26,13 @@ const useWebSocket = () => {
     socketRef.current = io(serverUrl, {
       transports: ['websocket', 'polling'],
       timeout: 20000,
-      forceNew: true
+      forceNew: true,
+      // Conexão autenticada; entra nas salas do usuário e do mês
+      auth: (cb) => cb({
+        token,
+        mes: mesRef.current,
+        ...(cursorRef.current != null && { cursor: cursorRef.current })
+      })
     });
 
     const socket = socketRef.current;
@@ -23,9 +40,12 @@ const useWebSocket = () => {
     socket.on('connect', () => {
       console.log('✅ WebSocket conectado');
       setIsConnected(true);
-      
-      // Entrar na sala de plantonistas
-      socket.emit('join_room', { room: 'plantonistas' });
+      // Eventos perdidos enquanto desconectado não são reenviados
+      sequenciasRef.current.clear();
+    });
+
+    socket.on('connect_error', (error) => {
+      console.warn('⚠️ WebSocket recusado:', error.message);
     });
 
     socket.on('disconnect', () => {
@@ -37,6 +57,48 @@ const useWebSocket = () => {
       console.log('Recebido do servidor:', data);
     });
 
+    // Deltas agrupados de plantões (id, ocupadas, status, versao) com sequência
+    socket.on('plantoes_delta', (data) => {
+      if (data.cursor != null) cursorRef.current = Math.max(cursorRef.current ?? 0, data.cursor);
+      const anterior = sequenciasRef.current.get(data.mes) ?? null;
+      sequenciasRef.current.set(data.mes, Math.max(anterior ?? 0, data.seq));
+
+      // Salto na sequência do mês: eventos perdidos, a tela deve recarregar os plantões
+      if (anterior !== null && data.seq > anterior + 1) {
+        console.warn(`⚠️ WebSocket: eventos ${anterior + 1}-${data.seq - 1} perdidos, ressincronizando`);
+        setLastMessage({ type: 'resync', data, timestamp: new Date() });
+        return;
+      }
+
+      // Aplica apenas versões mais novas que a conhecida de cada plantão
+      const plantoes = data.plantoes.filter((p) => {
+        const conhecida = versoesRef.current.get(p.id);
+        if (p.versao != null && conhecida != null && p.versao <= conhecida) return false;
+        if (p.versao != null) versoesRef.current.set(p.id, p.versao);
+        return true;
+      });
+      if (plantoes.length === 0) return;
+
+      setLastMessage({
+        type: 'plantoes_delta',
+        data: { ...data, plantoes },
+        timestamp: new Date()
+      });
+    });
+
+    // Alterações do mês desde o cursor enviado na reconexão
+    socket.on('plantoes_alteracoes', (data) => {
+      if (data.expirado || data.tem_mais) {
+        cursorRef.current = null;
+        setLastMessage({ type: 'resync', data, timestamp: new Date() });
+        return;
+      }
+      cursorRef.current = Math.max(cursorRef.current ?? 0, data.cursor);
+      if (data.plantoes.length === 0 && data.removidos.plantoes.length === 0) return;
+      data.plantoes.forEach((p) => versoesRef.current.set(p.id, p.versao));
+      setLastMessage({ type: 'plantoes_alteracoes', data, timestamp: new Date() });
+    });
+
     // Eventos de plantões
     socket.on('plantao_updated', (data) => {
       console.log('📅 Plantão atualizado:', data);
@@ -56,6 +118,15 @@ const useWebSocket = () => {
       });
     });
 
+    // Progresso das importações de planilha enviadas por este usuário
+    socket.on('importacao_progresso', (data) => {
+      setLastMessage({
+        type: 'importacao_progresso',
+        data,
+        timestamp: new Date()
+      });
+    });
+
     socket.on('ranking_updated', (data) => {
       console.log('🏆 Ranking atualizado:', data);
       setLastMessage({
@@ -68,7 +139,17 @@ const useWebSocket = () => {
     return () => {
       socket.disconnect();
     };
-  }, []);
+  }, [token]);
+
+  // Troca a sala de mês quando a tela muda de mês
+  useEffect(() => {
+    if (mesRef.current === mes) return;
+    mesRef.current = mes;
+    sequenciasRef.current.delete(mes);
+    if (socketRef.current?.connected) {
+      socketRef.current.emit('assinar_mes', { mes });
+    }
+  }, [mes]);
 
   const sendMessage = (event, data) => {
     if (socketRef.current && isConnected) {
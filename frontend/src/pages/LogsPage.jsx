@@ -8,27 +8,33 @@ export default function LogsPage() {
     const [logs, setLogs] = useState([]);
     const [loading, setLoading] = useState(true);
     const [filters, setFilters] = useState({ acao: '', tabela: '' });
-    const [pagination, setPagination] = useState({ page: 1, total: 0, pages: 1 });
+    // cursores: início de cada página já visitada (null = primeira página)
+    const [cursores, setCursores] = useState([null]);
+    const [proximoCursor, setProximoCursor] = useState(null);
+    const [total, setTotal] = useState(0);
 
     useEffect(() => {
         fetchLogs();
-    }, [pagination.page, filters]);
+    }, [cursores, filters]);
+
+    const alterarFiltros = (novos) => {
+        setFilters(novos);
+        setCursores([null]);
+    };
 
     const fetchLogs = async () => {
         try {
             setLoading(true);
+            const cursor = cursores[cursores.length - 1];
             const params = {
-                page: pagination.page,
                 acao: filters.acao,
-                tabela: filters.tabela
+                tabela: filters.tabela,
+                ...(cursor ? { cursor } : { total: 1 })
             };
             const response = await api.get('/logs', { params });
             setLogs(response.data.dados.logs);
-            setPagination(prev => ({
-                ...prev,
-                total: response.data.dados.total,
-                pages: response.data.dados.pages
-            }));
+            setProximoCursor(response.data.dados.proximo_cursor);
+            if (!cursor) setTotal(response.data.dados.total_aproximado);
         } catch (error) {
             console.error('Erro ao buscar logs', error);
         } finally {
@@ -52,7 +58,7 @@ export default function LogsPage() {
                 </div>
                 <div className="bg-white p-2 rounded-xl border border-gray-100 shadow-sm flex items-center space-x-2">
                     <FiActivity className="text-blue-500 w-5 h-5" />
-                    <span className="text-sm font-bold text-gray-700">{pagination.total} Registros</span>
+                    <span className="text-sm font-bold text-gray-700">~{total} Registros</span>
                 </div>
             </div>
 
@@ -62,16 +68,16 @@ export default function LogsPage() {
                         <FiSearch className="absolute left-3 top-1/2 -translate-y-1/2 text-gray-400" />
                         <input
                             type="text"
-                            placeholder="Buscar por ação (ex: remover)"
+                            placeholder="Ação começando com (ex: remover)"
                             className="pl-10 pr-4 py-2 w-full rounded-lg border border-gray-200 focus:ring-2 focus:ring-blue-500 outline-none"
                             value={filters.acao}
-                            onChange={(e) => setFilters({ ...filters, acao: e.target.value })}
+                            onChange={(e) => alterarFiltros({ ...filters, acao: e.target.value })}
                         />
                     </div>
                     <select
                         className="px-4 py-2 rounded-lg border border-gray-200 focus:ring-2 focus:ring-blue-500 outline-none bg-white"
                         value={filters.tabela}
-                        onChange={(e) => setFilters({ ...filters, tabela: e.target.value })}
+                        onChange={(e) => alterarFiltros({ ...filters, tabela: e.target.value })}
                     >
                         <option value="">Todas as Tabelas</option>
                         <option value="alocacoes">Alocações</option>
@@ -134,18 +140,23 @@ export default function LogsPage() {
                 </div>
 
                 <div className="p-4 bg-gray-50 border-t border-gray-100 flex justify-center space-x-2">
-                    {Array.from({ length: pagination.pages }, (_, i) => i + 1).map((p) => (
-                        <button
-                            key={p}
-                            onClick={() => setPagination({ ...pagination, page: p })}
-                            className={`w-8 h-8 rounded-lg font-bold text-xs transition-all ${pagination.page === p
-                                    ? 'bg-blue-600 text-white shadow-md shadow-blue-200'
-                                    : 'bg-white text-gray-500 hover:bg-gray-100 border border-gray-200'
-                                }`}
-                        >
-                            {p}
-                        </button>
-                    ))}
+                    <button
+                        onClick={() => setCursores(cursores.slice(0, -1))}
+                        disabled={cursores.length === 1}
+                        className="px-3 h-8 rounded-lg font-bold text-xs transition-all bg-white text-gray-500 hover:bg-gray-100 border border-gray-200 disabled:opacity-40"
+                    >
+                        Anterior
+                    </button>
+                    <span className="h-8 px-3 flex items-center rounded-lg font-bold text-xs bg-blue-600 text-white shadow-md shadow-blue-200">
+                        {cursores.length}
+                    </span>
+                    <button
+                        onClick={() => setCursores([...cursores, proximoCursor])}
+                        disabled={!proximoCursor}
+                        className="px-3 h-8 rounded-lg font-bold text-xs transition-all bg-white text-gray-500 hover:bg-gray-100 border border-gray-200 disabled:opacity-40"
+                    >
+                        Próxima
+                    </button>
                 </div>
             </div>
         </div>
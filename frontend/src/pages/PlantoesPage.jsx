@@ -5,6 +5,7 @@ import { format, startOfMonth, endOfMonth, eachDayOfInterval, isSameDay, parseIS
 import { ptBR } from 'date-fns/locale';
 import { FiClock, FiUsers, FiUserPlus } from 'react-icons/fi';
 import { useAuthStore } from '../store/authStore';
+import useWebSocket from '../hooks/useWebSocket';
 
 export default function PlantoesPage() {
   const { user } = useAuthStore();
@@ -17,12 +18,46 @@ export default function PlantoesPage() {
   const [loading, setLoading] = useState(false);
   const [showAssignModal, setShowAssignModal] = useState(false);
   const [assignmentData, setAssignmentData] = useState({ plantaoId: '', plantonistaId: '' });
+  const { lastMessage } = useWebSocket(format(currentMonth, 'yyyy-MM'));
 
   useEffect(() => {
     fetchPlantoes();
     if (isGestor) fetchPlantonistas();
   }, [currentMonth]);
 
+  // Escolhas de outros plantonistas no mês exibido
+  useEffect(() => {
+    // Gestores veem os nomes alocados, que o delta não traz: recarregam o mês
+    const alteracao = ['plantoes_delta', 'plantoes_alteracoes'].includes(lastMessage?.type);
+    if (lastMessage?.type === 'resync' || (alteracao && isGestor)) {
+      fetchPlantoes();
+    } else if (lastMessage?.type === 'plantoes_alteracoes') {
+      // Estado atual dos plantões alterados enquanto o socket esteve desconectado
+      const atualizados = new Map(lastMessage.data.plantoes.map((p) => [p.id, p]));
+      const removidos = new Set(lastMessage.data.removidos.plantoes);
+      setPlantoes((atuais) => atuais
+        .filter((p) => !removidos.has(p.id))
+        .map((p) => (atualizados.has(p.id) ? { ...p, ...atualizados.get(p.id) } : p)));
+    } else if (lastMessage?.type === 'plantoes_delta') {
+      const deltas = new Map(lastMessage.data.plantoes.map((d) => [d.id, d]));
+      setPlantoes((atuais) => atuais
+        .filter((p) => !deltas.get(p.id)?.removido)
+        .map((p) => {
+          const d = deltas.get(p.id);
+          if (!d) return p;
+          return {
+            ...p,
+            status: d.status,
+            max_plantonistas: d.max_plantonistas,
+            vagas_ocupadas: d.ocupadas,
+            alocacoes_count: d.ocupadas,
+            vagas_disponiveis: d.max_plantonistas - d.ocupadas,
+            versao: d.versao
+          };
+        }));
+    }
+  }, [lastMessage]);
+
   const fetchPlantoes = async () => {
     try {
       setLoading(true);
@@ -1,7 +1,8 @@
 import { useEffect, useState } from 'react';
 import { toast } from 'react-toastify';
 import api from '../services/api';
-import { FiPlus, FiRefreshCw, FiEdit3, FiAward } from 'react-icons/fi';
+import useWebSocket from '../hooks/useWebSocket';
+import { FiPlus, FiRefreshCw, FiEdit3, FiAward, FiUpload } from 'react-icons/fi';
 
 export default function PontuacaoPage() {
   const [pontuacoes, setPontuacoes] = useState([]);
@@ -11,6 +12,8 @@ export default function PontuacaoPage() {
   );
   const [loading, setLoading] = useState(false);
   const [showModal, setShowModal] = useState(false);
+  const [importacao, setImportacao] = useState(null);
+  const { lastMessage } = useWebSocket();
   const [formData, setFormData] = useState({
     plantonista_id: '',
     vendas: 0,
@@ -25,6 +28,12 @@ export default function PontuacaoPage() {
     fetchDados();
   }, [mesReferencia]);
 
+  // Progresso enviado pelo servidor a cada lote gravado
+  useEffect(() => {
+    if (lastMessage?.type !== 'importacao_progresso') return;
+    setImportacao((atual) => (atual?.importacao_id === lastMessage.data.importacao_id ? lastMessage.data : atual));
+  }, [lastMessage]);
+
   const fetchDados = async () => {
     try {
       setLoading(true);
@@ -78,6 +87,35 @@ export default function PontuacaoPage() {
     }
   };
 
+  // Planilha enviada como arquivo: o servidor lê e grava em lotes
+  const importarPlanilha = async (e) => {
+    const arquivo = e.target.files[0];
+    e.target.value = '';
+    if (!arquivo) return;
+
+    const importacaoId = crypto.randomUUID();
+    const form = new FormData();
+    form.append('arquivo', arquivo);
+    form.append('mes_referencia', mesReferencia);
+    form.append('importacao_id', importacaoId);
+
+    try {
+      setImportacao({ importacao_id: importacaoId, processadas: 0 });
+      const res = await api.post('/pontuacao/importar/arquivo', form);
+      const { importadas, total_erros: erros } = res.data.dados;
+      if (erros) {
+        toast.warning(`${importadas} pontuações importadas, ${erros} linhas com erro`);
+      } else {
+        toast.success(`${importadas} pontuações importadas`);
+      }
+      fetchDados();
+    } catch (error) {
+      toast.error(error.response?.data?.mensagem || 'Erro ao importar planilha');
+    } finally {
+      setImportacao(null);
+    }
+  };
+
   const openEditModal = (p) => {
     setFormData({
       plantonista_id: p.plantonista_id,
@@ -122,6 +160,19 @@ export default function PontuacaoPage() {
             <FiAward />
             <span>Atualizar Ranking</span>
           </button>
+          <label className="flex items-center space-x-2 bg-gray-700 text-white px-4 py-2 rounded-lg hover:bg-gray-800 transition-colors cursor-pointer">
+            <FiUpload />
+            <span>
+              {importacao ? `Importando... ${importacao.processadas} linhas` : 'Importar Planilha'}
+            </span>
+            <input
+              type="file"
+              accept=".csv,.xlsx"
+              onChange={importarPlanilha}
+              disabled={!!importacao}
+              className="hidden"
+            />
+          </label>
         </div>
       </div>
 
@@ -88,7 +88,9 @@ export default function RankingPage() {
                 <th className="px-8 py-5 text-left text-xs font-black text-gray-400 uppercase tracking-widest">Posição</th>
                 <th className="px-8 py-5 text-left text-xs font-black text-gray-400 uppercase tracking-widest">Plantonista</th>
                 <th className="px-8 py-5 text-left text-xs font-black text-gray-400 uppercase tracking-widest">Pontuação</th>
-                <th className="px-8 py-5 text-left text-xs font-black text-gray-400 uppercase tracking-widest">Contato</th>
+                {isGestor && (
+                  <th className="px-8 py-5 text-left text-xs font-black text-gray-400 uppercase tracking-widest">Contato</th>
+                )}
               </tr>
             </thead>
             <tbody className="bg-white divide-y divide-gray-50">
@@ -129,9 +131,11 @@ export default function RankingPage() {
                       <span className="text-[10px] font-black text-gray-400 uppercase">pts</span>
                     </div>
                   </td>
-                  <td className="px-8 py-6 whitespace-nowrap text-sm text-gray-500 font-medium">
-                    {p.email}
-                  </td>
+                  {isGestor && (
+                    <td className="px-8 py-6 whitespace-nowrap text-sm text-gray-500 font-medium">
+                      {p.email}
+                    </td>
+                  )}
                 </tr>
               ))}
             </tbody>